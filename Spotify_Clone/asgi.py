@@ -8,9 +8,18 @@ https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
 
 import os
+import time
+
+started = time.perf_counter()
 
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Spotify_Clone.settings')
+# Serve the hot endpoints from music.async_views instead of the DRF viewsets.
+os.environ.setdefault('ASYNC_VIEWS', 'true')
 
 application = get_asgi_application()
+
+from Spotify_Clone.metrics import registry  # noqa: E402 (needs settings)
+
+registry.observe_startup(time.perf_counter() - started)
@@ -0,0 +1,343 @@
+"""
+Per-route request metrics in the Prometheus text format.
+
+MetricsMiddleware counts requests by route, method and status, and records
+their latency and database query count in fixed-bucket histograms. Cache
+get() calls made while handling a request are counted as hits or misses
+under its route. Routes are URL names such as 'song-play' or
+'artist-profile' (see profiling.route_name), so the URLconf bounds the
+number of label values. Query counts and DB time come from
+ProfilingMiddleware, which must run outside this middleware.
+
+Each process keeps its metrics in memory behind one lock and, with
+METRICS_DIR set, writes them to METRICS_DIR/<pid>-<start time>.json at most
+every METRICS_FLUSH_SECONDS and at exit. /metrics sums every file there, so
+a scrape of any worker covers all of them. A scrape folds the files of
+exited workers into exited.json, so counters never go backwards and the
+directory holds one file per live worker plus that one. The directory must
+be local to the host, since liveness is checked by pid.
+"""
+import atexit
+import bisect
+import fcntl
+import hmac
+import json
+import os
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import CacheHandler, caches
+from django.http import Http404, HttpResponse
+
+from Spotify_Clone.profiling import current_timings, route_name
+
+# name: (type, help, histogram buckets)
+METRICS = {
+    'http_requests_total': (
+        'counter', "Requests by route, method and status code.", None),
+    'http_request_duration_seconds': (
+        'histogram', "Time to respond, by route.",
+        (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)),
+    'http_request_db_queries': (
+        'histogram', "Database queries per request, by route.",
+        (0, 1, 2, 5, 10, 20, 50, 100)),
+    'http_request_db_seconds_total': (
+        'counter', "Time spent executing database queries, by route.", None),
+    'cache_lookups_total': (
+        'counter', "Cache get() calls made by requests, by route, cache alias and result.", None),
+    'app_startup_seconds': (
+        'histogram', "Time for a worker to load the WSGI or ASGI application.",
+        (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0)),
+}
+METHODS = {'GET', 'HEAD', 'OPTIONS', 'POST', 'PUT', 'PATCH', 'DELETE'}
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Registry:
+    """
+    One process's metrics, keyed by (name, labels). Counters hold a number;
+    histograms hold a count per bucket (the last one +Inf) followed by the sum.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Serializes writes so that an older snapshot never replaces a newer one.
+        self.flush_lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.started = int(time.time())
+        self.values = {}
+        self.flushed_at = time.monotonic()
+
+    def inc(self, name, labels, amount=1):
+        key = (name, labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        values = self.values.get((name, labels))
+        if values is None:
+            values = self.values[name, labels] = [0] * (len(buckets) + 2)
+        values[bisect.bisect_left(buckets, value)] += 1
+        values[-1] += value
+
+    def observe_request(self, route, method, status, seconds, timings, lookups):
+        by_route = (('route', route),)
+        with self.lock:
+            if self.pid != os.getpid():
+                # A forked worker starts from zero; what it inherited was counted by its parent.
+                self.reset()
+            self.inc('http_requests_total', by_route + (('method', method), ('status', str(status))))
+            self.observe('http_request_duration_seconds', by_route, seconds)
+            if timings is not None:
+                self.observe('http_request_db_queries', by_route, timings.queries)
+                self.inc('http_request_db_seconds_total', by_route, timings.db)
+            for (alias, result), count in lookups.items():
+                self.inc('cache_lookups_total', by_route + (('cache', alias), ('result', result)), count)
+            now = time.monotonic()
+            due = settings.METRICS_DIR and now - self.flushed_at >= settings.METRICS_FLUSH_SECONDS
+            if due:
+                self.flushed_at = now
+        if due:
+            self.flush()
+
+    def observe_startup(self, seconds):
+        with self.lock:
+            self.observe('app_startup_seconds', (), seconds)
+
+    def snapshot(self):
+        """{name: [[labels, value], ...]}, JSON-serializable"""
+        with self.lock:
+            snapshot = {}
+            for (name, labels), value in self.values.items():
+                snapshot.setdefault(name, []).append([labels, list(value) if isinstance(value, list) else value])
+            return snapshot
+
+    def path(self):
+        return Path(settings.METRICS_DIR) / f"{self.pid}-{self.started}.json"
+
+    def flush(self):
+        if not settings.METRICS_DIR or self.pid != os.getpid() or not self.values:
+            return
+        with self.flush_lock:
+            path = self.path()
+            path.parent.mkdir(parents=True, exist_ok=True)
+            write_snapshot(path, self.snapshot())
+
+
+registry = Registry()
+atexit.register(registry.flush)
+
+
+EXITED = 'exited.json'
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def read_snapshot(path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        # Removed or being cleaned up between the glob and the read.
+        return None
+
+
+def write_snapshot(path, snapshot):
+    temporary = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    temporary.write_text(json.dumps(snapshot))
+    os.replace(temporary, path)
+
+
+def fold_exited(directory):
+    """Adds the files of workers that are no longer running to EXITED and removes them."""
+    exited = []
+    for path in directory.glob('*-*.json'):
+        pid = path.stem.split('-')[0]
+        if pid.isdigit() and int(pid) != os.getpid() and not pid_alive(int(pid)):
+            exited.append(path)
+    if exited:
+        parts = [read_snapshot(path) for path in [directory / EXITED] + exited]
+        write_snapshot(directory / EXITED, as_snapshot(merge(part for part in parts if part)))
+        for path in exited:
+            path.unlink(missing_ok=True)
+
+
+def snapshots():
+    if not settings.METRICS_DIR:
+        return [registry.snapshot()]
+    registry.flush()
+    directory = Path(settings.METRICS_DIR)
+    if not directory.is_dir():
+        return []
+    # Scrapes take turns, so none reads a file that another is folding.
+    with open(directory / f"{EXITED}.lock", 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        fold_exited(directory)
+        return [snapshot for snapshot in map(read_snapshot, directory.glob('*.json')) if snapshot is not None]
+
+
+def merge(snapshots):
+    """Snapshots summed: {name: {labels: value}}"""
+    totals = {name: {} for name in METRICS}
+    for snapshot in snapshots:
+        for name, series in snapshot.items():
+            if name not in METRICS:
+                continue
+            buckets = METRICS[name][2]
+            for labels, value in series:
+                labels = tuple(tuple(pair) for pair in labels)
+                if buckets is None:
+                    totals[name][labels] = totals[name].get(labels, 0) + value
+                elif len(value) == len(buckets) + 2:
+                    # Histograms written with other buckets, by an older deploy, are skipped.
+                    total = totals[name].setdefault(labels, [0] * len(value))
+                    for i, count in enumerate(value):
+                        total[i] += count
+    return totals
+
+
+def as_snapshot(totals):
+    return {name: [[labels, value] for labels, value in series.items()]
+            for name, series in totals.items() if series}
+
+
+def collect():
+    """Every process's metrics summed: {name: {labels: value}}"""
+    return merge(snapshots())
+
+
+def format_labels(labels):
+    def escape(value):
+        return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in labels) + '}'
+
+
+def exposition(totals):
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in sorted(totals[name].items()):
+            if buckets is None:
+                lines.append(f"{name}{format_labels(labels)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + ('+Inf',), value):
+                cumulative += count
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {value[-1]}")
+            lines.append(f"{name}_count{format_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def can_view_internals(request):
+    """
+    Staff users, or a client sending 'Authorization: Bearer <METRICS_TOKEN>'.
+    The peer address proves nothing behind a reverse proxy on the same host.
+    """
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if settings.METRICS_TOKEN and scheme.lower() == 'bearer':
+        return hmac.compare_digest(token.strip().encode(), settings.METRICS_TOKEN.encode())
+    user = getattr(request, 'user', None)
+    return bool(user and user.is_active and user.is_staff)
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint, see can_view_internals"""
+    if not can_view_internals(request):
+        raise Http404
+    return HttpResponse(exposition(collect()), content_type=CONTENT_TYPE)
+
+
+_lookups = ContextVar('cache_lookups', default=None)
+_MISSING = object()
+
+
+def counted_get(alias, get):
+    """The cache's get(), counting hits and misses for the request being handled"""
+    def wrapper(key, default=None, version=None):
+        lookups = _lookups.get()
+        if lookups is None:
+            return get(key, default, version=version)
+        value = get(key, _MISSING, version=version)
+        if value is _MISSING:
+            lookups[alias, 'miss'] += 1
+            return default
+        lookups[alias, 'hit'] += 1
+        return value
+    wrapper.counted = True
+    return wrapper
+
+
+def instrument_cache(alias, cache):
+    if not getattr(cache.get, 'counted', False):
+        cache.get = counted_get(alias, cache.get)
+    return cache
+
+
+def create_connection(handler, alias):
+    return instrument_cache(alias, create_connection.original(handler, alias))
+
+
+if not hasattr(CacheHandler.create_connection, 'original'):
+    create_connection.original = CacheHandler.create_connection
+    CacheHandler.create_connection = create_connection
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        # Caches created in this thread before this module was imported.
+        for alias in settings.CACHES:
+            instrument_cache(alias, caches[alias])
+
+    def finish(self, request, response, start, lookups):
+        method = request.method if request.method in METHODS else 'other'
+        registry.observe_request(route_name(request), method, response.status_code,
+                                 time.perf_counter() - start, current_timings(), lookups)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        lookups = Counter()
+        token = _lookups.set(lookups)
+        try:
+            response = self.get_response(request)
+        finally:
+            _lookups.reset(token)
+        self.finish(request, response, start, lookups)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        lookups = Counter()
+        token = _lookups.set(lookups)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _lookups.reset(token)
+        self.finish(request, response, start, lookups)
+        return response
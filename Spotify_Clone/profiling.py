@@ -0,0 +1,220 @@
+"""
+Per-request timings and sampled cProfile dumps.
+
+With SERVER_TIMING on, ProfilingMiddleware adds a Server-Timing header to
+every response with the time spent in the database (and the query count),
+in DRF serializers, in rendering, and in total. These come from a database
+execute wrapper, which always runs since Spotify_Clone.metrics reads its
+totals, and from timed versions of BaseSerializer.data and
+Response.rendered_content, which are only installed while SERVER_TIMING is
+on. DB time is time spent executing statements; rows fetched while a
+serializer iterates a queryset count towards serialize, so the spans can
+overlap.
+
+cProfile only runs for PROFILE_SAMPLE_RATE of requests, and, when
+PROFILE_SLOW_MS is set, for the next request to a route that was just
+slower than that (kept only if it is slow again). Dumps are written to
+PROFILE_DIR as <time>-<pid>-<route>-<ms>ms.prof; open them with pstats or
+snakeviz. Async views get the header but are never profiled: cProfile
+would trace every coroutine sharing the event loop thread.
+"""
+import cProfile
+import os
+import random
+import re
+import threading
+import time
+from contextvars import ContextVar
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.urls import Resolver404, resolve
+from rest_framework.response import Response
+from rest_framework.serializers import BaseSerializer
+
+
+class RequestTimings:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.db = 0.0
+        self.queries = 0
+        self.serialize = 0.0
+        self.render = 0.0
+        self.inside = set()
+
+    def server_timing(self, total):
+        return ", ".join([
+            f'db;dur={self.db * 1000:.1f};desc="{self.queries} queries"',
+            f'serialize;dur={self.serialize * 1000:.1f}',
+            f'render;dur={self.render * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ])
+
+
+_timings = ContextVar('request_timings', default=None)
+
+
+def time_queries(execute, sql, params, many, context):
+    timings = _timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.db += time.perf_counter() - start
+        timings.queries += 1
+
+
+def install_query_timer(sender, connection, **kwargs):
+    if time_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_queries)
+
+
+connection_created.connect(install_query_timer)
+
+
+def timed_property(prop, bucket):
+    """The property, adding its run time to the request's `bucket`; nested calls count once"""
+    def getter(obj):
+        timings = _timings.get()
+        if timings is None or bucket in timings.inside:
+            return prop.fget(obj)
+        timings.inside.add(bucket)
+        start = time.perf_counter()
+        try:
+            return prop.fget(obj)
+        finally:
+            timings.inside.discard(bucket)
+            setattr(timings, bucket, getattr(timings, bucket) + time.perf_counter() - start)
+    getter.timed = True
+    return property(getter)
+
+
+def install_timed_properties():
+    if not getattr(BaseSerializer.data.fget, 'timed', False):
+        BaseSerializer.data = timed_property(BaseSerializer.data, 'serialize')
+        Response.rendered_content = timed_property(Response.rendered_content, 'render')
+
+
+def current_timings():
+    """The RequestTimings of the request being handled, or None"""
+    return _timings.get()
+
+
+def route_name(request):
+    """URL name of the request's view, e.g. 'song-play', or 'unresolved'"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return 'unresolved'
+    return match.view_name or match._func_path
+
+
+class Sampler:
+    """Decides which requests run under cProfile and writes their dumps"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Routes whose next request is profiled because one was slow.
+        self.armed = set()
+
+    def route(self, request):
+        return route_name(request)
+
+    def reason(self, request):
+        """'sampled', 'armed' or None when the request should not be profiled"""
+        if settings.PROFILE_SAMPLE_RATE and random.random() < settings.PROFILE_SAMPLE_RATE:
+            return 'sampled'
+        if self.armed:
+            route = self.route(request)
+            with self.lock:
+                if route in self.armed:
+                    self.armed.discard(route)
+                    return 'armed'
+        return None
+
+    def is_slow(self, total):
+        return settings.PROFILE_SLOW_MS and total * 1000 >= settings.PROFILE_SLOW_MS
+
+    def arm(self, request):
+        with self.lock:
+            self.armed.add(self.route(request))
+
+    def dump(self, profiler, request, total):
+        directory = Path(settings.PROFILE_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        route = re.sub(r'[^\w.-]+', '_', self.route(request))
+        stamp = time.strftime('%Y%m%dT%H%M%S')
+        profiler.dump_stats(directory / f"{stamp}-{os.getpid()}-{route}-{total * 1000:.0f}ms.prof")
+        self.prune(directory)
+
+    def prune(self, directory):
+        dumps = sorted(directory.glob('*.prof'), key=os.path.getmtime)
+        for old in dumps[:-settings.PROFILE_MAX_DUMPS]:
+            old.unlink(missing_ok=True)
+
+
+sampler = Sampler()
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        # Connections opened before this module was imported missed the signal.
+        for connection in connections.all(initialized_only=True):
+            install_query_timer(None, connection)
+        if settings.SERVER_TIMING:
+            install_timed_properties()
+
+    def finish(self, response, timings):
+        total = time.perf_counter() - timings.start
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = timings.server_timing(total)
+        return total
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = RequestTimings()
+        token = _timings.set(timings)
+        reason = sampler.reason(request)
+        profiler = cProfile.Profile() if reason else None
+        try:
+            if profiler:
+                profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler:
+                    profiler.disable()
+        finally:
+            _timings.reset(token)
+
+        total = self.finish(response, timings)
+        slow = sampler.is_slow(total)
+        if profiler and (reason == 'sampled' or slow):
+            sampler.dump(profiler, request, total)
+        elif slow and not profiler:
+            sampler.arm(request)
+        return response
+
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        token = _timings.set(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _timings.reset(token)
+        self.finish(response, timings)
+        return response
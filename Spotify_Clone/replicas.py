@@ -0,0 +1,185 @@
+"""
+Read replicas for safe-method requests.
+
+ReplicaMiddleware marks GET/HEAD/OPTIONS requests as allowed to read from
+settings.REPLICA_DATABASES and ReplicaRouter sends their reads to one of
+them. Everything else (writes, unsafe requests, management commands, the
+rest of a request once it has written) uses the primary.
+
+Read-your-writes: a client whose request wrote is pinned to the primary for
+REPLICA_STICKY_SECONDS, keyed by its token, session or address in the
+REPLICA_PIN_CACHE cache. Lag: each replica's lag is checked at most every
+REPLICA_LAG_CHECK_SECONDS, and replicas further behind than
+REPLICA_MAX_LAG_SECONDS (or unreachable) are skipped; with none left, reads
+go to the primary.
+"""
+import hashlib
+import os
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class RequestState:
+    """Mutable so that writes made in sync_to_async threads are seen by the middleware."""
+
+    def __init__(self, use_replica):
+        self.use_replica = use_replica
+        self.replica = None
+        self.wrote = False
+
+
+_state = ContextVar('replica_state', default=None)
+
+
+def client_key(request):
+    """Who a read-your-writes pin applies to: the API token, the session, or the address"""
+    authorization = request.headers.get('Authorization')
+    if authorization:
+        return 'auth:' + hashlib.sha256(authorization.encode()).hexdigest()
+    session = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if session:
+        return 'session:' + hashlib.sha256(session.encode()).hexdigest()
+    return 'addr:' + request.META.get('REMOTE_ADDR', '')
+
+
+def pin_key(client):
+    return f'replica-pin:{client}'
+
+
+class ReplicaMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def start(self, request):
+        client = client_key(request)
+        use_replica = (
+            bool(settings.REPLICA_DATABASES)
+            and request.method in SAFE_METHODS
+            and not caches[settings.REPLICA_PIN_CACHE].get(pin_key(client))
+        )
+        state = RequestState(use_replica)
+        return client, state, _state.set(state)
+
+    def finish(self, client, state, token):
+        _state.reset(token)
+        if state.wrote and settings.REPLICA_DATABASES:
+            caches[settings.REPLICA_PIN_CACHE].set(pin_key(client), True, settings.REPLICA_STICKY_SECONDS)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        client, state, token = self.start(request)
+        try:
+            return self.get_response(request)
+        finally:
+            self.finish(client, state, token)
+
+    async def __acall__(self, request):
+        client, state, token = self.start(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            self.finish(client, state, token)
+
+
+def postgresql_lag(alias):
+    with connections[alias].cursor() as cursor:
+        cursor.execute(
+            "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+            "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+        )
+        lag = cursor.fetchone()[0]
+    return float(lag or 0)
+
+
+def sqlite_lag(alias):
+    """Local stand-in: a replica file is as far behind as the primary's writes since it was copied"""
+    replica = settings.DATABASES[alias]['NAME']
+    if not os.path.exists(replica):
+        return float('inf')
+    primary = settings.DATABASES[DEFAULT_DB_ALIAS]['NAME']
+    return max(0.0, os.path.getmtime(primary) - os.path.getmtime(replica))
+
+
+LAG_CHECKS = {
+    'postgresql': postgresql_lag,
+    'sqlite': sqlite_lag,
+}
+
+
+class ReplicaLag:
+    """Per-process cache of each replica's last measured lag in seconds"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.measured = {}
+
+    def __call__(self, alias):
+        now = time.monotonic()
+        with self.lock:
+            checked_at, lag = self.measured.get(alias, (None, None))
+            if checked_at is not None and now - checked_at < settings.REPLICA_LAG_CHECK_SECONDS:
+                return lag
+            # Claim this check so concurrent requests keep the old value meanwhile.
+            self.measured[alias] = (now, lag if lag is not None else float('inf'))
+        check = LAG_CHECKS.get(connections[alias].vendor)
+        try:
+            lag = check(alias) if check else 0.0
+        except DatabaseError:
+            lag = float('inf')
+        with self.lock:
+            self.measured[alias] = (time.monotonic(), lag)
+        return lag
+
+
+replica_lag = ReplicaLag()
+
+
+def fresh_replicas():
+    return [alias for alias in settings.REPLICA_DATABASES
+            if replica_lag(alias) <= settings.REPLICA_MAX_LAG_SECONDS]
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.use_replica:
+            return None
+        if state.replica is None:
+            # One replica per request, so its reads are consistent with each other.
+            replicas = fresh_replicas()
+            if not replicas:
+                state.use_replica = False
+                return None
+            state.replica = random.choice(replicas)
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            # Later reads in this request must see the write.
+            state.wrote = True
+            state.use_replica = False
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Replicas get the schema from the primary.
+        return db == DEFAULT_DB_ALIAS
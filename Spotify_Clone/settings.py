@@ -11,12 +11,18 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 from pathlib import Path
-from dotenv import load_dotenv
-load_dotenv()
 import os
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Same lookup as load_dotenv(), which walks up from here, but python-dotenv is
+# only imported when there is a .env file to read.
+for directory in Path(__file__).resolve().parents:
+    if (directory / '.env').is_file():
+        from dotenv import load_dotenv
+        load_dotenv(directory / '.env')
+        break
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
@@ -48,13 +54,17 @@ LOCAL_APPS = [
 THIRD_PARTY_APPS = [
     'rest_framework',
     'rest_framework.authtoken',
-    'debug_toolbar',
     'corsheaders',
     'djstripe',
 ]
 INSTALLED_APPS += LOCAL_APPS + THIRD_PARTY_APPS
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'Spotify_Clone.profiling.ProfilingMiddleware',
+    # Inside ProfilingMiddleware, whose query counts it reports.
+    'Spotify_Clone.metrics.MetricsMiddleware',
+    'Spotify_Clone.slow_queries.SlowQueryMiddleware',
+    'Spotify_Clone.replicas.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
      'django.middleware.common.CommonMiddleware',
@@ -62,8 +72,11 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-'debug_toolbar.middleware.DebugToolbarMiddleware'
 ]
+if DEBUG:
+    # Development only; production workers never import the toolbar.
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.append('debug_toolbar.middleware.DebugToolbarMiddleware')
 rest_framework={
     'DEFAULT_AUTHENTICATION_CLASSES':(
         'rest_framework.authentication.TokenAuthentication',
@@ -72,6 +85,10 @@ rest_framework={
 
 ROOT_URLCONF = 'Spotify_Clone.urls'
 
+# Route play/like/favorite/follow/recently_played to music.async_views.
+# asgi.py turns this on; WSGI deployments keep the DRF actions.
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', 'false').lower() == 'true'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -120,6 +137,28 @@ else:
             'NAME': BASE_DIR / 'db.sqlite3',
         }
     }
+
+# Read replicas (Spotify_Clone.replicas)
+# GET/HEAD/OPTIONS requests read from these aliases. DB_REPLICA_HOSTS=a,b adds
+# Postgres replicas with the primary's credentials. Without Postgres,
+# SQLITE_REPLICAS=N adds db.replica<n>.sqlite3 copies of the primary for local
+# testing; refresh them with `manage.py sync_replicas`.
+if POSTGRES_READY:
+    for n, host in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), 1):
+        DATABASES[f'replica{n}'] = {**DATABASES['default'], 'HOST': host.strip(),
+                                    'TEST': {'MIRROR': 'default'}}
+else:
+    for n in range(1, int(os.getenv('SQLITE_REPLICAS', 0)) + 1):
+        DATABASES[f'replica{n}'] = {**DATABASES['default'], 'NAME': BASE_DIR / f'db.replica{n}.sqlite3',
+                                    'TEST': {'MIRROR': 'default'}}
+REPLICA_DATABASES = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['Spotify_Clone.replicas.ReplicaRouter']
+# A client that wrote reads from the primary for this long afterwards.
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 5))
+# Replicas further behind than this are skipped until they catch up.
+REPLICA_MAX_LAG_SECONDS = float(os.getenv('REPLICA_MAX_LAG_SECONDS', 2))
+REPLICA_LAG_CHECK_SECONDS = 1
+REPLICA_PIN_CACHE = 'replica_pins'
 AWS_ACCESS_KEY_ID = os.getenv('AWS_ACCESS_KEY')
 AWS_SECRET_ACCESS_KEY = os.getenv('AWS_SECRET_KEY')
 AWS_STORAGE_BUCKET_NAME = os.getenv('AWS_STORAGE_BUCKET_NAME')
@@ -149,9 +188,8 @@ else:
     STRIPE_PUBLIC_KEY = STRIPE_TEST_PUBLIC_KEY
     STRIPE_SECRET_KEY = STRIPE_TEST_SECRET_KEY
 
-# Initialize Stripe
-import stripe
-stripe.api_key = STRIPE_SECRET_KEY
+# The stripe SDK is configured with STRIPE_SECRET_KEY when payments.views
+# first imports it (payments.views.stripe_sdk).
 
 # Subscription settings
 FREE_TRIAL_DAYS = 30  # 30-day free trial for new premium users
@@ -223,6 +261,127 @@ INTERNAL_IPS = ['127.0.0.1']
 
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10485760
 
+# Request profiling (Spotify_Clone.profiling)
+# With SERVER_TIMING (on by default only with DEBUG), responses carry a
+# Server-Timing header with db, serialize, render and total time; it also wraps
+# DRF's serializer and rendering properties. PROFILE_SAMPLE_RATE of requests run under cProfile; with PROFILE_SLOW_MS
+# set, a route slower than that has its next request profiled as well. The
+# newest PROFILE_MAX_DUMPS .prof files are kept in PROFILE_DIR.
+SERVER_TIMING = os.getenv('SERVER_TIMING', str(DEBUG)).lower() == 'true'
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+PROFILE_SLOW_MS = float(os.getenv('PROFILE_SLOW_MS', 0))
+PROFILE_DIR = os.getenv('PROFILE_DIR', BASE_DIR / 'profiles')
+PROFILE_MAX_DUMPS = 200
+
+# Metrics (Spotify_Clone.metrics)
+# Per-route request counts, latency and query-count histograms and cache hits,
+# in the Prometheus text format at /metrics, for staff users and for scrapers
+# sending 'Authorization: Bearer <METRICS_TOKEN>'. With METRICS_DIR empty, the
+# default, each process reports only itself. Point it at a host-local runtime
+# directory outside the source tree (e.g. /run/spotify-clone/metrics) and
+# workers write theirs there, so that a scrape of any of them covers all.
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+METRICS_FLUSH_SECONDS = 1
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Slow-query log (Spotify_Clone.slow_queries)
+# Queries slower than SLOW_QUERY_MS, and statements run more than
+# SLOW_QUERY_REPEAT times in one request, are logged with their call site in
+# SLOW_QUERY_VIEW_MODULES. 0 turns a check off. Records go to stderr unless
+# SLOW_QUERY_LOG names a file, which every worker appends to; rotate it with
+# logrotate. /slow-queries summarizes that file by fingerprint for the same
+# clients as /metrics.
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 100))
+SLOW_QUERY_REPEAT = int(os.getenv('SLOW_QUERY_REPEAT', 10))
+SLOW_QUERY_LOG = os.getenv('SLOW_QUERY_LOG', '')
+SLOW_QUERY_VIEW_MODULES = [
+    'music/viewsets.py',
+    'music/views.py',
+    'music/async_views.py',
+    'users/views.py',
+    'payments/views.py',
+]
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        # WatchedFileHandler reopens the file after an external rotation;
+        # RotatingFileHandler would have each process rotate it on its own.
+        'slow_queries': {
+            'class': 'logging.handlers.WatchedFileHandler',
+            'filename': SLOW_QUERY_LOG,
+            'delay': True,
+            'formatter': 'message',
+        } if SLOW_QUERY_LOG else {
+            'class': 'logging.StreamHandler',
+            'formatter': 'message',
+        },
+    },
+    'loggers': {
+        'Spotify_Clone.slow_queries': {
+            'handlers': ['slow_queries'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+# Caches
+# The 'throttle' alias holds API rate-limit counters. Point it at memcached or
+# redis to share counters between worker processes and hosts.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'throttle': {
+        'BACKEND': os.getenv('THROTTLE_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('THROTTLE_CACHE_LOCATION', 'api-throttle'),
+    },
+    # Read-your-writes pins; share it between workers like 'throttle'.
+    'replica_pins': {
+        'BACKEND': os.getenv('REPLICA_PIN_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('REPLICA_PIN_CACHE_LOCATION', 'replica-pins'),
+    },
+}
+
+# API throttling (music.throttling.RouteThrottle)
+# Keys are '<router basename>-<action>'. Rates are per plan type, with 'anon'
+# for unauthenticated clients and 'default' as the fallback. Limits hold across
+# workers only when THROTTLE_CACHE_BACKEND is a shared cache such as Redis or
+# Memcached; the locmem default counts per process.
+API_THROTTLE_CACHE = 'throttle'
+API_THROTTLES = {
+    'song-search': {
+        'strategy': 'sliding_window',
+        'rates': {'anon': '10/min', 'free': '30/min', 'default': '120/min'},
+    },
+    'song-random': {
+        'strategy': 'fixed_window',
+        'rates': {'anon': '30/min', 'free': '60/min', 'default': '300/min'},
+    },
+    'song-radio': {
+        'strategy': 'fixed_window',
+        'rates': {'anon': '30/min', 'free': '60/min', 'default': '120/min'},
+    },
+    'song-play': {
+        'strategy': 'fixed_window',
+        'rates': {'anon': '60/min', 'free': '120/min', 'default': '600/min'},
+    },
+    # Each accepted request opens a stream that stays open.
+    'live-listeners': {
+        'strategy': 'fixed_window',
+        'rates': {'free': '6/min', 'default': '30/min'},
+    },
+    'library-batch': {
+        'strategy': 'fixed_window',
+        'rates': {'free': '10/min', 'default': '60/min'},
+    },
+}
+
 # Stripe Configuration
 STRIPE_LIVE_PUBLIC_KEY = os.environ.get("STRIPE_PUBLIC_KEY", "")
 STRIPE_LIVE_SECRET_KEY = os.environ.get("STRIPE_SECRET_KEY", "")
@@ -0,0 +1,288 @@
+"""
+Slow and repeated queries, logged with the code that ran them.
+
+A database execute wrapper logs every query slower than SLOW_QUERY_MS and,
+once a request is done, every statement it ran more than SLOW_QUERY_REPEAT
+times (the usual N+1). Each record carries a fingerprint of the normalized
+SQL, the route, and the call site: the innermost frame in one of
+SLOW_QUERY_VIEW_MODULES (e.g. music/viewsets.py:212 in SongViewSet.trending)
+and, when that differs, the innermost project frame that made the query.
+
+Only queries run while a request is being handled are logged; migrations,
+management commands and startup checks are not. Records are JSON lines
+written by the 'Spotify_Clone.slow_queries' logger, which settings.LOGGING
+sends to SLOW_QUERY_LOG, or to stderr when that is unset. /slow-queries
+aggregates the newest records of the file and its rotated copies by
+fingerprint, reading them from the end.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import time
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404, JsonResponse
+
+from Spotify_Clone.metrics import can_view_internals
+from Spotify_Clone.profiling import route_name
+from music.utils import parse_int_param
+
+logger = logging.getLogger(__name__)
+
+# Rotated copies compressed by logrotate and the like are not read.
+COMPRESSED_SUFFIXES = ('.gz', '.bz2', '.xz', '.zst')
+READ_BLOCK_SIZE = 64 * 1024
+
+# Frames in these are never a call site; the ORM and the project's own plumbing.
+SKIPPED_DIRS = ('site-packages', 'dist-packages', str(Path(__file__).parent))
+
+NORMALIZE = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'%s'), '?'),
+    # Lists whose length varies with the data: IN (?, ?, ?) and multi-row VALUES.
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(...)'),
+    (re.compile(r'\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+'), '(...)'),
+    (re.compile(r'\s+'), ' '),
+]
+
+
+def normalize(sql):
+    for pattern, replacement in NORMALIZE:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+def fingerprint(normalized):
+    return hashlib.sha1(normalized.encode()).hexdigest()[:16]
+
+
+def call_site():
+    """(view frame, innermost project frame) as 'path:line in qualname', either may be None"""
+    base = str(settings.BASE_DIR)
+    view = origin = None
+    frame = sys._getframe(1)
+    while frame is not None and view is None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(base) and not any(part in filename for part in SKIPPED_DIRS):
+            path = Path(filename).relative_to(base).as_posix()
+            name = getattr(frame.f_code, 'co_qualname', frame.f_code.co_name)
+            site = f"{path}:{frame.f_lineno} in {name}"
+            origin = origin or site
+            if path in settings.SLOW_QUERY_VIEW_MODULES:
+                view = site
+        frame = frame.f_back
+    return view, origin if origin != view else None
+
+
+def log(reason, sql, seconds, database, route, site, count=1):
+    normalized = normalize(sql)
+    view, origin = site
+    logger.info(json.dumps({
+        'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'reason': reason,
+        'fingerprint': fingerprint(normalized),
+        'sql': normalized,
+        'database': database,
+        'route': route,
+        'view': view,
+        'origin': origin,
+        'count': count,
+        'ms': round(seconds * 1000, 2),
+    }))
+
+
+class RequestQueries:
+    """How often each statement ran in one request: {sql: [count, seconds, database, call site]}"""
+
+    def __init__(self, request):
+        self.request = request
+        self.statements = {}
+
+    def seen(self, sql, seconds, database):
+        entry = self.statements.get(sql)
+        if entry is None:
+            self.statements[sql] = [1, seconds, database, None]
+            return
+        entry[0] += 1
+        entry[1] += seconds
+        if entry[0] == settings.SLOW_QUERY_REPEAT + 1:
+            # Where the repeats come from; later ones are usually the same loop.
+            entry[3] = call_site()
+
+    def log_repeats(self):
+        route = route_name(self.request)
+        for sql, (count, seconds, database, site) in self.statements.items():
+            if site is not None:
+                log('repeated', sql, seconds, database, route, site, count)
+
+
+_queries = ContextVar('request_queries', default=None)
+
+
+def log_slow_queries(execute, sql, params, many, context):
+    state = _queries.get()
+    if state is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        seconds = time.perf_counter() - start
+        database = context['connection'].alias
+        if settings.SLOW_QUERY_MS and seconds * 1000 >= settings.SLOW_QUERY_MS:
+            log('slow', sql, seconds, database, route_name(state.request), call_site())
+        if settings.SLOW_QUERY_REPEAT:
+            state.seen(sql, seconds, database)
+
+
+def install_query_logger(sender, connection, **kwargs):
+    if log_slow_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(log_slow_queries)
+
+
+connection_created.connect(install_query_logger)
+
+
+class SlowQueryMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        # Connections opened before this module was imported missed the signal.
+        for connection in connections.all(initialized_only=True):
+            install_query_logger(None, connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RequestQueries(request)
+        token = _queries.set(state)
+        try:
+            return self.get_response(request)
+        finally:
+            _queries.reset(token)
+            state.log_repeats()
+
+    async def __acall__(self, request):
+        state = RequestQueries(request)
+        token = _queries.set(state)
+        try:
+            return await self.get_response(request)
+        finally:
+            _queries.reset(token)
+            state.log_repeats()
+
+
+def read_lines_backwards(path):
+    """Lines of a file as bytes, the last first, read in blocks from its end"""
+    with open(path, 'rb') as f:
+        position = f.seek(0, os.SEEK_END)
+        rest = b''
+        while position > 0:
+            size = min(READ_BLOCK_SIZE, position)
+            position -= size
+            f.seek(position)
+            lines = (f.read(size) + rest).split(b'\n')
+            # The first line may continue in the previous block.
+            rest = lines.pop(0)
+            yield from reversed(lines)
+        yield rest
+
+
+def log_files(path):
+    """SLOW_QUERY_LOG and its rotated copies, the newest first"""
+    rotated = []
+    for log_file in path.parent.glob(f"{path.name}.*"):
+        try:
+            if not log_file.name.endswith(COMPRESSED_SUFFIXES):
+                rotated.append((log_file.stat().st_mtime, log_file))
+        except OSError:
+            continue
+    return [path] + [log_file for _, log_file in sorted(rotated, reverse=True)]
+
+
+def read_log(max_records):
+    """
+    Up to max_records records from SLOW_QUERY_LOG and its rotated copies,
+    the newest first; none when logging to stderr.
+    """
+    if not settings.SLOW_QUERY_LOG:
+        return
+    remaining = max_records
+    for log_file in log_files(Path(settings.SLOW_QUERY_LOG)):
+        try:
+            for line in read_lines_backwards(log_file):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A line cut short by a crash or a concurrent rotation.
+                    continue
+                yield record
+                remaining -= 1
+                if not remaining:
+                    return
+        except OSError:
+            # Gone since it was listed.
+            continue
+
+
+def summarize(records, limit):
+    """Records grouped by fingerprint, the most total time first"""
+    groups = {}
+    for record in records:
+        group = groups.get(record['fingerprint'])
+        if group is None:
+            group = groups[record['fingerprint']] = {
+                'fingerprint': record['fingerprint'], 'sql': record['sql'], 'records': 0,
+                'executions': 0, 'total_ms': 0.0, 'max_ms': None, 'last_seen': None,
+                'reasons': Counter(), 'routes': Counter(), 'views': Counter(),
+            }
+        group['records'] += 1
+        group['executions'] += record['count']
+        group['total_ms'] += record['ms']
+        if record['reason'] == 'slow':
+            # Repeated records only know the total over all their executions.
+            group['max_ms'] = max(group['max_ms'] or 0.0, record['ms'])
+        group['last_seen'] = max(group['last_seen'] or record['time'], record['time'])
+        group['reasons'][record['reason']] += 1
+        group['routes'][record['route']] += 1
+        group['views'][record['view'] or record['origin']] += 1
+
+    summary = sorted(groups.values(), key=lambda group: group['total_ms'], reverse=True)[:limit]
+    for group in summary:
+        group['mean_ms'] = round(group['total_ms'] / group['executions'], 2)
+        group['total_ms'] = round(group['total_ms'], 2)
+        for field in ('routes', 'views'):
+            group[field] = dict(group[field].most_common(5))
+    return summary
+
+
+def slow_queries_view(request):
+    """
+    Slow-query summary by fingerprint, for the same clients as /metrics:
+    the top ?limit= fingerprints among the newest ?records= records.
+    """
+    if not can_view_internals(request):
+        raise Http404
+    limit, error = parse_int_param(request.GET, 'limit', 50, maximum=1000)
+    if not error:
+        records, error = parse_int_param(request.GET, 'records', 10000, maximum=100000)
+    if error:
+        return JsonResponse({'error': error}, status=400)
+    return JsonResponse({'fingerprints': summarize(read_log(records), limit)})
@@ -0,0 +1,198 @@
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import date
+from unittest import mock
+
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connection, connections
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from music.models import Genre, Song
+from Spotify_Clone import replicas, slow_queries
+from users.models import User
+
+
+@override_settings(METRICS_TOKEN='scrape-token')
+class InternalsAccessTests(TestCase):
+    """/metrics and /slow-queries never trust the client address."""
+
+    paths = ['/metrics', '/slow-queries']
+
+    def test_hidden_from_anonymous_clients(self):
+        for path in self.paths:
+            with self.subTest(path=path):
+                self.assertEqual(self.client.get(path, REMOTE_ADDR='127.0.0.1').status_code, 404)
+                self.assertEqual(self.client.get(path, headers={'Authorization': 'Bearer wrong'}).status_code, 404)
+
+    def test_bearer_token(self):
+        for path in self.paths:
+            with self.subTest(path=path):
+                response = self.client.get(path, headers={'Authorization': 'Bearer scrape-token'})
+                self.assertEqual(response.status_code, 200)
+
+    def test_staff_only(self):
+        user = User.objects.create_user('listener', 'listener@example.com', 'pw')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+        user.is_staff = True
+        user.save()
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_no_token_configured(self):
+        self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer '}).status_code, 404)
+
+
+
+class ServerTimingTests(TestCase):
+    @override_settings(SERVER_TIMING=False)
+    def test_off(self):
+        self.assertNotIn('Server-Timing', self.client.get('/api/genres/'))
+
+    @override_settings(SERVER_TIMING=True)
+    def test_on(self):
+        header = self.client.get('/api/genres/')['Server-Timing']
+        self.assertEqual([span.split(';')[0] for span in header.split(', ')], ['db', 'serialize', 'render', 'total'])
+
+
+@override_settings(SLOW_QUERY_MS=1e-6, SLOW_QUERY_REPEAT=0)
+class SlowQueryLogTests(TestCase):
+    def test_logged_with_route_inside_a_request(self):
+        with self.assertLogs('Spotify_Clone.slow_queries') as logs:
+            self.client.get('/api/genres/')
+        records = [json.loads(record.getMessage()) for record in logs.records]
+        self.assertTrue(records)
+        self.assertEqual({record['route'] for record in records}, {'genre-list'})
+
+    def test_not_logged_outside_a_request(self):
+        with self.assertNoLogs('Spotify_Clone.slow_queries'):
+            Genre.objects.count()
+
+    def write_log(self, path, numbers, mtime):
+        with open(path, 'w') as f:
+            for n in numbers:
+                f.write(json.dumps({'n': n, 'padding': 'x' * 100}) + '\n')
+            f.write('{"cut short')
+        os.utime(path, (mtime, mtime))
+
+    def test_read_from_the_end(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'slow.log')
+        self.write_log(path, range(2000, 3000), 300)
+        self.write_log(path + '.1', range(1000, 2000), 200)
+        self.write_log(path + '.2', range(1000), 100)
+        with open(path + '.3.gz', 'wb') as f:
+            f.write(b'\x1f\x8b not json')
+
+        with override_settings(SLOW_QUERY_LOG=path), \
+                mock.patch.object(slow_queries, 'READ_BLOCK_SIZE', 1000):
+            self.assertEqual([record['n'] for record in slow_queries.read_log(3)], [2999, 2998, 2997])
+            numbers = [record['n'] for record in slow_queries.read_log(5000)]
+        self.assertEqual(numbers, list(range(2999, -1, -1)))
+
+    @override_settings(METRICS_TOKEN='scrape-token')
+    def test_bad_limits(self):
+        headers = {'Authorization': 'Bearer scrape-token'}
+        for query in ['limit=-1', 'limit=0', 'limit=x', 'records=-5', 'records=1000001']:
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(f'/slow-queries?{query}', headers=headers).status_code, 400)
+        self.assertEqual(self.client.get('/slow-queries?limit=5&records=10', headers=headers).status_code, 200)
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "Replicas are SQLite file copies of the test database")
+class ReplicaRoutingTests(TestCase):
+    """
+    Two replica files copied from the test database before any test data
+    exists, so a read that finds no rows was served by a replica.
+    """
+
+    replicas = ['replica_a', 'replica_b']
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        connection.ensure_connection()
+        names = {}
+        for alias in cls.replicas:
+            names[alias] = os.path.join(cls.directory.name, f'{alias}.sqlite3')
+            copy = sqlite3.connect(names[alias])
+            connection.connection.backup(copy)
+            copy.close()
+        super().setUpClass()
+        # Registered after setUpClass: the test runner only sets up databases
+        # named in settings, and these files are already in place.
+        for alias, name in names.items():
+            connections.settings[alias] = connections.configure_settings(
+                {DEFAULT_DB_ALIAS: {}, alias: {**connection.settings_dict, 'NAME': name, 'TEST': {}}}
+            )[alias]
+        cls.databases = cls.databases | set(cls.replicas)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.databases = cls.databases - set(cls.replicas)
+        for alias in cls.replicas:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+        super().tearDownClass()
+        cls.directory.cleanup()
+
+    def setUp(self):
+        self.lag = dict.fromkeys(self.replicas, 0.0)
+        patcher = mock.patch.dict(replicas.LAG_CHECKS, sqlite=self.check_lag)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        replicas.replica_lag.measured.clear()
+        caches['replica_pins'].clear()
+        self.settings = override_settings(REPLICA_DATABASES=self.replicas)
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+        Genre.objects.create(title='Primary only')
+
+    def check_lag(self, alias):
+        if self.lag[alias] is None:
+            raise DatabaseError(f"{alias} is down")
+        return self.lag[alias]
+
+    def genres(self, address='10.0.0.1'):
+        return [genre['title'] for genre in self.client.get('/api/genres/', REMOTE_ADDR=address).json()]
+
+    def test_reads_go_to_a_replica(self):
+        self.assertEqual(self.genres(), [])
+
+    def test_stale_or_unavailable_replicas_are_skipped(self):
+        self.lag['replica_a'] = 60.0
+        with CaptureQueriesContext(connections['replica_a']) as stale:
+            for _ in range(5):
+                self.assertEqual(self.genres(), [])
+        self.assertEqual(len(stale), 0)
+
+        self.lag['replica_b'] = None
+        replicas.replica_lag.measured.clear()
+        self.assertEqual(self.genres(), ['Primary only'])
+
+    def test_write_pins_the_client_to_the_primary(self):
+        song = Song.objects.create(title='Pinned', duration=60, release_date=date(2024, 1, 1),
+                                   audio_file='https://example.com/p.mp3')
+        self.assertEqual(self.client.post(f'/api/songs/{song.pk}/play/', REMOTE_ADDR='10.0.0.1').status_code, 200)
+        # The pin lives in the replica_pins cache, so it outlasts the request that wrote.
+        self.assertTrue(caches['replica_pins'].get(replicas.pin_key('addr:10.0.0.1')))
+        self.assertEqual(self.genres('10.0.0.1'), ['Primary only'])
+        self.assertEqual(self.genres('10.0.0.2'), [])
+
+        caches['replica_pins'].clear()
+        self.assertEqual(self.genres('10.0.0.1'), [])
+
+    def test_write_moves_the_rest_of_the_request_to_the_primary(self):
+        router = replicas.ReplicaRouter()
+        token = replicas._state.set(replicas.RequestState(use_replica=True))
+        try:
+            self.assertIn(router.db_for_read(Genre), self.replicas)
+            self.assertEqual(router.db_for_write(Genre), DEFAULT_DB_ALIAS)
+            self.assertIsNone(router.db_for_read(Genre))
+        finally:
+            replicas._state.reset(token)
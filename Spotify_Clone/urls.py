@@ -17,16 +17,22 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path,include
 from rest_framework.authtoken import views
-import debug_toolbar
 from django.conf import settings
+from Spotify_Clone.metrics import metrics_view
+from Spotify_Clone.slow_queries import slow_queries_view
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
+    path('slow-queries', slow_queries_view, name='slow-queries'),
     path('api/', include('users.urls')),
     path('api/', include('music.urls')),
-    # path('api/', include('payments.urls')),
+    path('api/', include('payments.urls')),
 path('api-token-auth/', views.obtain_auth_token),
 ]
+if settings.ASYNC_VIEWS:
+    # Async hot paths shadow the matching DRF actions under ASGI.
+    urlpatterns.insert(1, path('api/', include('music.async_urls')))
 if settings.DEBUG:
     urlpatterns += [
-        path('__debug__/', include(debug_toolbar.urls)),
+        path('__debug__/', include('debug_toolbar.urls')),
     ]
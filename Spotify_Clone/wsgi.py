@@ -8,9 +8,16 @@ https://docs.djangoproject.com/en/5.1/howto/deployment/wsgi/
 """
 
 import os
+import time
+
+started = time.perf_counter()
 
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Spotify_Clone.settings')
 
 application = get_wsgi_application()
+
+from Spotify_Clone.metrics import registry  # noqa: E402 (needs settings)
+
+registry.observe_startup(time.perf_counter() - started)
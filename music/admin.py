@@ -5,4 +5,4 @@ from music.models import *
 admin.site.register(Song)
 admin.site.register(Genre)
 admin.site.register(Album)
-
+admin.site.register(Playlist)
@@ -0,0 +1,84 @@
+"""
+Album.track_count and Album.total_duration, kept in step with the album's songs.
+
+Song saves and deletes adjust the totals with F() updates, so concurrent
+writers never lose a change: a new song is added to its album, a moved
+song is taken off the old album and added to the new one, and a changed
+duration adjusts the difference. Saves limited by update_fields to other
+columns (likes, play_count) cost nothing. bulk_create and QuerySet.update
+send no signals; whatever writes songs that way calls refresh_totals()
+for the albums it touched, as seed_scale and import_catalog do.
+"""
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from music.models import Album, Song
+
+COUNTED_FIELDS = {'album', 'album_id', 'duration'}
+
+
+def adjust(album_id, tracks, seconds):
+    if album_id is not None and (tracks or seconds):
+        Album.objects.filter(pk=album_id).update(
+            track_count=F('track_count') + tracks,
+            total_duration=F('total_duration') + seconds,
+        )
+
+
+def refresh_totals(album_ids=None):
+    """Recomputes the totals from the songs, for all albums or the given ones."""
+    songs = Song.objects.filter(album=OuterRef('pk')).order_by().values('album')
+    albums = Album.objects.all() if album_ids is None else Album.objects.filter(pk__in=album_ids)
+    return albums.update(
+        track_count=Coalesce(Subquery(songs.annotate(n=Count('id')).values('n')), Value(0)),
+        total_duration=Coalesce(Subquery(songs.annotate(seconds=Sum('duration')).values('seconds')), Value(0)),
+    )
+
+
+@receiver(pre_save, sender=Song, dispatch_uid='album_totals_before_save')
+def remember_counted(sender, instance, raw, update_fields, **kwargs):
+    """What the totals include for the song before this save; None when they do not include it"""
+    instance._counted = None
+    if raw or instance._state.adding:
+        return
+    if update_fields is not None and not COUNTED_FIELDS & set(update_fields):
+        instance._counted = False
+        return
+    # The database has what was counted; the instance may hold unsaved edits.
+    instance._counted = Song.objects.filter(pk=instance.pk).values('album_id', 'duration').first()
+
+
+@receiver(post_save, sender=Song, dispatch_uid='album_totals_after_save')
+def count_saved(sender, instance, raw, update_fields, **kwargs):
+    before = instance.__dict__.pop('_counted', None)
+    if raw or before is False:
+        return
+
+    def saved(name, attname):
+        # Fields left out of the save, or deferred, still hold what was counted.
+        if before is not None and update_fields is not None and not {name, attname} & set(update_fields):
+            return before[attname]
+        return instance.__dict__.get(attname, before and before[attname])
+
+    album_id = saved('album', 'album_id')
+    duration = saved('duration', 'duration')
+    if before is None:
+        adjust(album_id, 1, duration)
+    elif before['album_id'] != album_id:
+        adjust(before['album_id'], -1, -before['duration'])
+        adjust(album_id, 1, duration)
+    else:
+        adjust(album_id, 0, duration - before['duration'])
+
+
+@receiver(pre_delete, sender=Song, dispatch_uid='album_totals_delete')
+def uncount_deleted(sender, instance, **kwargs):
+    # Runs in the deletion's transaction, so a failed delete leaves the totals alone.
+    if {'album_id', 'duration'} <= instance.__dict__.keys():
+        counted = {'album_id': instance.album_id, 'duration': instance.duration}
+    else:
+        counted = Song.objects.filter(pk=instance.pk).values('album_id', 'duration').first()
+    if counted:
+        adjust(counted['album_id'], -1, -counted['duration'])
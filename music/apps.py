@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class MusicConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'music'
+
+    def ready(self):
+        # Connects the signal handlers that keep album and playlist totals
+        # current and record deleted songs for the export.
+        from music import album_totals, export, playlists  # noqa: F401
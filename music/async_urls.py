@@ -0,0 +1,17 @@
+from django.urls import path
+
+from music import async_views
+
+# Same paths as the router actions they shadow; included ahead of the routers
+# when settings.ASYNC_VIEWS is on. Named like them so that metrics and profiles
+# report them under the same route. live/listeners/ streams forever and only
+# exists under ASGI.
+urlpatterns = [
+    path('songs/<uuid:pk>/play/', async_views.play, name='song-play'),
+    path('songs/<uuid:pk>/like/', async_views.like, name='song-like'),
+    path('songs/<uuid:pk>/unlike/', async_views.unlike, name='song-unlike'),
+    path('songs/<uuid:pk>/favorite/', async_views.favorite, name='song-favorite'),
+    path('songs/recently_played/', async_views.recently_played, name='song-recently-played'),
+    path('artists/<uuid:pk>/follow/', async_views.follow, name='artist-follow'),
+    path('live/listeners/', async_views.live_listeners, name='live-listeners'),
+]
@@ -0,0 +1,242 @@
+"""
+Native async versions of the hot endpoints for ASGI deployments.
+
+Under ASGI every DRF view runs in a worker thread, so a burst of play/like
+requests is capped by the thread pool. These views use the async ORM and an
+async token lookup instead and serve the same URLs and responses as the
+SongViewSet/ArtistViewSet actions they replace. They are routed ahead of the
+DRF routers only when settings.ASYNC_VIEWS is on (asgi.py turns it on).
+live_listeners has no DRF counterpart and is routed only there too: under
+WSGI its endless stream would hold a worker for as long as the client stays.
+"""
+import math
+import uuid
+from functools import wraps
+from types import SimpleNamespace
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.db.models import F
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.authtoken.models import Token
+from rest_framework.utils.encoders import JSONEncoder
+
+from music import live, radio, stats
+from music.models import ArtistFollow, FavoriteSong, RecentlyPlayed, Song, SongLike, SongPlay
+from music.music_enum import Visibility
+from music.serializers import SongSerializer
+from music.throttling import RouteThrottle
+from music.utils import BATCH_MAX_IDS, parse_int_param
+from users.models import User
+from users.role_enum import RoleEnum
+
+
+def respond(data, status=200, **headers):
+    """JSON response; header keywords are spelled like arguments, e.g. retry_after for Retry-After"""
+    headers = {name.replace('_', '-').title(): value for name, value in headers.items()}
+    return JsonResponse(data, status=status, safe=False, encoder=JSONEncoder, headers=headers)
+
+
+async def authenticate(request):
+    """
+    Async counterpart of TokenAuthentication. Returns (user, error response).
+    The profile and plan are loaded in the same query for the throttle tier.
+    """
+    header = request.headers.get('Authorization', '').split()
+    if not header or header[0].lower() != 'token':
+        return AnonymousUser(), None
+    if len(header) != 2:
+        return None, respond({"detail": "Invalid token header."}, 401, www_authenticate='Token')
+    try:
+        token = await Token.objects.select_related(
+            'user__profile__subscription_plan'
+        ).aget(key=header[1])
+    except Token.DoesNotExist:
+        return None, respond({"detail": "Invalid token."}, 401, www_authenticate='Token')
+    if not token.user.is_active:
+        return None, respond({"detail": "User inactive or deleted."}, 401, www_authenticate='Token')
+    return token.user, None
+
+
+def hot_path(basename, action, methods, login_required=False):
+    """Authentication, permissions and RouteThrottle for an async view."""
+    def decorator(view):
+        @csrf_exempt
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return respond({"detail": f'Method "{request.method}" not allowed.'}, 405)
+            user, error = await authenticate(request)
+            if error:
+                return error
+            request.user = user
+            if login_required and not user.is_authenticated:
+                return respond({"detail": "Authentication credentials were not provided."}, 401,
+                               www_authenticate='Token')
+
+            # The tier lookup only reads the preloaded profile, so the throttle
+            # never queries the database, but cache clients are blocking.
+            throttle = RouteThrottle()
+            route = SimpleNamespace(basename=basename, action=action, request=request)
+            if not await sync_to_async(throttle.allow_request)(request, route):
+                wait = math.ceil(throttle.wait())
+                return respond({"detail": f"Request was throttled. Expected available in {wait} seconds."},
+                               429, retry_after=str(wait))
+            return await view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+async def get_song(request, pk):
+    return await radio.visible_songs_for(request.user).only(
+        'id', 'user_id', 'duration', 'play_count', 'likes'
+    ).filter(pk=pk).afirst()
+
+
+NOT_FOUND = {"detail": "Not found."}
+
+
+@hot_path('song', 'play', ['POST'])
+async def play(request, pk):
+    song = await get_song(request, pk)
+    if song is None:
+        return respond(NOT_FOUND, 404)
+    song.play_count = F('play_count') + 1
+    await song.asave(update_fields=['play_count', 'updated_at'])
+    await song.arefresh_from_db(fields=['play_count'])
+    await stats.arecord(song, plays=1)
+    live.hub.record_play(live.listener_key(request), song.pk, song.user_id, song.duration)
+
+    # Track recently played for authenticated users
+    if request.user.is_authenticated:
+        await RecentlyPlayed.objects.aupdate_or_create(
+            user=request.user,
+            song=song,
+            defaults={'played_at': timezone.now()}
+        )
+        await SongPlay.objects.acreate(user=request.user, song=song)
+    return respond({"play_count": song.play_count})
+
+
+@hot_path('song', 'like', ['POST'], login_required=True)
+async def like(request, pk):
+    song = await get_song(request, pk)
+    if song is None:
+        return respond(NOT_FOUND, 404)
+    _, created = await SongLike.objects.aget_or_create(user=request.user, song=song)
+    if created:
+        song.likes = F('likes') + 1
+        await song.asave(update_fields=['likes', 'updated_at'])
+        await song.arefresh_from_db(fields=['likes'])
+        await stats.arecord(song, likes=1)
+    return respond({"likes": song.likes})
+
+
+@hot_path('song', 'unlike', ['POST'], login_required=True)
+async def unlike(request, pk):
+    song = await get_song(request, pk)
+    if song is None:
+        return respond(NOT_FOUND, 404)
+    deleted, _ = await SongLike.objects.filter(user=request.user, song=song).adelete()
+    if deleted:
+        song.likes = F('likes') - 1
+        await song.asave(update_fields=['likes', 'updated_at'])
+        await song.arefresh_from_db(fields=['likes'])
+        await stats.arecord(song, likes=-1)
+    return respond({"likes": song.likes})
+
+
+@hot_path('song', 'favorite', ['POST', 'DELETE'], login_required=True)
+async def favorite(request, pk):
+    song = await get_song(request, pk)
+    if song is None:
+        return respond(NOT_FOUND, 404)
+
+    if request.method == 'POST':
+        _, created = await FavoriteSong.objects.aget_or_create(user=request.user, song=song)
+        if created:
+            await stats.arecord(song, favorites=1)
+            return respond({"message": "Song added to favorites"}, 201)
+        return respond({"message": "Song already in favorites"})
+
+    deleted, _ = await FavoriteSong.objects.filter(user=request.user, song=song).adelete()
+    if deleted:
+        await stats.arecord(song, favorites=-1)
+        return respond({"message": "Song removed from favorites"})
+    return respond({"error": "Song not in favorites"}, 404)
+
+
+@hot_path('song', 'recently_played', ['GET'], login_required=True)
+async def recently_played(request):
+    limit, error = parse_int_param(request.GET, 'limit', 50)
+    if error:
+        return respond({"error": error}, 400)
+    # Everything the serializer reads is joined up front; lazy loads are
+    # not allowed in async code.
+    recent = RecentlyPlayed.objects.filter(user=request.user).select_related(
+        'song__user', 'song__album__user', 'song__genre__user'
+    ).order_by('-played_at')[:limit]
+    songs = [play.song async for play in recent]
+    return respond(SongSerializer(songs, many=True).data)
+
+
+@hot_path('artist', 'follow', ['POST', 'DELETE'], login_required=True)
+async def follow(request, pk):
+    try:
+        artist = await User.objects.aget(id=pk, role=RoleEnum.ARTIST.value)
+    except User.DoesNotExist:
+        return respond({"error": "Artist not found"}, 404)
+
+    if artist == request.user:
+        return respond({"error": "Cannot follow yourself"}, 400)
+
+    if request.method == 'POST':
+        _, created = await ArtistFollow.objects.aget_or_create(user=request.user, artist=artist)
+        if created:
+            return respond({"message": f"Now following {artist.username}"}, 201)
+        return respond({"message": "Already following this artist"})
+
+    deleted, _ = await ArtistFollow.objects.filter(user=request.user, artist=artist).adelete()
+    if deleted:
+        return respond({"message": f"Unfollowed {artist.username}"})
+    return respond({"error": "Not following this artist"}, 404)
+
+
+def parse_ids(value):
+    try:
+        return list(dict.fromkeys(uuid.UUID(part.strip()) for part in value.split(',') if part.strip()))
+    except ValueError:
+        return None
+
+
+@hot_path('live', 'listeners', ['GET'], login_required=True)
+async def live_listeners(request):
+    """
+    Server-sent events with the number of people listening right now to
+    ?songs=<ids> and ?artists=<ids>; see music.live. Only changed counts are
+    sent, at most once per tick. Signed-in users only, throttled like the
+    hot paths, since every open stream holds a connection.
+    """
+    songs = parse_ids(request.GET.get('songs', ''))
+    artists = parse_ids(request.GET.get('artists', ''))
+    if songs is None or artists is None:
+        return respond({"error": "songs and artists must be comma-separated UUIDs"}, 400)
+    if not songs and not artists:
+        return respond({"error": "Pass songs and/or artists to watch"}, 400)
+    if len(songs) + len(artists) > BATCH_MAX_IDS:
+        return respond({"error": f"At most {BATCH_MAX_IDS} ids per stream"}, 400)
+
+    songs = [pk async for pk in Song.objects.filter(
+        id__in=songs, visibility=Visibility.PUBLIC.value
+    ).values_list('id', flat=True)]
+    artists = [pk async for pk in User.objects.filter(
+        id__in=artists, role=RoleEnum.ARTIST.value
+    ).values_list('id', flat=True)]
+
+    response = StreamingHttpResponse(live.stream(songs, artists), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Keep reverse proxies from buffering the stream.
+    response['X-Accel-Buffering'] = 'no'
+    return response
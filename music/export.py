@@ -0,0 +1,118 @@
+"""
+Streaming catalog export for partners.
+
+Public songs are walked in (updated_at, id) keyset order, one bounded query
+per chunk, and written as NDJSON (optionally gzip-compressed) while they are
+read, so memory use does not depend on catalog size. Play and like counter
+updates set updated_at too, so an updated_since export carries fresh counts.
+
+An updated_since export then lists the songs that left the catalog since:
+songs no longer public, and deleted songs, whose ids are kept as
+SongTombstone rows. Those lines hold only id, updated_at and "removed": true.
+"""
+import json
+import zlib
+
+from django.db.models import F, Q
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from music.models import Song, SongTombstone
+from music.music_enum import Visibility
+
+CHUNK_SIZE = 2000
+
+EXPORT_COLUMNS = {
+    'id': F('id'),
+    'title': F('title'),
+    'artist': F('user__username'),
+    'album_id': F('album_id'),
+    'album': F('album__title'),
+    'genre': F('genre__title'),
+    'duration': F('duration'),
+    'release_date': F('release_date'),
+    'audio_file': F('audio_file'),
+    'play_count': F('play_count'),
+    'likes': F('likes'),
+    'created_at': F('created_at'),
+    'updated_at': F('updated_at'),
+}
+
+
+@receiver(post_delete, sender=Song, dispatch_uid='export_song_tombstone')
+def song_deleted(sender, instance, **kwargs):
+    SongTombstone.objects.create(song_id=instance.pk)
+
+
+def _pages(rows, time_field, id_field, chunk_size):
+    """Lists of rows of a values() queryset, walked by (time_field, id_field) keyset."""
+    rows = rows.order_by(time_field, id_field)
+    last = None
+    while True:
+        page = rows
+        if last:
+            page = page.filter(Q(**{f"{time_field}__gt": last[0]})
+                               | Q(**{time_field: last[0], f"{id_field}__gt": last[1]}))
+        page = list(page[:chunk_size])
+        if not page:
+            return
+        yield page
+        last = (page[-1][time_field], page[-1][id_field])
+
+
+def iter_song_chunks(updated_since=None, chunk_size=CHUNK_SIZE):
+    """Yields lists of row dicts; each list is one keyset query."""
+    songs = Song.objects.filter(visibility=Visibility.PUBLIC.value)
+    if updated_since:
+        songs = songs.filter(updated_at__gte=updated_since)
+    # Aliases are prefixed so they never clash with model field names.
+    songs = songs.values(**{f"export_{name}": expression for name, expression in EXPORT_COLUMNS.items()})
+    for rows in _pages(songs, 'export_updated_at', 'export_id', chunk_size):
+        yield [{name: row[f"export_{name}"] for name in EXPORT_COLUMNS} for row in rows]
+
+    if updated_since:
+        hidden = Song.objects.exclude(visibility=Visibility.PUBLIC.value).filter(
+            updated_at__gte=updated_since
+        ).values('id', 'updated_at')
+        for rows in _pages(hidden, 'updated_at', 'id', chunk_size):
+            yield [{'id': row['id'], 'updated_at': row['updated_at'], 'removed': True} for row in rows]
+
+        deleted = SongTombstone.objects.filter(deleted_at__gte=updated_since).values('song_id', 'deleted_at')
+        for rows in _pages(deleted, 'deleted_at', 'song_id', chunk_size):
+            yield [{'id': row['song_id'], 'updated_at': row['deleted_at'], 'removed': True} for row in rows]
+
+
+def accepts_gzip(header):
+    """Whether an Accept-Encoding header allows gzip, by name or through *, with a q above 0."""
+    weights = {}
+    for part in header.split(','):
+        coding, *params = [item.strip() for item in part.split(';')]
+        if not coding:
+            continue
+        weight = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding.lower()] = weight
+    if 'gzip' in weights:
+        return weights['gzip'] > 0
+    return weights.get('*', 0) > 0
+
+
+def iter_ndjson(chunks):
+    """Encodes each chunk of rows into one block of newline-delimited JSON."""
+    for rows in chunks:
+        yield ''.join(json.dumps(row, default=str) + '\n' for row in rows).encode()
+
+
+def iter_gzip(blocks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for block in blocks:
+        data = compressor.compress(block)
+        if data:
+            yield data
+    yield compressor.flush()
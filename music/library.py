@@ -0,0 +1,122 @@
+"""
+Batched library mutations: likes, favorites and follows.
+
+A batch is reduced to the final state per target (the last operation on a
+song or artist wins), then applied in one transaction with a bulk insert and
+a bulk delete per relation. Song like counters are adjusted with one UPDATE
+per distinct delta instead of one per song.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from music import stats
+from music.models import ArtistFollow, FavoriteSong, Song, SongLike
+from music.music_enum import Visibility
+from users.models import User
+from users.role_enum import RoleEnum
+
+# relation -> (model, target column, stats metric). Each relation has an op of
+# the same name that adds the row and an "un" op that removes it.
+RELATIONS = {
+    'like': (SongLike, 'song_id', 'likes'),
+    'favorite': (FavoriteSong, 'song_id', 'favorites'),
+    'follow': (ArtistFollow, 'artist_id', None),
+}
+OPERATIONS = {
+    **{relation: (relation, True) for relation in RELATIONS},
+    **{f"un{relation}": (relation, False) for relation in RELATIONS},
+}
+MAX_OPERATIONS = 500
+
+
+def _final_states(operations):
+    """{relation: {target id: add?}}, keeping the last operation per target."""
+    states = defaultdict(dict)
+    for operation in operations:
+        relation, add = OPERATIONS[operation['op']]
+        states[relation][operation['id']] = add
+    return states
+
+
+def _set_relation(user, relation, wanted):
+    """
+    Brings the user's rows of one relation to the wanted state.
+    Returns (ids added, ids removed): only the rows this call inserted or
+    deleted, so counters move once even when a single-item request races it.
+    """
+    model, target, _ = RELATIONS[relation]
+    # Locking the existing rows keeps a concurrent unlike from deleting them
+    # between this read and the delete below.
+    existing = set(
+        model.objects.select_for_update()
+        .filter(user=user, **{f"{target}__in": list(wanted)}).values_list(target, flat=True)
+    )
+    rows = [model(user=user, **{target: target_id})
+            for target_id, add in wanted.items() if add and target_id not in existing]
+    removed = [target_id for target_id, add in wanted.items() if not add and target_id in existing]
+    # A row added concurrently wins the unique constraint and ours is skipped;
+    # the pks generated here tell which rows were really inserted.
+    model.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+    added = list(
+        model.objects.filter(pk__in=[row.pk for row in rows]).values_list(target, flat=True)
+    ) if rows else []
+    if removed:
+        model.objects.filter(user=user, **{f"{target}__in": removed}).delete()
+    return added, removed
+
+
+def apply(user, operations):
+    """
+    Applies a list of {'op', 'id'} operations for `user`.
+    Returns a summary with the per-op counts of rows that changed and the ids
+    that do not name a visible song or a followable artist.
+    """
+    states = _final_states(operations)
+
+    song_ids = set(states['like']) | set(states['favorite'])
+    songs = dict(
+        Song.objects.filter(Q(visibility=Visibility.PUBLIC.value) | Q(user=user), id__in=song_ids)
+        .values_list('id', 'user_id')
+    )
+    artists = set(
+        User.objects.filter(id__in=list(states['follow']), role=RoleEnum.ARTIST.value)
+        .exclude(id=user.id).values_list('id', flat=True)
+    )
+    missing = {target_id for target_id in song_ids if target_id not in songs}
+    missing |= {target_id for target_id in states['follow'] if target_id not in artists}
+    for wanted in states.values():
+        for target_id in missing & set(wanted):
+            del wanted[target_id]
+
+    counts = dict.fromkeys(OPERATIONS, 0)
+    stat_changes = defaultdict(lambda: dict.fromkeys(stats.METRICS, 0))
+    with transaction.atomic():
+        for relation, wanted in states.items():
+            if not wanted:
+                continue
+            added, removed = _set_relation(user, relation, wanted)
+            counts[relation], counts[f"un{relation}"] = len(added), len(removed)
+            metric = RELATIONS[relation][2]
+            if metric is None:
+                continue
+            for song_id in added:
+                stat_changes[(song_id, songs[song_id])][metric] += 1
+            for song_id in removed:
+                stat_changes[(song_id, songs[song_id])][metric] -= 1
+
+        # A user likes a song at most once, so each song moves by +1 or -1.
+        # QuerySet.update() skips auto_now; the export's updated_since relies on it.
+        now = timezone.now()
+        for delta in (1, -1):
+            song_ids = [key[0] for key, deltas in stat_changes.items() if deltas['likes'] == delta]
+            if song_ids:
+                Song.objects.filter(id__in=song_ids).update(likes=F('likes') + delta, updated_at=now)
+        stats.record_batch(stat_changes)
+
+    return {
+        'applied': counts,
+        'missing': sorted(str(target_id) for target_id in missing),
+    }
@@ -0,0 +1,192 @@
+"""
+Live listener counts, pushed to clients over server-sent events.
+
+Every play marks its listener as active on that song (and the song's artist)
+until the song would have finished, or until the same listener starts
+another song. The hub keeps those sets in memory and, once per tick, sends
+each subscriber the new counts of the songs and artists it watches that
+changed since the previous tick. Subscribers are a small object and a
+waiting coroutine, so idle connections cost no work per tick.
+
+The hub lives in the process that served the play, so each worker reports
+the listeners it has seen. Plays are only tracked while the process has a
+subscriber: under WSGI, where no stream is served, recording is a no-op,
+and a new stream's counts start from the plays after it opened.
+"""
+import asyncio
+import heapq
+import itertools
+import json
+import threading
+import time
+from collections import defaultdict
+
+TICK_SECONDS = 1.0
+KEEPALIVE_SECONDS = 15
+# Upper bound on how long one play keeps a listener active.
+MAX_LISTEN_SECONDS = 15 * 60
+
+
+class Subscriber:
+    """Counts waiting to be sent to one connection; later ticks overwrite earlier ones."""
+
+    def __init__(self, songs, artists):
+        self.songs = set(songs)
+        self.artists = set(artists)
+        self.pending = {'songs': {}, 'artists': {}}
+        self.ready = asyncio.Event()
+
+    def push(self, kind, key, count):
+        self.pending[kind][key] = count
+        self.ready.set()
+
+    def take(self):
+        pending, self.pending = self.pending, {'songs': {}, 'artists': {}}
+        self.ready.clear()
+        return pending
+
+
+class ListenerHub:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # listener -> (song_id, artist_id, expires_at)
+        self.current = {}
+        self.expiry = []
+        self.sequence = itertools.count()
+        self.listeners = {'songs': defaultdict(set), 'artists': defaultdict(set)}
+        self.dirty = {'songs': set(), 'artists': set()}
+        self.subscribers = {'songs': defaultdict(set), 'artists': defaultdict(set)}
+        self.ticker = None
+
+    def record_play(self, listener, song_id, artist_id, duration):
+        """Called from play views, on any thread."""
+        if not any(self.subscribers.values()):
+            # Nobody is watching, and nothing would expire the entry.
+            return
+        expires = time.monotonic() + min(duration or MAX_LISTEN_SECONDS, MAX_LISTEN_SECONDS)
+        with self.lock:
+            self._expire(time.monotonic())
+            self._leave(listener)
+            self.current[listener] = (song_id, artist_id, expires)
+            heapq.heappush(self.expiry, (expires, next(self.sequence), listener))
+            self._add('songs', song_id, listener)
+            if artist_id:
+                self._add('artists', artist_id, listener)
+
+    def _add(self, kind, key, listener):
+        self.listeners[kind][key].add(listener)
+        self.dirty[kind].add(key)
+
+    def _remove(self, kind, key, listener):
+        listeners = self.listeners[kind].get(key)
+        if listeners is not None:
+            listeners.discard(listener)
+            if not listeners:
+                del self.listeners[kind][key]
+            self.dirty[kind].add(key)
+
+    def _leave(self, listener):
+        previous = self.current.pop(listener, None)
+        if previous:
+            song_id, artist_id, _ = previous
+            self._remove('songs', song_id, listener)
+            if artist_id:
+                self._remove('artists', artist_id, listener)
+
+    def _expire(self, now):
+        while self.expiry and self.expiry[0][0] <= now:
+            expires, _, listener = heapq.heappop(self.expiry)
+            # Entries of listeners who have moved to another song are stale.
+            state = self.current.get(listener)
+            if state and state[2] == expires:
+                self._leave(listener)
+
+    def counts(self, kind, keys):
+        with self.lock:
+            self._expire(time.monotonic())
+            return {str(key): len(self.listeners[kind].get(key, ())) for key in keys}
+
+    def tick(self):
+        """Expires finished listens and pushes changed counts to their subscribers."""
+        with self.lock:
+            self._expire(time.monotonic())
+            changes = []
+            for kind in ('songs', 'artists'):
+                for key in self.dirty[kind]:
+                    if key in self.subscribers[kind]:
+                        changes.append((kind, key, len(self.listeners[kind].get(key, ()))))
+                self.dirty[kind] = set()
+        for kind, key, count in changes:
+            name = str(key)
+            for subscriber in list(self.subscribers[kind].get(key, ())):
+                subscriber.push(kind, name, count)
+
+    def subscribe(self, songs, artists):
+        subscriber = Subscriber(songs, artists)
+        with self.lock:
+            for kind in ('songs', 'artists'):
+                for key in getattr(subscriber, kind):
+                    self.subscribers[kind][key].add(subscriber)
+        self.ensure_ticker()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            for kind in ('songs', 'artists'):
+                for key in getattr(subscriber, kind):
+                    watchers = self.subscribers[kind].get(key)
+                    if watchers is not None:
+                        watchers.discard(subscriber)
+                        if not watchers:
+                            del self.subscribers[kind][key]
+            if not any(self.subscribers.values()):
+                # record_play() stops tracking; drop what it tracked so far.
+                self.current.clear()
+                self.expiry.clear()
+                for kind in ('songs', 'artists'):
+                    self.listeners[kind].clear()
+                    self.dirty[kind].clear()
+
+    def ensure_ticker(self):
+        """Starts the tick loop on the running event loop if it is not running there yet."""
+        loop = asyncio.get_running_loop()
+        if self.ticker is None or self.ticker.done() or self.ticker.get_loop() is not loop:
+            self.ticker = loop.create_task(self._run())
+
+    async def _run(self):
+        while any(self.subscribers.values()):
+            self.tick()
+            await asyncio.sleep(TICK_SECONDS)
+
+
+hub = ListenerHub()
+
+
+def listener_key(request):
+    """The user, or the client address for anonymous plays."""
+    if request.user.is_authenticated:
+        return request.user.pk
+    return request.META.get('REMOTE_ADDR')
+
+
+def event(name, data):
+    return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+
+async def stream(songs, artists):
+    """SSE body: a snapshot of the requested counts, then coalesced updates."""
+    subscriber = hub.subscribe(songs, artists)
+    try:
+        yield event('counts', {'songs': hub.counts('songs', songs), 'artists': hub.counts('artists', artists)})
+        while True:
+            # asyncio.timeout() rather than wait_for(), which can swallow the
+            # cancellation Django sends when the client disconnects.
+            try:
+                async with asyncio.timeout(KEEPALIVE_SECONDS):
+                    await subscriber.ready.wait()
+            except TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield event('counts', subscriber.take())
+    finally:
+        hub.unsubscribe(subscriber)
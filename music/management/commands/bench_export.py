@@ -0,0 +1,40 @@
+import resource
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from music.viewsets import SongViewSet
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Measures rows/sec, output size and peak RSS of the streaming song export"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--updated-since')
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        view = SongViewSet.as_view({'get': 'export'}, basename='song')
+        user = User(username='bench-export')
+        params = {'updated_since': options['updated_since']} if options['updated_since'] else {}
+
+        for encoding in ('identity', 'gzip'):
+            request = factory.get('/api/songs/export/', params, HTTP_ACCEPT_ENCODING=encoding)
+            force_authenticate(request, user=user)
+
+            start = time.perf_counter()
+            response = view(request)
+            size = rows = 0
+            for block in response.streaming_content:
+                size += len(block)
+                if encoding == 'identity':
+                    rows += block.count(b'\n')
+            elapsed = time.perf_counter() - start
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+            line = f"{encoding:<9} {size / 1e6:8.1f} MB in {elapsed:.2f}s, peak RSS {peak:.0f} MB"
+            if rows:
+                line += f", {rows} rows ({rows / elapsed:,.0f} rows/s)"
+            self.stdout.write(line)
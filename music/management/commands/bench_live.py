@@ -0,0 +1,71 @@
+import asyncio
+import random
+import time
+import tracemalloc
+import uuid
+
+from django.core.management.base import BaseCommand
+
+from music import live
+
+
+class Command(BaseCommand):
+    help = (
+        "Holds many idle listener-count streams in-process and reports the memory per "
+        "connection and the cost of a tick while plays arrive"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=10000)
+        parser.add_argument('--songs', type=int, default=5000,
+                            help="Distinct songs being played and watched")
+        parser.add_argument('--watch', type=int, default=20, help="Songs watched per connection")
+        parser.add_argument('--plays-per-tick', type=int, default=2000)
+        parser.add_argument('--ticks', type=int, default=20)
+
+    def handle(self, *args, **options):
+        asyncio.run(self.run(options))
+
+    async def run(self, options):
+        hub = live.hub = live.ListenerHub()
+        songs = [uuid.uuid4() for _ in range(options['songs'])]
+        artists = [uuid.uuid4() for _ in range(options['songs'] // 10 or 1)]
+        artist_of = {song: random.choice(artists) for song in songs}
+
+        async def drain(body):
+            async for _ in body:
+                pass
+
+        tracemalloc.start()
+        before, _ = tracemalloc.get_traced_memory()
+        streams = [
+            asyncio.create_task(drain(live.stream(random.sample(songs, options['watch']), [])))
+            for _ in range(options['connections'])
+        ]
+        await asyncio.sleep(0)
+        after, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write(f"{options['connections']} idle streams: "
+                          f"{(after - before) / options['connections'] / 1024:.1f} KiB each")
+
+        # Drive ticks by hand so the timing covers only the hub's work.
+        hub.ticker.cancel()
+        listeners = [uuid.uuid4() for _ in range(options['plays_per_tick'] * 5)]
+        timings = []
+        for _ in range(options['ticks']):
+            for _ in range(options['plays_per_tick']):
+                song = random.choice(songs)
+                hub.record_play(random.choice(listeners), song, artist_of[song], 180)
+            start = time.perf_counter()
+            hub.tick()
+            await asyncio.sleep(0)
+            timings.append(time.perf_counter() - start)
+
+        timings.sort()
+        self.stdout.write(
+            f"{options['plays_per_tick']} plays per tick: tick + delivery "
+            f"p50 {timings[len(timings) // 2] * 1000:.1f} ms, max {timings[-1] * 1000:.1f} ms"
+        )
+        for stream in streams:
+            stream.cancel()
+        await asyncio.gather(*streams, return_exceptions=True)
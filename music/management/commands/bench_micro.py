@@ -0,0 +1,192 @@
+import json
+import platform
+import timeit
+import uuid
+from datetime import date
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.http import QueryDict
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from music.models import Album, Genre, Song
+from music.permissions import IsArtistOrReadOnly, IsOwnerOrReadOnly
+from music.serializers import AlbumSerializer, SongSerializer
+from music.utils import parse_batch_ids, validate_audio_file, validate_image_file
+from music.viewsets import AlbumViewSet, SongViewSet
+from users.models import User, UserProfile
+from users.role_enum import RoleEnum
+from users.serializers import UserProfileSerializer
+
+BASELINE = Path(settings.BASE_DIR) / 'music' / 'benchmarks' / 'baseline.json'
+# Fixture sizes are fixed so that timings stay comparable between runs.
+SONGS = 200
+ALBUMS = 20
+PROFILES = 50
+
+
+class Command(BaseCommand):
+    help = (
+        "Times serializers, viewset querysets, validators and permission checks on fixed-size "
+        "fixtures in a throwaway test database and compares each against the JSON baseline. "
+        "Exits non-zero when any case is slower than the baseline by more than --threshold. "
+        "Baselines are machine-specific: refresh them with --save on the machine that compares."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--baseline', default=str(BASELINE))
+        parser.add_argument('--save', action='store_true', help="Write this run as the new baseline")
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help="Allowed slowdown per case, as a fraction of the baseline")
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('-k', dest='only', help="Only run cases whose name contains this")
+
+    def handle(self, *args, **options):
+        self.results = {}
+        self.cases = {}
+        self.options = options
+        path = Path(options['baseline'])
+        baseline = {}
+        if not options['save'] and path.exists():
+            baseline = json.loads(path.read_text())['seconds_per_op']
+
+        # A fresh database holds only the fixtures, whatever the local one contains.
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.run()
+            # Re-time apparent regressions so that a burst of noise does not fail the run.
+            for _ in range(2):
+                for name in self.regressions(baseline):
+                    self.measure(name, *self.cases[name])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options['save']:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps({
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': settings.DATABASES['default']['ENGINE'],
+                'seconds_per_op': self.results,
+            }, indent=2, sort_keys=True) + "\n")
+            self.stdout.write(f"Saved {len(self.results)} cases to {path}")
+            return
+
+        regressions = self.regressions(baseline)
+        self.stdout.write(f"{'case':<36}{'us/op':>12}{'baseline':>12}{'change':>9}")
+        for name, seconds in self.results.items():
+            before = baseline.get(name)
+            line = f"{name:<36}{seconds * 1e6:>12.2f}"
+            if before:
+                change = seconds / before - 1
+                line += f"{before * 1e6:>12.2f}{change:>+9.0%}"
+                if name in regressions:
+                    line += "  REGRESSION"
+            self.stdout.write(line)
+        if regressions:
+            raise CommandError(f"{len(regressions)} case(s) slower than the baseline by more than "
+                               f"{options['threshold']:.0%}: {', '.join(regressions)}")
+
+    def regressions(self, baseline):
+        return [name for name, seconds in self.results.items()
+                if name in baseline and seconds > baseline[name] * (1 + self.options['threshold'])]
+
+    def measure(self, name, func, ops=1):
+        """Best of --repeat runs, each long enough to time reliably, in seconds per op"""
+        if self.options['only'] and self.options['only'] not in name:
+            return
+        self.cases[name] = (func, ops)
+        timer = timeit.Timer(func)
+        number, _ = timer.autorange()
+        best = min(timer.repeat(self.options['repeat'], number)) / number / ops
+        self.results[name] = min(best, self.results.get(name, best))
+
+    def request(self, method='get', path='/', data=None, user=None):
+        request = Request(getattr(APIRequestFactory(), method)(path, data))
+        if user is not None:
+            request.user = user
+        return request
+
+    def view(self, viewset, params=None, user=None):
+        view = viewset()
+        view.request = self.request(data=params, user=user)
+        view.format_kwarg = None
+        view.action = 'list'
+        view.kwargs = {}
+        return view
+
+    def run(self):
+        artist = User.objects.create(username='bench-micro-artist', role=RoleEnum.ARTIST.value)
+        listener = User.objects.create(username='bench-micro-listener', role=RoleEnum.USER.value)
+        genre = Genre.objects.create(title='Bench', user=artist)
+        albums = Album.objects.bulk_create([
+            Album(user=artist, title=f"Bench album {i}", title_key=f"bench album {i}",
+                  release_date=date(2024, 1, 1 + i % 28))
+            for i in range(ALBUMS)
+        ])
+        Song.objects.bulk_create([
+            Song(user=artist, album=albums[i % ALBUMS], genre=genre, title=f"Bench song {i}",
+                 duration=120 + i, release_date=date(2024, 1, 1 + i % 28),
+                 audio_file=f"https://example.com/{i}.mp3", play_count=i, likes=i % 7)
+            for i in range(SONGS)
+        ])
+        users = User.objects.bulk_create([
+            User(username=f"bench-micro-{i}", email=f"bench-micro-{i}@example.com") for i in range(PROFILES)
+        ])
+        UserProfile.objects.bulk_create([UserProfile(user=user) for user in users])
+
+        # Serialization, per row
+        songs = list(Song.objects.filter(user=artist).select_related('user', 'album__user', 'genre__user'))
+        self.measure('serialize.song', lambda: SongSerializer(songs, many=True).data, SONGS)
+        sparse = {'fields': ['id', 'title', 'play_count'], 'expand': set()}
+        self.measure('serialize.song.sparse', lambda: SongSerializer(songs, many=True, context=sparse).data, SONGS)
+        album_rows = list(Album.objects.filter(user=artist).select_related('user'))
+        self.measure('serialize.album', lambda: AlbumSerializer(album_rows, many=True).data, ALBUMS)
+        profiles = list(UserProfile.objects.filter(user__in=users).select_related('user'))
+        self.measure('serialize.user_profile', lambda: UserProfileSerializer(profiles, many=True).data, PROFILES)
+
+        # Querysets: building them, then running them
+        self.measure('queryset.song.build', lambda: self.view(SongViewSet).get_queryset())
+        filters = {'genre': 'Bench', 'artist': 'bench', 'date_from': '2024-01-01', 'date_to': '2024-12-31'}
+        self.measure('queryset.song.build.filtered', lambda: self.view(SongViewSet, filters).get_queryset())
+        self.measure('queryset.song.build.artist', lambda: self.view(SongViewSet, user=artist).get_queryset())
+        self.measure('queryset.song.page',
+                     lambda: list(self.view(SongViewSet).get_queryset().order_by('-created_at')[:50]))
+        self.measure('queryset.song.trending',
+                     lambda: list(self.view(SongViewSet).get_queryset().order_by('-play_count', '-likes')[:20]))
+        self.measure('queryset.song.sparse_page',
+                     lambda: list(self.view(SongViewSet, {'fields': 'id,title'}).get_queryset()[:50]))
+        self.measure('queryset.album.page', lambda: list(self.view(AlbumViewSet).get_queryset()[:ALBUMS]))
+
+        # Validators
+        audio = SimpleUploadedFile('bench.mp3', b'\0' * 1024, content_type='audio/mpeg')
+        image = SimpleUploadedFile('bench.png', b'\0' * 1024, content_type='image/png')
+        self.measure('validate.audio_file', lambda: validate_audio_file(audio))
+        self.measure('validate.image_file', lambda: validate_image_file(image))
+        ids = QueryDict(mutable=True)
+        ids['ids'] = ','.join(str(uuid.uuid4()) for _ in range(250))
+        self.measure('validate.batch_ids', lambda: parse_batch_ids(ids))
+        song_input = {'title': 'Bench', 'genre': 'Bench', 'album_title': 'Bench album 0',
+                      'release_date': '2024-01-01', 'duration': 200, 'visibility': 1}
+        self.measure('validate.song_input', lambda: SongSerializer(data=song_input).is_valid(raise_exception=True))
+
+        # Permission checks on an unsafe request, where they do work
+        song = songs[0]
+        post_as_artist = self.request('post', user=artist)
+        post_as_listener = self.request('post', user=listener)
+        artist_check, owner_check = IsArtistOrReadOnly(), IsOwnerOrReadOnly()
+        self.measure('permission.artist_or_read_only', lambda: (
+            artist_check.has_permission(post_as_artist, None)
+            and artist_check.has_object_permission(post_as_artist, None, song)
+        ))
+        self.measure('permission.artist_or_read_only.denied',
+                     lambda: artist_check.has_permission(post_as_listener, None))
+        self.measure('permission.owner_or_read_only', lambda: (
+            owner_check.has_permission(post_as_artist, None)
+            and owner_check.has_object_permission(post_as_artist, None, song)
+        ))
@@ -0,0 +1,82 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from music import playlists
+from music.models import Song, Playlist, PlaylistItem
+from users.models import User
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Times playlist operations on a large playlist; all writes are rolled back"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tracks', type=int, default=10000)
+        parser.add_argument('--ops', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options['tracks'], options['ops'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def timed(self, label, count, func):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"{label:<32} {elapsed * 1000:9.1f} ms  ({elapsed / count * 1e6:8.1f} us/op)")
+        return result
+
+    def run(self, tracks, ops):
+        user = User.objects.create(username='bench-playlists')
+        songs = Song.objects.bulk_create([
+            Song(user=user, title=f"Bench {i}", duration=180 + i % 60,
+                 release_date=date(2024, 1, 1), audio_file='https://example.com/a.mp3')
+            for i in range(100)
+        ])
+        playlist = Playlist.objects.create(user=user, title='Bench')
+
+        self.timed(f"bulk add {tracks} tracks", tracks,
+                   lambda: playlists.add_songs(playlist, [songs[i % 100] for i in range(tracks)]))
+
+        items = list(PlaylistItem.objects.filter(playlist=playlist).order_by('position'))
+        middle = items[len(items) // 2]
+        self.timed(f"insert {ops} after one item", ops,
+                   lambda: [playlists.add_songs(playlist, [songs[0]], after=middle) for _ in range(ops)])
+
+        items = list(PlaylistItem.objects.filter(playlist=playlist).order_by('position'))
+        step = max(len(items) // ops, 1)
+        self.timed(f"move {ops} items", ops, lambda: [
+            playlists.move_item(items[i], after=items[-1 - i]) for i in range(0, ops * step, step)
+            if items[i].pk != items[-1 - i].pk
+        ])
+
+        def page_through():
+            after, pages = None, 0
+            while True:
+                page = playlists.page_items(playlist, after, 100)
+                pages += 1
+                if len(page) < 100:
+                    return pages
+                after = page[-1].position
+        pages = playlists.page_items(playlist, None, 1) and (tracks + ops) // 100 + 1
+        self.timed("keyset read of every page", pages, page_through)
+
+        last = PlaylistItem.objects.filter(playlist=playlist).order_by('-position')[:ops]
+        last = list(last.select_related('song'))
+        self.timed(f"remove {len(last)} items", len(last),
+                   lambda: [playlists.remove_item(item) for item in last])
+
+        playlist.refresh_from_db()
+        longest = max(len(p) for p in PlaylistItem.objects.filter(playlist=playlist)
+                      .values_list('position', flat=True))
+        self.stdout.write(f"track_count={playlist.track_count} total_duration={playlist.total_duration} "
+                          f"longest_key={longest}")
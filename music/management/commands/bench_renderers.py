@@ -0,0 +1,54 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from music.models import Song
+from music.renderers import ORJSONRenderer, MessagePackRenderer, orjson, msgpack, STREAM_CHUNK_SIZE
+from music.serializers import SongSerializer
+
+
+class Command(BaseCommand):
+    help = "Compares DRF's JSONRenderer with the orjson and MessagePack renderers on a large song list"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        songs = list(Song.objects.select_related('user', 'album', 'genre').order_by('id')[:options['rows']])
+        data = SongSerializer(songs, many=True).data
+        chunks = [data[i:i + STREAM_CHUNK_SIZE] for i in range(0, len(data), STREAM_CHUNK_SIZE)]
+        self.stdout.write(f"{len(data)} serialized songs")
+
+        renderers = [('drf json', JSONRenderer())]
+        if orjson:
+            renderers.append(('orjson', ORJSONRenderer()))
+        if msgpack:
+            renderers.append(('msgpack', MessagePackRenderer()))
+
+        for name, renderer in renderers:
+            self.report(name, lambda: renderer.render(data), options['repeat'])
+            if hasattr(renderer, 'render_stream'):
+                self.report(f"{name} stream", lambda: b''.join(renderer.render_stream(chunks)), options['repeat'],
+                            peak=lambda: max(map(len, renderer.render_stream(chunks))))
+
+    def report(self, name, render, repeat, peak=None):
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            body = render()
+            best = min(best, time.perf_counter() - start)
+
+        # The largest buffer the encoder holds at once: the whole body, or
+        # the biggest chunk when streaming.
+        if peak:
+            largest = peak()
+        else:
+            tracemalloc.start()
+            render()
+            _, largest = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        self.stdout.write(f"{name:<16} {best * 1000:8.1f} ms  {len(body) / 1e6:6.2f} MB  "
+                          f"largest buffer {largest / 1e6:6.2f} MB")
@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from music.viewsets import SongViewSet, AlbumViewSet
+
+VARIANTS = [
+    (SongViewSet, ''),
+    (SongViewSet, 'fields=id,title,user'),
+    (SongViewSet, 'fields=id,title,user,genre,album'),
+    (SongViewSet, 'fields=id,title,user,genre&expand=genre'),
+    (AlbumViewSet, ''),
+    (AlbumViewSet, 'fields=id,title'),
+]
+
+
+class Command(BaseCommand):
+    help = "Compares query time, serialization time and payload size of song/album lists with ?fields="
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        for viewset, query in VARIANTS:
+            view = viewset()
+            view.request = Request(factory.get(f'/?{query}'))
+            view.format_kwarg = None
+            view.action = 'list'
+
+            best_query = best_render = float('inf')
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                rows = list(view.get_queryset().order_by('id')[:options['rows']])
+                queried = time.perf_counter()
+                payload = JSONRenderer().render(view.get_serializer(rows, many=True).data)
+                best_query = min(best_query, queried - start)
+                best_render = min(best_render, time.perf_counter() - queried)
+
+            self.stdout.write(
+                f"{viewset.__name__:<13} {query or '(all fields)':<42} "
+                f"query {best_query * 1000:7.1f} ms  serialize {best_render * 1000:7.1f} ms  "
+                f"{len(payload) / len(rows):6.0f} B/row"
+            )
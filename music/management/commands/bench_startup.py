@@ -0,0 +1,113 @@
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Not committed: cold start depends on the host's disk, CPU and installed
+# packages, so each host that wants the check saves its own with --save.
+BASELINE = Path(settings.BASE_DIR) / 'music' / 'benchmarks' / 'startup.json'
+# What a worker does before serving its first request: load the WSGI
+# application (settings, apps, middleware) and the URLconf with every view.
+COLD_START = (
+    "import Spotify_Clone.wsgi\n"
+    "from django.urls import get_resolver\n"
+    "get_resolver().url_patterns\n"
+)
+
+
+def group_of(module):
+    """The app or distribution a module is attributed to"""
+    top = module.split('.')[0]
+    if top in sys.stdlib_module_names or top.startswith('_'):
+        return 'stdlib'
+    return top
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures worker cold start: a fresh interpreter loading the WSGI application and the "
+        "URLconf, best of --runs. Reports -X importtime self time per app and third-party "
+        "package. The comparison is opt-in: run once with --save on the host that checks, "
+        "after which a total slower than that baseline by more than --threshold exits non-zero. "
+        "A baseline saved on another host is shown but never fails the run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--baseline', default=str(BASELINE))
+        parser.add_argument('--save', action='store_true', help="Write this run as the new baseline")
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help="Allowed slowdown, as a fraction of the baseline")
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('--top', type=int, default=15, help="Packages to list")
+
+    def handle(self, *args, **options):
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE}
+        # The first run also warms the bytecode cache, like a deployed worker has.
+        self.cold_start(env)
+        seconds = min(self.cold_start(env) for _ in range(options['runs']))
+        packages = self.import_times(env)
+
+        path = Path(options['baseline'])
+        if options['save']:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps({
+                'host': platform.node(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'seconds': seconds,
+                'import_seconds': packages,
+            }, indent=2, sort_keys=True) + "\n")
+            self.stdout.write(f"Saved a cold start of {seconds * 1000:.0f} ms to {path}")
+            return
+
+        baseline = json.loads(path.read_text()) if path.exists() else {}
+        before = baseline.get('import_seconds', {})
+        self.stdout.write(f"{'package':<28}{'import ms':>12}{'baseline':>12}")
+        for name, value in list(packages.items())[:options['top']]:
+            line = f"{name:<28}{value * 1000:>12.1f}"
+            if name in before:
+                line += f"{before[name] * 1000:>12.1f}"
+            self.stdout.write(line)
+
+        line = f"Cold start: {seconds * 1000:.0f} ms"
+        if 'seconds' in baseline:
+            change = seconds / baseline['seconds'] - 1
+            line += f" (baseline {baseline['seconds'] * 1000:.0f} ms, {change:+.0%})"
+        self.stdout.write(line)
+        if not baseline:
+            self.stdout.write(f"No baseline at {path}; save one with --save to compare future runs")
+            return
+        if baseline.get('host') != platform.node():
+            self.stdout.write(f"Not comparing: the baseline was saved on {baseline.get('host') or 'another host'}")
+            return
+        if seconds > baseline['seconds'] * (1 + options['threshold']):
+            raise CommandError(f"Cold start is slower than the baseline by more than {options['threshold']:.0%}")
+
+    def cold_start(self, env):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', COLD_START], env=env, check=True)
+        return time.perf_counter() - start
+
+    def import_times(self, env):
+        """Self import time per group in seconds, the largest first"""
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', COLD_START],
+                                env=env, check=True, capture_output=True, text=True)
+        totals = defaultdict(float)
+        for line in result.stderr.splitlines():
+            # "import time:  self [us] | cumulative | imported package"
+            if not line.startswith('import time:'):
+                continue
+            self_us, _, module = line[len('import time:'):].split('|')
+            if not self_us.strip().isdigit():
+                continue
+            totals[group_of(module.strip())] += int(self_us) / 1e6
+        return {name: round(seconds, 6)
+                for name, seconds in sorted(totals.items(), key=lambda item: item[1], reverse=True)}
@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from music.throttling import FIXED_WINDOW, SLIDING_WINDOW, RouteThrottle
+from music.viewsets import SongViewSet
+
+
+class Command(BaseCommand):
+    help = "Measures throughput of the API throttle under a flood of rejected requests"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20000)
+
+    def handle(self, *args, **options):
+        total = options['requests']
+        factory = APIRequestFactory()
+        view = SongViewSet.as_view({'get': 'random'}, basename='song')
+
+        for strategy in (FIXED_WINDOW, SLIDING_WINDOW):
+            # A zero rate rejects every request, so nothing reaches the database.
+            throttles = {'song-random': {'strategy': strategy, 'rates': {'default': '0/min'}}}
+            with override_settings(API_THROTTLES=throttles):
+                request = factory.get('/api/songs/random/', REMOTE_ADDR='10.0.0.1')
+                response = view(request)
+                if response.status_code != 429:
+                    self.stderr.write(f"Expected 429, got {response.status_code}")
+                    return
+
+                start = time.perf_counter()
+                for _ in range(total):
+                    view(factory.get('/api/songs/random/', REMOTE_ADDR='10.0.0.1'))
+                self.report(strategy, 'full dispatch', total, time.perf_counter() - start)
+
+                drf_request = Request(factory.get('/api/songs/random/', REMOTE_ADDR='10.0.0.1'))
+                viewset = SongViewSet(basename='song', action='random', request=drf_request)
+                throttle = RouteThrottle()
+                start = time.perf_counter()
+                for _ in range(total):
+                    throttle.allow_request(drf_request, viewset)
+                self.report(strategy, 'throttle only', total, time.perf_counter() - start)
+
+    def report(self, strategy, label, total, elapsed):
+        self.stdout.write(
+            f"{strategy:<15} {label:<14} {total} rejected in {elapsed:.3f}s "
+            f"({total / elapsed:,.0f} req/s, {elapsed / total * 1e6:.1f} us/req)"
+        )
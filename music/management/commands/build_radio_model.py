@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from music.radio import build_model, TOP_SUCCESSORS
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the next-track model used by the radio endpoint from listening history"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=TOP_SUCCESSORS,
+                            help="Successors kept per song")
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        rows = build_model(options['top'], options['chunk_size'])
+        self.stdout.write(f"Stored successors for {rows} songs in {time.perf_counter() - start:.1f}s")
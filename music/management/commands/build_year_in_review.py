@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from music.year_review import build_year
+
+
+class Command(BaseCommand):
+    help = "Computes every user's year-in-review summary in one streaming pass"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, default=timezone.now().year - 1)
+        parser.add_argument('--workers', type=int, default=1)
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        total = build_year(
+            options['year'], options['workers'], options['chunk_size'],
+            progress=lambda done: self.stdout.write(f"{done} users summarized")
+        )
+        self.stdout.write(f"Stored {total} summaries for {options['year']} "
+                          f"in {time.perf_counter() - start:.1f}s")
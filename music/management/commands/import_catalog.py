@@ -0,0 +1,169 @@
+import csv
+import json
+import os
+import time
+import uuid
+from datetime import date
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from music.album_totals import refresh_totals
+from music.models import Song, Genre, Album
+from music.music_enum import Visibility
+from music.utils import clean_title, title_key
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-imports songs from a CSV or JSONL file. Each row has title, duration, "
+        "release_date, audio_file and optionally artist (username), album, album_release_date, "
+        "genre, visibility and licensing_info. Genres and albums are matched by title, "
+        "ignoring case and extra whitespace, and created as needed. Rows are committed in chunks and the command can resume after a crash."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help="Defaults to the file extension")
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--resume', action='store_true',
+                            help="Skip rows committed by a previous run of the same file")
+        parser.add_argument('--source-id',
+                            help="Stable name of this file for ids and resume; defaults to the file name")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        self.verbosity = options['verbosity']
+        if not os.path.exists(path):
+            raise CommandError(f"{path} does not exist")
+        fmt = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        self.source_id = options['source_id'] or os.path.basename(path)
+        checkpoint = f"{path}.progress"
+
+        skip = 0
+        if options['resume'] and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                skip = int(f.read().strip() or 0)
+            self.stdout.write(f"Resuming after row {skip}")
+
+        self.genres = self.existing(Genre)
+        self.albums = self.existing(Album)
+        self.artists = {}
+
+        start = time.perf_counter()
+        done, written, skipped, present = skip, 0, 0, 0
+        with open(path, newline='') as f:
+            rows = enumerate(self.read_rows(f, fmt))
+            rows = islice(rows, skip, None)
+            while True:
+                chunk = list(islice(rows, options['chunk_size']))
+                if not chunk:
+                    break
+                with transaction.atomic():
+                    songs, invalid = self.build_songs(chunk)
+                    # Rows imported by an earlier run keep their ids; leave them out of the count.
+                    imported = set(Song.objects.filter(pk__in=[song.pk for song in songs])
+                                   .values_list('pk', flat=True))
+                    songs = [song for song in songs if song.pk not in imported]
+                    Song.objects.bulk_create(songs, batch_size=1000, ignore_conflicts=True)
+                    # bulk_create skips the signals that keep album totals current.
+                    refresh_totals({song.album_id for song in songs} - {None})
+                done = chunk[-1][0] + 1
+                written += len(songs)
+                skipped += invalid
+                present += len(imported)
+                with open(checkpoint, 'w') as cp:
+                    cp.write(str(done))
+                elapsed = time.perf_counter() - start
+                self.stdout.write(f"{done} rows ({written / elapsed:,.0f} songs/s, {skipped} invalid)")
+
+        self.stdout.write(f"Wrote {written} songs in {time.perf_counter() - start:.1f}s; "
+                          f"{skipped} invalid rows and {present} already imported skipped")
+
+    def read_rows(self, f, fmt):
+        if fmt == 'csv':
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                line = line.strip()
+                try:
+                    yield json.loads(line) if line else {}
+                except json.JSONDecodeError:
+                    # Counted as an invalid row by build_songs.
+                    yield None
+
+    def song_id(self, row_number):
+        """Deterministic ids make re-imported rows conflict instead of duplicating."""
+        return uuid.uuid5(uuid.NAMESPACE_URL, f"catalog-import:{self.source_id}:{row_number}")
+
+    def resolve_artists(self, chunk):
+        names = {row.get('artist') for _, row in chunk if isinstance(row, dict)} - set(self.artists) - {None, ''}
+        if names:
+            found = dict(User.objects.filter(username__in=names).values_list('username', 'id'))
+            for name in names:
+                self.artists[name] = found.get(name)
+
+    def existing(self, model):
+        """title_key -> id of the oldest row with that key, as music.utils resolves them"""
+        return dict(model.objects.order_by('-created_at', '-id').values_list('title_key', 'id'))
+
+    def resolve(self, cache, model, title, release_date):
+        """
+        Returns the id for a title, queueing a new row if it is not known yet.
+        Titles are cut to the column's length, like song titles.
+        """
+        max_length = model._meta.get_field('title').max_length
+        title = clean_title(str(title))[:max_length].rstrip() if title else ''
+        if not title:
+            return None
+        key = title_key(title)
+        if key not in cache:
+            fields = {'title': title, 'title_key': key}
+            if model is Album:
+                fields['release_date'] = release_date
+            obj = model(**fields)
+            cache[key] = obj.id
+            self.new_objects[model].append(obj)
+        return cache[key]
+
+    def build_songs(self, chunk):
+        self.resolve_artists(chunk)
+        self.new_objects = {Genre: [], Album: []}
+        songs, invalid = [], 0
+
+        for row_number, row in chunk:
+            try:
+                if not isinstance(row, dict):
+                    raise TypeError(f"Not an object: {row!r}")
+                release_date = date.fromisoformat(row['release_date'])
+                album_date = row.get('album_release_date')
+                album_date = date.fromisoformat(album_date) if album_date else release_date
+                duration = int(row['duration'])
+                if duration < 0:
+                    raise ValueError(f"Negative duration: {duration}")
+                song = Song(
+                    id=self.song_id(row_number),
+                    title=row['title'][:Song.TITLE_MAX_LENGTH],
+                    duration=duration,
+                    release_date=release_date,
+                    audio_file=row['audio_file'],
+                    user_id=self.artists.get(row.get('artist')),
+                    visibility=Visibility(int(row.get('visibility') or Visibility.PUBLIC.value)).value,
+                    licensing_info=row.get('licensing_info') or None,
+                )
+            except (KeyError, ValueError, TypeError):
+                invalid += 1
+                if self.verbosity > 1:
+                    self.stderr.write(f"Row {row_number} is invalid: {row}")
+                continue
+            # Resolved only for valid rows, so a rejected row creates no genre or album.
+            song.genre_id = self.resolve(self.genres, Genre, row.get('genre'), None)
+            song.album_id = self.resolve(self.albums, Album, row.get('album'), album_date)
+            songs.append(song)
+
+        for model, objects in self.new_objects.items():
+            model.objects.bulk_create(objects, batch_size=1000)
+        return songs, invalid
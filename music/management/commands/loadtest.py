@@ -0,0 +1,197 @@
+import http.client
+import random
+import statistics
+import threading
+import time
+from collections import Counter, defaultdict
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+from music.management.commands.seed_scale import zipf_cum_weights
+from music.models import Song
+from music.music_enum import Visibility
+from users.models import User, UserProfile
+from users.role_enum import RoleEnum
+
+SEARCH_TERMS = ['love', 'night', 'track', 'vol', 'pop', 'rock', 'blue', 'seed0-artist1']
+
+
+class Catalog:
+    """Ids the scenarios pick from, most popular first and picked more often"""
+
+    def __init__(self, songs, skew):
+        self.songs = [str(song_id) for song_id, _, _ in songs]
+        self.albums = list(dict.fromkeys(str(album_id) for _, album_id, _ in songs if album_id))
+        self.artists = list(dict.fromkeys(str(artist_id) for _, _, artist_id in songs if artist_id))
+        self.weights = {
+            name: zipf_cum_weights(len(ids), skew)
+            for name, ids in [('songs', self.songs), ('albums', self.albums), ('artists', self.artists)]
+        }
+
+    def pick(self, name, k=1):
+        ids = getattr(self, name)
+        if not ids:
+            raise CommandError(f"No {name} in the catalog for this scenario")
+        picks = random.choices(ids, cum_weights=self.weights[name], k=k)
+        return picks[0] if k == 1 else picks
+
+
+def hot_paths(catalog):
+    """The write-heavy mix served by music.async_views under ASGI."""
+    song = f"/api/songs/{catalog.pick('songs')}"
+    return random.choices([
+        ('song-play', 'POST', f"{song}/play/"),
+        ('song-like', 'POST', f"{song}/like/"),
+        ('song-unlike', 'POST', f"{song}/unlike/"),
+        ('song-favorite', 'POST', f"{song}/favorite/"),
+        ('song-favorite', 'DELETE', f"{song}/favorite/"),
+        ('song-recently_played', 'GET', "/api/songs/recently_played/?limit=20"),
+    ], weights=[60, 10, 10, 5, 5, 10])[0]
+
+
+def browse(catalog):
+    """Read-only catalog traffic: song, album and artist pages, charts and search."""
+    route = random.choices([
+        'song-detail', 'song-trending', 'song-batch', 'song-search', 'album-detail',
+        'album-songs', 'artist-profile', 'artist-songs', 'song-recently_played',
+    ], weights=[25, 10, 10, 5, 10, 10, 10, 10, 10])[0]
+    if route == 'song-detail':
+        return route, 'GET', f"/api/songs/{catalog.pick('songs')}/"
+    if route == 'song-trending':
+        return route, 'GET', "/api/songs/trending/?limit=20"
+    if route == 'song-batch':
+        return route, 'GET', f"/api/songs/batch/?ids={','.join(set(catalog.pick('songs', 20)))}"
+    if route == 'song-search':
+        return route, 'GET', f"/api/songs/search/?type=song&q={random.choice(SEARCH_TERMS)}"
+    if route == 'album-detail':
+        return route, 'GET', f"/api/albums/{catalog.pick('albums')}/"
+    if route == 'album-songs':
+        return route, 'GET', f"/api/albums/{catalog.pick('albums')}/songs/"
+    if route == 'artist-profile':
+        return route, 'GET', f"/api/artists/{catalog.pick('artists')}/profile/"
+    if route == 'artist-songs':
+        return route, 'GET', f"/api/artists/{catalog.pick('artists')}/songs/"
+    return route, 'GET', "/api/songs/recently_played/?limit=20"
+
+
+def mixed(catalog):
+    """Browsing with the hot write paths mixed in, roughly what listeners do."""
+    return browse(catalog) if random.random() < 0.8 else hot_paths(catalog)
+
+
+SCENARIOS = {
+    'hot': hot_paths,
+    'browse': browse,
+    'mixed': mixed,
+}
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Replays a traffic scenario against a running server from concurrent keep-alive "
+        "connections and reports throughput and p50/p95/p99 latency per route. Songs, albums "
+        "and artists are picked with Zipf skew from the most played public songs; seed a "
+        "realistic database first with seed_scale. Run it against the WSGI and the ASGI "
+        "deployment with the same options to compare them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--scenario', choices=list(SCENARIOS), default='hot')
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--users', type=int, default=50,
+                            help="Listener accounts to spread requests over; created if missing")
+        parser.add_argument('--songs', type=int, default=1000,
+                            help="Number of public songs the requests pick from")
+        parser.add_argument('--skew', type=float, default=1.1, help="Zipf exponent for picking ids")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['base_url'])
+        if url.scheme != 'http':
+            raise CommandError("Only http:// base URLs are supported")
+        random.seed(options['seed'])
+
+        songs = list(Song.objects.filter(visibility=Visibility.PUBLIC.value)
+                     .order_by('-play_count').values_list('id', 'album_id', 'user_id')[:options['songs']])
+        if not songs:
+            raise CommandError("No public songs; run seed_scale or import_catalog first")
+        catalog = Catalog(songs, options['skew'])
+        tokens = self.tokens(options['users'])
+        scenario = SCENARIOS[options['scenario']]
+
+        remaining = iter(range(options['requests']))
+        lock = threading.Lock()
+        latencies, statuses = defaultdict(list), defaultdict(Counter)
+
+        def worker():
+            connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+            while True:
+                with lock:
+                    if next(remaining, None) is None:
+                        break
+                    route, method, path = scenario(catalog)
+                    headers = {'Authorization': f"Token {random.choice(tokens)}", 'Content-Length': '0'}
+                start = time.perf_counter()
+                try:
+                    connection.request(method, path, headers=headers)
+                    response = connection.getresponse()
+                    response.read()
+                    status = response.status
+                except (OSError, http.client.HTTPException) as exc:
+                    connection.close()
+                    status = type(exc).__name__
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies[route].append(elapsed)
+                    statuses[route][status] += 1
+            connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(options['concurrency'])]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        total = time.perf_counter() - start
+
+        everything = sorted(value for values in latencies.values() for value in values)
+        self.stdout.write(
+            f"{len(everything)} requests, concurrency {options['concurrency']}: "
+            f"{len(everything) / total:,.0f} req/s, "
+            f"mean {statistics.fmean(everything) * 1000:.1f} ms, "
+            f"p50 {percentile(everything, 50) * 1000:.1f} ms, "
+            f"p95 {percentile(everything, 95) * 1000:.1f} ms, "
+            f"p99 {percentile(everything, 99) * 1000:.1f} ms"
+        )
+        self.stdout.write(f"{'route':<24}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}  statuses")
+        for route in sorted(latencies):
+            values = sorted(latencies[route])
+            self.stdout.write(
+                f"{route:<24}{len(values):>7}"
+                f"{percentile(values, 50) * 1000:>10.1f}{percentile(values, 95) * 1000:>10.1f}"
+                f"{percentile(values, 99) * 1000:>10.1f}  "
+                + ", ".join(f"{k}={v}" for k, v in sorted(statuses[route].items(), key=str))
+            )
+
+    def tokens(self, count):
+        tokens = []
+        for i in range(count):
+            user, created = User.objects.get_or_create(
+                username=f"loadtest-{i}",
+                defaults={'email': f"loadtest-{i}@example.com", 'role': RoleEnum.USER.value},
+            )
+            if created:
+                UserProfile.objects.create(user=user, profile_type=RoleEnum.USER.value)
+            token, _ = Token.objects.get_or_create(user=user)
+            tokens.append(token.key)
+        return tokens
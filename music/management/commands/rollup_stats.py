@@ -0,0 +1,37 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from music import stats
+
+
+class Command(BaseCommand):
+    help = ("Compacts hourly song stats into daily and monthly rollups and prunes old hourly rows. "
+            "Schedule it every few minutes; each run rebuilds the recent days, and every day "
+            "since the last run's watermark if it is older.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=2,
+                            help="Number of recent days to rebuild at least, including today")
+        parser.add_argument('--since', help="Rebuild from this date (YYYY-MM-DD) instead")
+        parser.add_argument('--no-prune', action='store_true')
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        first_day = today - timedelta(days=options['days'] - 1)
+        watermark = stats.rollup_watermark()
+        if watermark is not None:
+            # Catch up on the days missed while the job was not running.
+            first_day = min(first_day, watermark)
+        if options['since']:
+            first_day = date.fromisoformat(options['since'])
+        try:
+            written = stats.rollup(first_day, today)
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(f"Rolled up {first_day} to {today} into {written} daily rows")
+
+        if options['no_prune']:
+            return
+        self.stdout.write(f"Pruned {stats.prune_hourly()} hourly rows")
@@ -0,0 +1,255 @@
+import random
+import time
+import uuid
+from collections import Counter
+from datetime import date, timedelta
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from music.album_totals import refresh_totals
+from music.models import Album, ArtistFollow, Genre, RecentlyPlayed, Song, SongLike, SongPlay, title_key
+from music.music_enum import Visibility
+from users.models import User, UserProfile
+from users.role_enum import RoleEnum
+
+COUNTS = ['users', 'artists', 'songs', 'likes', 'follows', 'plays']
+GENRES = [
+    'Pop', 'Hip-Hop', 'Rock', 'Electronic', 'R&B', 'Latin', 'Country', 'Indie', 'Jazz', 'Classical',
+    'Metal', 'K-Pop', 'Reggaeton', 'Folk', 'Soul', 'Punk', 'Blues', 'Ambient', 'Afrobeats', 'Lo-Fi',
+]
+TRACKS_PER_ALBUM = 10
+PRIVATE_SHARE = 0.02
+# Listeners are skewed too, but less than what they listen to.
+LISTENER_SKEW = 0.8
+
+
+def zipf_cum_weights(n, exponent=1.0):
+    """
+    Cumulative Zipf weights for ranks 0..n-1, for random.choices(cum_weights=...).
+    Rank 0 is the most popular; seed_scale and loadtest use these to skew picks.
+    """
+    total, weights = 0.0, []
+    for rank in range(1, n + 1):
+        total += rank ** -exponent
+        weights.append(total)
+    return weights
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates a production-sized dataset: users, artists, albums, songs, likes, follows and "
+        "plays (recently played rows and the play history), bulk-inserted in chunks, with "
+        "plays spread over the last --days. Song, artist and genre popularity follow a Zipf "
+        "distribution, so a few whale artists own many songs and most followers. The same "
+        "--seed and counts always produce the same rows; rerunning skips rows already there."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1_000_000, help="Accounts, artists included")
+        parser.add_argument('--artists', type=int, default=20_000)
+        parser.add_argument('--songs', type=int, default=2_000_000)
+        parser.add_argument('--likes', type=int, default=5_000_000)
+        parser.add_argument('--follows', type=int, default=2_000_000)
+        parser.add_argument('--plays', type=int, default=10_000_000)
+        parser.add_argument('--days', type=int, default=365,
+                            help="Plays are spread over this many days before now")
+        parser.add_argument('--scale', type=float, default=1.0,
+                            help="Multiplies every count, e.g. 0.01 for a quick local dataset")
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help="Zipf exponent for song, artist and genre popularity")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--chunk-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        self.counts = {name: max(1, int(options[name] * options['scale'])) for name in COUNTS}
+        if self.counts['artists'] > self.counts['users']:
+            raise CommandError("--artists cannot exceed --users")
+        self.seed = options['seed']
+        self.skew = options['skew']
+        self.chunk_size = options['chunk_size']
+        self.days = options['days']
+        self.now = timezone.now()
+        self.verbosity = options['verbosity']
+        self.rng = random.Random(self.seed)
+        self.stdout.write(", ".join(f"{count:,} {name}" for name, count in self.counts.items()))
+
+        start = time.perf_counter()
+        self.insert(User, self.users(), self.counts['users'])
+        self.insert(UserProfile, self.profiles(), self.counts['users'])
+        genres = self.genres()
+        albums, songs = self.catalog(genres)
+        self.insert(Album, albums, None)
+        self.insert(Song, songs, self.counts['songs'])
+        self.insert(SongLike, self.likes(), self.counts['likes'])
+        self.insert(ArtistFollow, self.follows(), self.counts['follows'])
+        self.insert(RecentlyPlayed, self.plays(), self.counts['plays'])
+        self.insert(SongPlay, self.play_history(), self.counts['plays'])
+        self.recount_likes()
+        self.recount_albums()
+        self.stdout.write(f"Done in {time.perf_counter() - start:.1f}s")
+
+    def id(self, kind, key):
+        """Deterministic ids make a rerun conflict with its own rows instead of duplicating them."""
+        return uuid.uuid5(uuid.NAMESPACE_URL, f"seed-scale:{self.seed}:{kind}:{key}")
+
+    def insert(self, model, rows, total):
+        """Bulk-inserts rows from an iterator, one transaction per chunk"""
+        start = time.perf_counter()
+        done = 0
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                break
+            with transaction.atomic():
+                model.objects.bulk_create(chunk, batch_size=1000, ignore_conflicts=True)
+            done += len(chunk)
+            if self.verbosity > 1 and total:
+                self.stdout.write(f"  {model.__name__}: {done:,}/{total:,}")
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"{model.__name__}: {done:,} rows in {elapsed:.1f}s ({done / elapsed:,.0f}/s)")
+
+    # Users 0..artists-1 are the artists; artist rank 0 is the biggest whale.
+
+    def username(self, n):
+        kind = 'artist' if n < self.counts['artists'] else 'user'
+        return f"seed{self.seed}-{kind}{n}"
+
+    def role(self, n):
+        return RoleEnum.ARTIST.value if n < self.counts['artists'] else RoleEnum.USER.value
+
+    def users(self):
+        # Seeded accounts cannot log in; tokens are enough for load tests.
+        password = make_password(None)
+        for n in range(self.counts['users']):
+            name = self.username(n)
+            yield User(id=self.id('user', n), username=name, email=f"{name}@example.com",
+                       password=password, role=self.role(n))
+
+    def profiles(self):
+        for n in range(self.counts['users']):
+            yield UserProfile(id=self.id('profile', n), user_id=self.id('user', n), profile_type=self.role(n))
+
+    def genres(self):
+        existing = dict(Genre.objects.filter(title__in=GENRES).values_list('title', 'id'))
+        missing = [Genre(title=title, title_key=title_key(title)) for title in GENRES if title not in existing]
+        Genre.objects.bulk_create(missing)
+        existing.update((genre.title, genre.id) for genre in missing)
+        return [existing[title] for title in GENRES]
+
+    def catalog(self, genres):
+        """
+        Albums and songs. Song n has popularity rank n; its artist is drawn by
+        artist popularity, and each artist's songs are grouped into albums.
+        """
+        songs, artists = self.counts['songs'], self.counts['artists']
+        artist_of = self.rng.choices(range(artists), cum_weights=zipf_cum_weights(artists, self.skew), k=songs)
+
+        album_dates = {}
+        for artist, tracks in sorted(Counter(artist_of).items()):
+            for number in range(-(-tracks // TRACKS_PER_ALBUM)):
+                album_dates[artist, number] = date(2005, 1, 1) + timedelta(days=self.rng.randrange(20 * 365))
+        titles = {(artist, number): f"{self.username(artist)} vol. {number + 1}" for artist, number in album_dates}
+        albums = (
+            Album(id=self.id('album', f"{artist}:{number}"), user_id=self.id('user', artist),
+                  title=titles[artist, number], title_key=title_key(titles[artist, number]),
+                  release_date=released)
+            for (artist, number), released in album_dates.items()
+        )
+
+        # play_count is each song's share of --plays under the popularity curve.
+        song_weights = zipf_cum_weights(songs, self.skew)
+        plays_per_weight = self.counts['plays'] / song_weights[-1]
+        genre_weights = zipf_cum_weights(len(genres), self.skew)
+
+        def rows():
+            tracks = Counter()
+            previous = 0.0
+            for n, artist in enumerate(artist_of):
+                number = tracks[artist] // TRACKS_PER_ALBUM
+                tracks[artist] += 1
+                weight, previous = song_weights[n] - previous, song_weights[n]
+                visibility = Visibility.PRIVATE if self.rng.random() < PRIVATE_SHARE else Visibility.PUBLIC
+                yield Song(
+                    id=self.id('song', n),
+                    user_id=self.id('user', artist),
+                    album_id=self.id('album', f"{artist}:{number}"),
+                    title=f"Track {tracks[artist]} by {self.username(artist)}",
+                    duration=self.rng.randint(90, 420),
+                    genre_id=self.rng.choices(genres, cum_weights=genre_weights)[0],
+                    release_date=album_dates[artist, number],
+                    audio_file=f"https://example.com/seed/{n}.mp3",
+                    play_count=round(weight * plays_per_weight),
+                    visibility=visibility.value,
+                )
+        return albums, rows()
+
+    def pairs(self, total, left, right, skews):
+        """
+        Distinct (left, right) index pairs drawn by popularity, numbered for
+        their ids. Repeats within a chunk are dropped here and repeats across
+        chunks by the unique constraints, so fewer than total rows remain.
+        """
+        left_weights = zipf_cum_weights(left, skews[0])
+        right_weights = zipf_cum_weights(right, skews[1])
+        drawn = n = 0
+        while drawn < total:
+            size = min(self.chunk_size, total - drawn)
+            drawn += size
+            chunk = zip(self.rng.choices(range(left), cum_weights=left_weights, k=size),
+                        self.rng.choices(range(right), cum_weights=right_weights, k=size))
+            for pair in dict.fromkeys(chunk):
+                yield n, pair
+                n += 1
+
+    def likes(self):
+        for n, (user, song) in self.pairs(self.counts['likes'], self.counts['users'],
+                                          self.counts['songs'], (LISTENER_SKEW, self.skew)):
+            yield SongLike(id=self.id('like', n), user_id=self.id('user', user), song_id=self.id('song', song))
+
+    def follows(self):
+        for n, (user, artist) in self.pairs(self.counts['follows'], self.counts['users'],
+                                            self.counts['artists'], (LISTENER_SKEW, self.skew)):
+            if user != artist:
+                yield ArtistFollow(id=self.id('follow', n), user_id=self.id('user', user),
+                                   artist_id=self.id('user', artist))
+
+    def played_at(self):
+        return self.now - timedelta(seconds=self.rng.randrange(self.days * 86400))
+
+    def plays(self):
+        # RecentlyPlayed keeps one row per listener and song, so repeat plays collapse.
+        for n, (user, song) in self.pairs(self.counts['plays'], self.counts['users'],
+                                          self.counts['songs'], (LISTENER_SKEW, self.skew)):
+            yield RecentlyPlayed(id=self.id('play', n), user_id=self.id('user', user),
+                                 song_id=self.id('song', song), played_at=self.played_at())
+
+    def play_history(self):
+        """SongPlay rows, one per play, repeats included, for year-in-review and radio"""
+        user_weights = zipf_cum_weights(self.counts['users'], LISTENER_SKEW)
+        song_weights = zipf_cum_weights(self.counts['songs'], self.skew)
+        for start in range(0, self.counts['plays'], self.chunk_size):
+            size = min(self.chunk_size, self.counts['plays'] - start)
+            users = self.rng.choices(range(self.counts['users']), cum_weights=user_weights, k=size)
+            songs = self.rng.choices(range(self.counts['songs']), cum_weights=song_weights, k=size)
+            for n, (user, song) in enumerate(zip(users, songs), start):
+                yield SongPlay(id=self.id('song-play', n), user_id=self.id('user', user),
+                               song_id=self.id('song', song), played_at=self.played_at())
+
+    def recount_likes(self):
+        """Song.likes must agree with SongLike for the unlike path to stay consistent."""
+        start = time.perf_counter()
+        likes = SongLike.objects.filter(song=OuterRef('pk')).values('song').annotate(n=Count('id')).values('n')
+        updated = Song.objects.update(likes=Coalesce(Subquery(likes), Value(0)))
+        self.stdout.write(f"Recounted likes on {updated:,} songs in {time.perf_counter() - start:.1f}s")
+
+    def recount_albums(self):
+        """bulk_create skips the signals that keep album totals current."""
+        start = time.perf_counter()
+        updated = refresh_totals()
+        self.stdout.write(f"Recounted tracks on {updated:,} albums in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,36 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = ("Copies the SQLite primary database over its local replica files (SQLITE_REPLICAS), "
+            "standing in for replication. Leave a replica out to watch reads skip it once it lags.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('aliases', nargs='*', help="Replicas to refresh; all of them by default")
+
+    def handle(self, *args, **options):
+        if connections[DEFAULT_DB_ALIAS].vendor != 'sqlite':
+            raise CommandError("Only SQLite replicas are synced locally; real replicas replicate themselves")
+        aliases = options['aliases'] or settings.REPLICA_DATABASES
+        unknown = set(aliases) - set(settings.REPLICA_DATABASES)
+        if unknown:
+            raise CommandError(f"Not a replica: {', '.join(sorted(unknown))}")
+        if not aliases:
+            raise CommandError("No replicas configured; set SQLITE_REPLICAS")
+
+        primary = sqlite3.connect(settings.DATABASES[DEFAULT_DB_ALIAS]['NAME'])
+        try:
+            for alias in aliases:
+                replica = sqlite3.connect(settings.DATABASES[alias]['NAME'])
+                try:
+                    # The backup API copies a consistent snapshot even while the primary is being written.
+                    primary.backup(replica)
+                finally:
+                    replica.close()
+                self.stdout.write(f"Synced {alias}")
+        finally:
+            primary.close()
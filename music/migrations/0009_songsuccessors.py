@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:22
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0008_playlist_playlistitem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SongSuccessors',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('data', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('song', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='successors', to='music.song')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:23
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0009_songsuccessors'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListeningSummary',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('year', models.PositiveIntegerField()),
+                ('play_count', models.PositiveIntegerField(default=0)),
+                ('minutes_listened', models.PositiveIntegerField(default=0)),
+                ('top_songs', models.JSONField(default=list)),
+                ('top_artists', models.JSONField(default=list)),
+                ('top_genres', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='listening_summaries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'year')},
+            },
+        ),
+    ]
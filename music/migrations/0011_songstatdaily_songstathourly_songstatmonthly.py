@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:24
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0010_listeningsummary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SongStatDaily',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('plays', models.IntegerField(default=0)),
+                ('likes', models.IntegerField(default=0)),
+                ('favorites', models.IntegerField(default=0)),
+                ('day', models.DateField()),
+                ('artist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('song', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='music.song')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['artist', 'day'], name='music_songs_artist__938475_idx')],
+                'constraints': [models.UniqueConstraint(fields=('song', 'day'), name='unique_song_stat_day'), models.UniqueConstraint(condition=models.Q(('song', None)), fields=('artist', 'day'), name='unique_artist_stat_day')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SongStatHourly',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('plays', models.IntegerField(default=0)),
+                ('likes', models.IntegerField(default=0)),
+                ('favorites', models.IntegerField(default=0)),
+                ('hour', models.DateTimeField()),
+                ('artist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('song', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='music.song')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['artist', 'hour'], name='music_songs_artist__622023_idx'), models.Index(fields=['hour'], name='music_songs_hour_957663_idx')],
+                'unique_together': {('song', 'hour')},
+            },
+        ),
+        migrations.CreateModel(
+            name='SongStatMonthly',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('plays', models.IntegerField(default=0)),
+                ('likes', models.IntegerField(default=0)),
+                ('favorites', models.IntegerField(default=0)),
+                ('month', models.DateField()),
+                ('artist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('song', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='music.song')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['artist', 'month'], name='music_songs_artist__37d9b5_idx')],
+                'constraints': [models.UniqueConstraint(fields=('song', 'month'), name='unique_song_stat_month'), models.UniqueConstraint(condition=models.Q(('song', None)), fields=('artist', 'month'), name='unique_artist_stat_month')],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:28
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0011_songstatdaily_songstathourly_songstatmonthly'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='song',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='song',
+            index=models.Index(fields=['updated_at', 'id'], name='music_song_updated_62856c_idx'),
+        ),
+    ]
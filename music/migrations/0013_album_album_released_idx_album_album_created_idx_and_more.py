@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0012_song_updated_at_song_music_song_updated_62856c_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='album',
+            index=models.Index(fields=['-release_date'], name='album_released_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='album',
+            index=models.Index(fields=['-created_at'], name='album_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='song',
+            index=models.Index(fields=['-created_at'], name='song_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='song',
+            index=models.Index(condition=models.Q(('visibility', 1)), fields=['-play_count', '-likes'], name='song_public_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='song',
+            index=models.Index(condition=models.Q(('visibility', 1)), fields=['-likes'], name='song_public_likes_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='song',
+            index=models.Index(condition=models.Q(('visibility', 1)), fields=['-release_date'], name='song_public_released_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:24
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0013_album_album_released_idx_album_album_created_idx_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='album',
+            index=models.Index(django.db.models.functions.text.Lower('title'), models.F('created_at'), models.F('id'), name='album_title_key_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='genre',
+            index=models.Index(django.db.models.functions.text.Lower('title'), models.F('created_at'), models.F('id'), name='genre_title_key_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:28
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def count_album_songs(apps, schema_editor):
+    """Same computation as music.album_totals.refresh_totals, on the historical models"""
+    Album = apps.get_model('music', 'Album')
+    Song = apps.get_model('music', 'Song')
+    songs = Song.objects.filter(album=OuterRef('pk')).order_by().values('album')
+    Album.objects.update(
+        track_count=Coalesce(Subquery(songs.annotate(n=Count('id')).values('n')), Value(0)),
+        total_duration=Coalesce(Subquery(songs.annotate(seconds=Sum('duration')).values('seconds')), Value(0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0014_title_key_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='album',
+            name='total_duration',
+            field=models.PositiveIntegerField(default=0, help_text='Total duration in seconds'),
+        ),
+        migrations.AddField(
+            model_name='album',
+            name='track_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_album_songs, migrations.RunPython.noop),
+    ]
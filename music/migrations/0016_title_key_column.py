@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:05
+
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_title_keys(apps, schema_editor):
+    """title_key(title) for existing rows; the historical models have no save() override"""
+    for name in ('Genre', 'Album'):
+        model = apps.get_model('music', name)
+        batch = []
+        for obj in model.objects.only('id', 'title').iterator(chunk_size=2000):
+            obj.title_key = " ".join(obj.title.split()).casefold()
+            batch.append(obj)
+            if len(batch) == 2000:
+                model.objects.bulk_update(batch, ['title_key'])
+                batch = []
+        model.objects.bulk_update(batch, ['title_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0015_album_track_count_total_duration'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TitleLock',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('model', models.CharField(max_length=20)),
+                ('key', models.CharField(max_length=300)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='album',
+            name='album_title_key_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='genre',
+            name='genre_title_key_idx',
+        ),
+        migrations.AddField(
+            model_name='album',
+            name='title_key',
+            field=models.CharField(default='', editable=False, max_length=300),
+        ),
+        migrations.AddField(
+            model_name='genre',
+            name='title_key',
+            field=models.CharField(default='', editable=False, max_length=300),
+        ),
+        migrations.RunPython(fill_title_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='album',
+            index=models.Index(fields=['title_key', 'created_at', 'id'], name='album_title_key_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='genre',
+            index=models.Index(fields=['title_key', 'created_at', 'id'], name='genre_title_key_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='titlelock',
+            constraint=models.UniqueConstraint(fields=('model', 'key'), name='unique_title_lock'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:11
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0016_title_key_column'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SongPlay',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('played_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('song', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='play_events', to='music.song')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='song_plays', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'played_at'], name='music_songp_user_id_103865_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:37
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def add_artist_totals(apps, schema_editor):
+    """One song=None row per artist and hour, summed from the per-song rows still retained"""
+    SongStatHourly = apps.get_model('music', 'SongStatHourly')
+    totals = (
+        SongStatHourly.objects.filter(song__isnull=False)
+        .values('artist_id', 'hour')
+        .annotate(plays_total=Sum('plays'), likes_total=Sum('likes'), favorites_total=Sum('favorites'))
+    )
+    SongStatHourly.objects.bulk_create(
+        [
+            SongStatHourly(song=None, artist_id=row['artist_id'], hour=row['hour'], plays=row['plays_total'],
+                           likes=row['likes_total'], favorites=row['favorites_total'])
+            for row in totals.iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+def remove_artist_totals(apps, schema_editor):
+    apps.get_model('music', 'SongStatHourly').objects.filter(song=None).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0017_songplay'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='songstathourly',
+            constraint=models.UniqueConstraint(condition=models.Q(('song', None)), fields=('artist', 'hour'), name='unique_artist_stat_hour'),
+        ),
+        migrations.RunPython(add_artist_totals, remove_artist_totals),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:47
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0018_artist_stat_hour'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recentlyplayed',
+            name='played_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
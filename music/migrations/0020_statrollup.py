@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:17
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0019_recentlyplayed_played_at_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatRollup',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('watermark', models.DateField()),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:58
+
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0020_statrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SongTombstone',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('song_id', models.UUIDField(unique=True)),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['deleted_at', 'song_id'], name='music_songt_deleted_760c00_idx')],
+            },
+        ),
+    ]
@@ -1,19 +1,66 @@
 from django.db import models
+from django.utils import timezone
 from users.models import UUIDModel, User
 from music.music_enum import Visibility
 
-class Album(UUIDModel):
+
+def clean_title(title):
+    """Title as stored: surrounding whitespace stripped and inner runs collapsed"""
+    return " ".join(title.split())
+
+
+def title_key(title):
+    """Canonical key of a genre or album title; 'Rock', 'rock ' and ' ROCK' share one"""
+    return clean_title(title).casefold()
+
+
+class TitleKeyMixin:
+    """
+    Keeps title_key equal to title_key(title) on save. Uploads resolve titles
+    by this column (music.utils.TitleResolver), so Python alone decides which
+    titles match; bulk_create callers set it themselves.
+    """
+
+    def save(self, *args, **kwargs):
+        self.title_key = title_key(self.title)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'title' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'title_key'}
+        super().save(*args, **kwargs)
+
+
+class Album(TitleKeyMixin, UUIDModel):
+    """track_count and total_duration are kept in step with its songs (see music.album_totals)"""
     user = models.ForeignKey(User, on_delete=models.CASCADE,null=True,blank=True)
     title = models.CharField(max_length=100)
+    # casefold() can lengthen a title, e.g. 'ß' becomes 'ss'.
+    title_key = models.CharField(max_length=300, editable=False, default='')
     release_date = models.DateField()
     cover_image = models.ImageField(upload_to='album_covers/', blank=True, null=True)
+    track_count = models.PositiveIntegerField(default=0)
+    total_duration = models.PositiveIntegerField(default=0, help_text="Total duration in seconds")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-release_date'], name='album_released_idx'),
+            models.Index(fields=['-created_at'], name='album_created_idx'),
+            # Title resolution in music.utils matches on title_key, oldest first.
+            models.Index(fields=['title_key', 'created_at', 'id'], name='album_title_key_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
-class Genre(UUIDModel):
+class Genre(TitleKeyMixin, UUIDModel):
     user = models.ForeignKey(User, on_delete=models.CASCADE,null=True,blank=True)
     title = models.CharField(max_length=100)
+    title_key = models.CharField(max_length=300, editable=False, default='')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['title_key', 'created_at', 'id'], name='genre_title_key_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
@@ -31,6 +78,21 @@ class Song(UUIDModel):
     likes = models.PositiveIntegerField(default=0)
     visibility = models.IntegerField(choices=Visibility.choices(), default=Visibility.PUBLIC.value)
     licensing_info = models.TextField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at', 'id']),
+            # Default listing order; unfiltered so artists' "public or mine" lists use it too
+            models.Index(fields=['-created_at'], name='song_created_idx'),
+            # Orderings offered to listeners, who only ever see public songs
+            models.Index(fields=['-play_count', '-likes'], name='song_public_popular_idx',
+                         condition=models.Q(visibility=Visibility.PUBLIC.value)),
+            models.Index(fields=['-likes'], name='song_public_likes_idx',
+                         condition=models.Q(visibility=Visibility.PUBLIC.value)),
+            models.Index(fields=['-release_date'], name='song_public_released_idx',
+                         condition=models.Q(visibility=Visibility.PUBLIC.value)),
+        ]
 
     def __str__(self):
         return self.title
@@ -51,7 +113,7 @@ class RecentlyPlayed(UUIDModel):
     """Track recently played songs for users"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recently_played')
     song = models.ForeignKey(Song, on_delete=models.CASCADE, related_name='recent_plays')
-    played_at = models.DateTimeField(auto_now_add=True)
+    played_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
         ordering = ['-played_at']
@@ -64,6 +126,35 @@ class RecentlyPlayed(UUIDModel):
         return f"{self.user.username} played {self.song.title}"
 
 
+class SongPlay(UUIDModel):
+    """One row per play, never updated; music.year_review counts these"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='song_plays')
+    song = models.ForeignKey(Song, on_delete=models.CASCADE, related_name='play_events')
+    played_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'played_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} played {self.song.title}"
+
+
+class SongTombstone(UUIDModel):
+    """Left behind by a deleted song, so music.export can report the deletion"""
+    song_id = models.UUIDField(unique=True)
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['deleted_at', 'song_id']),
+        ]
+
+    def __str__(self):
+        return f"Deleted song {self.song_id}"
+
+
 class FavoriteSong(UUIDModel):
     """User's favorite/saved songs"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='favorite_songs')
@@ -109,4 +200,152 @@ class ArtistFollow(UUIDModel):
         ]
 
     def __str__(self):
-        return f"{self.user.username} follows {self.artist.username}"
\ No newline at end of file
+        return f"{self.user.username} follows {self.artist.username}"
+
+class Playlist(UUIDModel):
+    """User playlist; track_count and total_duration are kept in step with its items (see music.playlists)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='playlists')
+    title = models.CharField(max_length=100)
+    description = models.TextField(blank=True)
+    visibility = models.IntegerField(choices=Visibility.choices(), default=Visibility.PUBLIC.value)
+    track_count = models.PositiveIntegerField(default=0)
+    total_duration = models.PositiveIntegerField(default=0, help_text="Total duration in seconds")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return self.title
+
+
+class PlaylistItem(UUIDModel):
+    """Song in a playlist, ordered by a fractional index key (see music.ordering)"""
+    playlist = models.ForeignKey(Playlist, on_delete=models.CASCADE, related_name='items')
+    song = models.ForeignKey(Song, on_delete=models.CASCADE, related_name='playlist_items')
+    position = models.CharField(max_length=255)
+    added_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['position']
+        constraints = [
+            models.UniqueConstraint(fields=['playlist', 'position'], name='unique_playlist_position'),
+        ]
+
+    def __str__(self):
+        return f"{self.song.title} in {self.playlist.title}"
+
+
+class SongSuccessors(UUIDModel):
+    """Top-N next songs observed after this one, packed by music.radio"""
+    song = models.OneToOneField(Song, on_delete=models.CASCADE, related_name='successors')
+    data = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Successors of {self.song_id}"
+
+
+class ListeningSummary(UUIDModel):
+    """Per-user yearly listening summary, precomputed by music.year_review"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='listening_summaries')
+    year = models.PositiveIntegerField()
+    play_count = models.PositiveIntegerField(default=0)
+    minutes_listened = models.PositiveIntegerField(default=0)
+    top_songs = models.JSONField(default=list)
+    top_artists = models.JSONField(default=list)
+    top_genres = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('user', 'year')
+
+    def __str__(self):
+        return f"{self.user.username}'s {self.year} in review"
+
+
+class SongStatBase(UUIDModel):
+    """Play/like/favorite counts for one time bucket; rows with no song are artist totals"""
+    artist = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    song = models.ForeignKey(Song, on_delete=models.CASCADE, related_name='+', null=True, blank=True)
+    plays = models.IntegerField(default=0)
+    likes = models.IntegerField(default=0)
+    favorites = models.IntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+
+class SongStatHourly(SongStatBase):
+    """Written on the request path by music.stats.record"""
+    hour = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('song', 'hour')
+        constraints = [
+            models.UniqueConstraint(fields=['artist', 'hour'], condition=models.Q(song=None),
+                                    name='unique_artist_stat_hour'),
+        ]
+        indexes = [
+            models.Index(fields=['artist', 'hour']),
+            models.Index(fields=['hour']),
+        ]
+
+
+class SongStatDaily(SongStatBase):
+    """Compacted from hourly rows by music.stats.rollup"""
+    day = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['song', 'day'], name='unique_song_stat_day'),
+            models.UniqueConstraint(fields=['artist', 'day'], condition=models.Q(song=None),
+                                    name='unique_artist_stat_day'),
+        ]
+        indexes = [
+            models.Index(fields=['artist', 'day']),
+        ]
+
+
+class SongStatMonthly(SongStatBase):
+    """Compacted from daily rows by music.stats.rollup; month is the first day of the month"""
+    month = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['song', 'month'], name='unique_song_stat_month'),
+            models.UniqueConstraint(fields=['artist', 'month'], condition=models.Q(song=None),
+                                    name='unique_artist_stat_month'),
+        ]
+        indexes = [
+            models.Index(fields=['artist', 'month']),
+        ]
+
+
+class StatRollup(UUIDModel):
+    """
+    Single row recording how far music.stats.rollup has compacted: every day
+    before `watermark` is in the daily rows, so only its hourly rows may go.
+    """
+    watermark = models.DateField()
+
+    def __str__(self):
+        return f"Stats rolled up before {self.watermark}"
+
+
+class TitleLock(UUIDModel):
+    """
+    One row per genre or album title_key that uploads have created a row
+    for. Creators of the same key update it first, so across processes
+    they run one at a time and the second finds the first one's row.
+    """
+    model = models.CharField(max_length=20)
+    key = models.CharField(max_length=300)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['model', 'key'], name='unique_title_lock'),
+        ]
+
+    def __str__(self):
+        return f"{self.model}:{self.key}"
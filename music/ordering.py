@@ -0,0 +1,112 @@
+"""
+Fractional index keys for ordered lists (playlist items).
+
+A key is a fixed-width base-36 integer part followed by an optional
+fraction, e.g. 'i00000' or 'i00003k'. Keys compare correctly as plain
+strings, so any item can be placed between two neighbours by writing only
+its own key. Only digits and lowercase letters are used so that ordering
+does not depend on the database collation.
+"""
+DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+BASE = len(DIGITS)
+INTEGER_WIDTH = 6
+FIRST_KEY = 'i' + '0' * (INTEGER_WIDTH - 1)
+
+
+def _split(key):
+    return key[:INTEGER_WIDTH], key[INTEGER_WIDTH:]
+
+
+def _to_int(digits):
+    value = 0
+    for char in digits:
+        value = value * BASE + DIGITS.index(char)
+    return value
+
+
+def _from_int(value):
+    chars = []
+    for _ in range(INTEGER_WIDTH):
+        value, digit = divmod(value, BASE)
+        chars.append(DIGITS[digit])
+    return ''.join(reversed(chars))
+
+
+def _midpoint(a, b):
+    """
+    Fraction strictly between a and b, where b=None means the upper bound.
+    Neither input may end in '0', and neither does the result.
+    """
+    if b is not None:
+        n = 0
+        while n < len(b) and (a[n] if n < len(a) else '0') == b[n]:
+            n += 1
+        if n > 0:
+            return b[:n] + _midpoint(a[n:], b[n:])
+
+    digit_a = DIGITS.index(a[0]) if a else 0
+    digit_b = DIGITS.index(b[0]) if b is not None else BASE
+    if digit_b - digit_a > 1:
+        return DIGITS[(digit_a + digit_b + 1) // 2]
+    if b is not None and len(b) > 1:
+        return b[0]
+    return DIGITS[digit_a] + _midpoint(a[1:], None)
+
+
+def key_between(a, b):
+    """Returns a key sorting after a and before b. Either may be None for an open end."""
+    if a is not None and b is not None and a >= b:
+        raise ValueError(f"{a!r} must sort before {b!r}")
+    if a is None and b is None:
+        return FIRST_KEY
+
+    if a is None:
+        int_b, frac_b = _split(b)
+        if frac_b:
+            return int_b
+        value = _to_int(int_b)
+        if value == 0:
+            raise ValueError("No key sorts before the smallest integer key")
+        return _from_int(value - 1)
+
+    int_a, frac_a = _split(a)
+    if b is None:
+        value = _to_int(int_a)
+        if value + 1 < BASE ** INTEGER_WIDTH:
+            return _from_int(value + 1)
+        return int_a + _midpoint(frac_a, None)
+
+    int_b, frac_b = _split(b)
+    if int_a == int_b:
+        return int_a + _midpoint(frac_a, frac_b)
+    following = _from_int(_to_int(int_a) + 1)
+    if following < b:
+        return following
+    return int_a + _midpoint(frac_a, None)
+
+
+def keys_between(a, b, n):
+    """
+    Returns n ascending keys between a and b. Open-ended ranges step the
+    integer part; closed ranges bisect, so keys grow by O(log n) characters.
+    """
+    if n <= 0:
+        return []
+    if n == 1:
+        return [key_between(a, b)]
+    if b is None:
+        keys = []
+        for _ in range(n):
+            a = key_between(a, None)
+            keys.append(a)
+        return keys
+    if a is None:
+        keys = []
+        for _ in range(n):
+            b = key_between(None, b)
+            keys.append(b)
+        return list(reversed(keys))
+
+    mid_index = n // 2
+    mid = key_between(a, b)
+    return keys_between(a, mid, mid_index) + [mid] + keys_between(mid, b, n - mid_index - 1)
@@ -16,3 +16,20 @@ class IsArtistOrReadOnly(BasePermission):
         if request.method in SAFE_METHODS:  # ✅ Read permissions allowed for everyone
             return True
         return obj.user == request.user  # ✅ Only allow modifying own songs
+
+
+class IsOwnerOrReadOnly(BasePermission):
+    """
+    ✅ Any authenticated user can create objects they own (e.g. playlists).
+    ✅ Only the owner can modify or delete them.
+    """
+
+    def has_permission(self, request, view):
+        if request.method in SAFE_METHODS:
+            return True
+        return request.user.is_authenticated
+
+    def has_object_permission(self, request, view, obj):
+        if request.method in SAFE_METHODS:
+            return True
+        return obj.user == request.user
@@ -0,0 +1,173 @@
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from music.models import Playlist, PlaylistItem, Song
+from music.ordering import key_between, keys_between
+
+DEFAULT_MAX_PLAYLISTS = 100
+# Repeated inserts into one gap lengthen keys; past this the gap is re-keyed.
+REBALANCE_KEY_LENGTH = 64
+
+
+def max_playlists(user):
+    """Playlist limit from the user's subscription plan."""
+    profile = getattr(user, 'profile', None)
+    plan = getattr(profile, 'subscription_plan', None) if profile else None
+    if plan is None:
+        return DEFAULT_MAX_PLAYLISTS
+    return plan.get_features().get('max_playlists', DEFAULT_MAX_PLAYLISTS)
+
+
+def _lock(playlist):
+    """Serializes writers on one playlist so generated positions cannot collide."""
+    return Playlist.objects.select_for_update().get(pk=playlist.pk)
+
+
+def _neighbour_positions(playlist, after=None, before=None):
+    """
+    Positions that bound an insert. `after`/`before` are items of this playlist;
+    with neither given the insert goes to the end.
+    """
+    items = PlaylistItem.objects.filter(playlist=playlist)
+    if after is not None:
+        following = items.filter(position__gt=after.position).order_by('position')
+        return after.position, following.values_list('position', flat=True).first()
+    if before is not None:
+        preceding = items.filter(position__lt=before.position).order_by('-position')
+        return preceding.values_list('position', flat=True).first(), before.position
+    last = items.order_by('-position').values_list('position', flat=True).first()
+    return last, None
+
+
+def add_songs(playlist, songs, after=None, before=None):
+    """Inserts songs in order at one spot with a single bulk insert."""
+    with transaction.atomic():
+        _lock(playlist)
+        low, high = _neighbour_positions(playlist, after, before)
+        positions = keys_between(low, high, len(songs))
+        items = PlaylistItem.objects.bulk_create([
+            PlaylistItem(playlist=playlist, song=song, position=position)
+            for song, position in zip(songs, positions)
+        ])
+        Playlist.objects.filter(pk=playlist.pk).update(
+            track_count=F('track_count') + len(songs),
+            total_duration=F('total_duration') + sum(song.duration for song in songs),
+            updated_at=timezone.now(),
+        )
+        longest = max(positions, key=len, default='')
+        if len(longest) > REBALANCE_KEY_LENGTH:
+            rebalance(playlist, longest)
+    return items
+
+
+def move_item(item, after=None, before=None):
+    """Moves one item next to another; only the moved row is written."""
+    with transaction.atomic():
+        _lock(item.playlist)
+        if (after is not None and after.pk == item.pk) or (before is not None and before.pk == item.pk):
+            return item
+        low, high = _neighbour_positions(item.playlist, after, before)
+        # The moved item may itself be a neighbour; skipping over it is harmless.
+        if low == item.position:
+            low = PlaylistItem.objects.filter(
+                playlist=item.playlist, position__lt=item.position
+            ).order_by('-position').values_list('position', flat=True).first()
+        if high == item.position:
+            high = PlaylistItem.objects.filter(
+                playlist=item.playlist, position__gt=item.position
+            ).order_by('position').values_list('position', flat=True).first()
+        item.position = key_between(low, high)
+        item.save(update_fields=['position'])
+        if len(item.position) > REBALANCE_KEY_LENGTH:
+            rebalance(item.playlist, item.position)
+            item.refresh_from_db(fields=['position'])
+    return item
+
+
+def rebalance(playlist, position, window=50):
+    """
+    Re-keys the items around `position` with short, evenly spaced keys.
+    The window widens until the new keys are short, so a crowded gap costs
+    one small bulk_update instead of renumbering the whole playlist.
+    """
+    items = PlaylistItem.objects.filter(playlist=playlist).only('pk', 'position')
+    while True:
+        left = list(items.filter(position__lt=position).order_by('-position')[:window + 1])
+        right = list(items.filter(position__gte=position).order_by('position')[:window + 1])
+        low = left.pop().position if len(left) > window else None
+        high = right.pop().position if len(right) > window else None
+        crowded = list(reversed(left)) + right
+        keys = keys_between(low, high, len(crowded))
+        if max(len(key) for key in keys) <= REBALANCE_KEY_LENGTH // 2 or (low is None and high is None):
+            break
+        window *= 4
+
+    # Write through a prefix no real key uses, so no row ever collides with another.
+    for item, key in zip(crowded, keys):
+        item.position = '_' + key
+    PlaylistItem.objects.bulk_update(crowded, ['position'])
+    for item, key in zip(crowded, keys):
+        item.position = key
+    PlaylistItem.objects.bulk_update(crowded, ['position'])
+
+
+def remove_item(item):
+    """Deletes one item and adjusts the cached totals by what was deleted."""
+    with transaction.atomic():
+        _lock(item.playlist)
+        rows = PlaylistItem.objects.filter(pk=item.pk)
+        removed = rows.aggregate(count=Count('id'), duration=Sum('song__duration'))
+        if removed['count']:
+            rows.delete()
+            Playlist.objects.filter(pk=item.playlist_id).update(
+                track_count=Greatest(F('track_count') - removed['count'], 0),
+                total_duration=Greatest(F('total_duration') - (removed['duration'] or 0), 0),
+                updated_at=timezone.now(),
+            )
+
+
+def refresh_totals(playlist_ids=None):
+    """Recomputes the cached totals from the items, for all playlists or the given ones."""
+    items = PlaylistItem.objects.filter(playlist=OuterRef('pk')).order_by().values('playlist')
+    playlists = Playlist.objects.all() if playlist_ids is None else Playlist.objects.filter(pk__in=playlist_ids)
+    return playlists.update(
+        track_count=Coalesce(Subquery(items.annotate(n=Count('id')).values('n')), Value(0)),
+        total_duration=Coalesce(Subquery(items.annotate(seconds=Sum('song__duration')).values('seconds')), Value(0)),
+    )
+
+
+# Songs are deleted, or their duration edited, outside this module; the
+# playlists holding them are recomputed. Both are rare next to item writes.
+
+@receiver(post_save, sender=Song, dispatch_uid='playlist_totals_after_save')
+def recount_edited(sender, instance, created, raw, update_fields, **kwargs):
+    if created or raw or (update_fields is not None and 'duration' not in update_fields):
+        return
+    refresh_totals(PlaylistItem.objects.filter(song=instance).values('playlist'))
+
+
+@receiver(pre_delete, sender=Song, dispatch_uid='playlist_totals_before_delete')
+def remember_playlists(sender, instance, **kwargs):
+    # The cascade deletes the items before post_delete runs.
+    instance._playlist_ids = list(
+        PlaylistItem.objects.filter(song=instance).values_list('playlist', flat=True).distinct()
+    )
+
+
+@receiver(post_delete, sender=Song, dispatch_uid='playlist_totals_after_delete')
+def recount_deleted(sender, instance, **kwargs):
+    playlist_ids = instance.__dict__.pop('_playlist_ids', None)
+    if playlist_ids:
+        refresh_totals(playlist_ids)
+
+
+def page_items(playlist, after_position=None, limit=100):
+    """Keyset page of items; pass the last position seen to get the next page."""
+    items = playlist.items.select_related('song__user', 'song__album', 'song__genre')
+    if after_position:
+        items = items.filter(position__gt=after_position)
+    return list(items.order_by('position')[:limit])
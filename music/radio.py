@@ -0,0 +1,168 @@
+"""
+Radio queues from a first-order Markov model of listening history.
+
+build_model() counts song -> next song transitions between consecutive
+plays of the same user and stores the top successors of each song as a
+packed array of (16-byte song id, uint32 weight) records. Queues are built
+by walking those arrays, so serving a radio batch needs no aggregation.
+"""
+import random
+import struct
+import uuid
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+from music.models import Song, SongPlay, SongSuccessors
+from music.music_enum import Visibility
+
+TOP_SUCCESSORS = 20
+# Plays further apart than this belong to different listening sessions.
+SESSION_GAP = timedelta(minutes=30)
+SESSION_TTL = 60 * 60
+PREFETCH_BATCHES = 3
+
+RECORD = struct.Struct('>16sI')
+
+
+def pack_successors(successors):
+    """[(song_id, weight), ...] -> bytes"""
+    return b''.join(RECORD.pack(song_id.bytes, weight) for song_id, weight in successors)
+
+
+def unpack_successors(data):
+    """bytes -> [(song_id, weight), ...]"""
+    return [(uuid.UUID(bytes=raw), weight) for raw, weight in RECORD.iter_unpack(bytes(data))]
+
+
+def iter_transitions(chunk_size=5000):
+    """Yields (song_id, next_song_id) for consecutive plays within a session."""
+    plays = SongPlay.objects.order_by('user_id', 'played_at').values_list(
+        'user_id', 'song_id', 'played_at'
+    )
+    previous = None
+    for user_id, song_id, played_at in plays.iterator(chunk_size=chunk_size):
+        if previous and previous[0] == user_id and previous[1] != song_id \
+                and played_at - previous[2] <= SESSION_GAP:
+            yield previous[1], song_id
+        previous = (user_id, song_id, played_at)
+
+
+def build_model(top=TOP_SUCCESSORS, chunk_size=5000):
+    """Rebuilds every SongSuccessors row from listening history. Returns the row count."""
+    counts = defaultdict(Counter)
+    for song_id, next_song_id in iter_transitions(chunk_size):
+        counts[song_id][next_song_id] += 1
+
+    rows = [
+        SongSuccessors(song_id=song_id, data=pack_successors(successors.most_common(top)))
+        for song_id, successors in counts.items()
+    ]
+    with transaction.atomic():
+        SongSuccessors.objects.all().delete()
+        SongSuccessors.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+class RadioWalker:
+    """Extends a queue by following weighted successors from the last song."""
+
+    def __init__(self, visible_songs):
+        self.visible_songs = visible_songs
+        self.successors = {}
+        self.genre_pools = {}
+        self.visible = {}
+
+    def load(self, song_ids):
+        """Loads successor arrays for songs not seen yet in one query."""
+        missing = [song_id for song_id in song_ids if song_id not in self.successors]
+        if not missing:
+            return
+        for song_id in missing:
+            self.successors[song_id] = []
+        rows = SongSuccessors.objects.filter(song_id__in=missing).values_list('song_id', 'data')
+        for song_id, data in rows:
+            self.successors[song_id] = unpack_successors(data)
+
+    def visible_ids(self, song_ids):
+        """
+        The ids the listener may see. The model is built from everyone's
+        history, so successors can be private songs of other artists.
+        """
+        missing = [song_id for song_id in song_ids if song_id not in self.visible]
+        if missing:
+            self.visible.update(dict.fromkeys(missing, False))
+            found = self.visible_songs.filter(pk__in=missing).values_list('id', flat=True)
+            self.visible.update(dict.fromkeys(found, True))
+        return [song_id for song_id in song_ids if self.visible[song_id]]
+
+    def fallback(self, song_id, exclude):
+        """Popular songs from the same genre, for songs without history."""
+        genre_id = Song.objects.filter(pk=song_id).values_list('genre_id', flat=True).first()
+        if genre_id not in self.genre_pools:
+            self.genre_pools[genre_id] = list(
+                self.visible_songs.filter(genre_id=genre_id)
+                .order_by('-play_count', '-likes').values_list('id', flat=True)[:100]
+            )
+        pool = [candidate for candidate in self.genre_pools[genre_id] if candidate not in exclude]
+        return random.choice(pool) if pool else None
+
+    def walk(self, last_id, exclude, size):
+        queue = []
+        exclude = set(exclude)
+        for _ in range(size):
+            self.load([last_id])
+            candidates = [(s, w) for s, w in self.successors[last_id] if s not in exclude]
+            visible = set(self.visible_ids([s for s, _ in candidates]))
+            candidates = [(s, w) for s, w in candidates if s in visible]
+            if candidates:
+                # Load the next step's arrays along with this one's.
+                self.load([s for s, _ in candidates])
+                ids, weights = zip(*candidates)
+                next_id = random.choices(ids, weights=weights)[0]
+            else:
+                next_id = self.fallback(last_id, exclude)
+            if next_id is None:
+                break
+            queue.append(next_id)
+            exclude.add(next_id)
+            last_id = next_id
+        return queue
+
+
+def visible_songs_for(user):
+    public_filter = Q(visibility=Visibility.PUBLIC.value)
+    if user.is_authenticated:
+        public_filter |= Q(user=user)
+    return Song.objects.filter(public_filter)
+
+
+def next_batch(seed, user, count, session=None):
+    """
+    Returns (session, song ids) for the next `count` tracks of a radio session.
+    Several batches are computed at once and kept in the cache, so most calls
+    only pop ids from the stored queue.
+    """
+    owner = user.pk if user.is_authenticated else None
+    state = cache.get(f"radio:{session}") if session else None
+    # A session continues only for the listener and seed it was started with;
+    # anything else starts a new one.
+    if state is None or (state.get('user'), state.get('seed')) != (owner, seed.pk):
+        session = uuid.uuid4().hex
+        state = {'user': owner, 'seed': seed.pk, 'history': [seed.pk], 'queue': []}
+
+    if len(state['queue']) < count:
+        walker = RadioWalker(visible_songs_for(user))
+        last_id = state['queue'][-1] if state['queue'] else state['history'][-1]
+        state['queue'] += walker.walk(
+            last_id, state['history'] + state['queue'], count * PREFETCH_BATCHES
+        )
+
+    batch, state['queue'] = state['queue'][:count], state['queue'][count:]
+    # Keep enough history to avoid repeats without letting the state grow unbounded.
+    state['history'] = (state['history'] + batch)[-500:]
+    cache.set(f"radio:{session}", state, SESSION_TTL)
+    return session, batch
@@ -0,0 +1,103 @@
+"""
+Faster renderers for large song lists, picked by content negotiation.
+
+orjson and msgpack are optional: without orjson, JSON falls back to DRF's
+JSONRenderer, and without msgpack, application/msgpack is not offered.
+Renderers with render_stream() can also encode a collection chunk by chunk
+for StreamingHttpResponse; see stream_response(). Either way a list comes
+out byte for byte the same: one array in JSON, and in MessagePack a sequence
+of top-level objects, one per row, as an array must state its length before
+its first row is streamed. Read MessagePack lists with msgpack.Unpacker.
+"""
+from itertools import islice
+
+from django.db.models import QuerySet
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer, BrowsableAPIRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+STREAM_CHUNK_SIZE = 1000
+
+# DRF's encoder knows lazy strings, Decimals, querysets and the like.
+_fallback = JSONEncoder().default
+
+
+class ORJSONRenderer(BaseRenderer):
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return orjson.dumps(data, default=_fallback)
+
+    def render_stream(self, rows):
+        """Encodes an iterable of row chunks as one JSON array."""
+        yield b'['
+        first = True
+        for chunk in rows:
+            if not chunk:
+                continue
+            body = orjson.dumps(chunk, default=_fallback)[1:-1]
+            yield body if first else b',' + body
+            first = False
+        yield b']'
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """Lists are packed row by row, like render_stream(); anything else as one object."""
+        if data is None:
+            return b''
+        if isinstance(data, list):
+            return b''.join(self.render_stream([data]))
+        return msgpack.packb(data, default=_fallback)
+
+    def render_stream(self, rows):
+        """Encodes an iterable of row chunks as a sequence of top-level objects."""
+        packer = msgpack.Packer(default=_fallback)
+        for chunk in rows:
+            yield b''.join(packer.pack(row) for row in chunk)
+
+
+RENDERERS = [ORJSONRenderer if orjson else JSONRenderer, BrowsableAPIRenderer]
+if msgpack:
+    RENDERERS.insert(1, MessagePackRenderer)
+
+
+def wants_stream(request):
+    return request.query_params.get('stream') in ('1', 'true') \
+        and hasattr(request.accepted_renderer, 'render_stream')
+
+
+def stream_response(request, items, serialize, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Streams `items` through serialize(chunk) -> list of dicts, reading and
+    encoding STREAM_CHUNK_SIZE rows at a time, so the full response is never
+    held in memory.
+    """
+    if isinstance(items, QuerySet):
+        items = items.iterator(chunk_size=chunk_size)
+    items = iter(items)
+    chunks = iter(lambda: list(islice(items, chunk_size)), [])
+    renderer = request.accepted_renderer
+    return StreamingHttpResponse(
+        renderer.render_stream(serialize(chunk) for chunk in chunks),
+        content_type=renderer.media_type,
+    )
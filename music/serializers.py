@@ -1,6 +1,64 @@
 from rest_framework import serializers
-from music.models import Song, Genre, Album
+from rest_framework.exceptions import ValidationError
+from music.models import Song, Genre, Album, Playlist, PlaylistItem
 from music.utils import get_or_create_genre, get_or_create_album
+from music import library
+
+
+class SparseFieldsMixin:
+    """
+    Serializes only context['fields'] and nests only the relations in
+    context['expand']. `columns` lists the model columns each field reads and
+    `expanded_columns` the columns a nested relation reads, so a view can
+    project its queryset to exactly what will be rendered.
+    """
+    columns = {}
+    expanded_columns = {}
+    default_expand = ()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.expand = self.context.get('expand', set(self.default_expand))
+        fields = self.context.get('fields')
+        if fields is not None:
+            for name in list(self.fields):
+                if name not in fields:
+                    self.fields.pop(name)
+
+    @classmethod
+    def parse_sparse_fields(cls, query_params):
+        """?fields=a,b&expand=c -> {'fields': [...], 'expand': {...}}"""
+        def split(name):
+            value = query_params.get(name)
+            return None if value is None else [part.strip() for part in value.split(',') if part.strip()]
+
+        fields, expand = split('fields'), split('expand')
+        if fields is None:
+            fields = list(cls.columns)
+        if expand is None:
+            expand = cls.default_expand if 'fields' not in query_params else []
+        errors = {}
+        if set(fields) - set(cls.columns):
+            errors['fields'] = f"Unknown fields: {', '.join(sorted(set(fields) - set(cls.columns)))}"
+        if set(expand) - set(cls.expanded_columns):
+            errors['expand'] = f"Can only expand: {', '.join(cls.expanded_columns)}"
+        if errors:
+            raise ValidationError(errors)
+        return {'fields': fields, 'expand': set(expand) & set(fields)}
+
+    @classmethod
+    def project(cls, queryset, fields, expand):
+        """Limits the SELECT list and joins to the columns the fields read."""
+        columns = []
+        for name in fields:
+            columns += cls.expanded_columns[name] if name in expand else cls.columns[name]
+        relations = set()
+        for column in columns:
+            parts = column.split('__')
+            relations.update('__'.join(parts[:i]) for i in range(1, len(parts)))
+        # Traversed foreign keys must be loaded themselves as well.
+        return (queryset.select_related(None).prefetch_related(None)
+                .select_related(*relations).only(*columns, *relations))
 
 
 class GenreSerializer(serializers.ModelSerializer):
@@ -12,25 +70,64 @@ class GenreSerializer(serializers.ModelSerializer):
         fields = ['id', 'title', 'user']  # Include the user field if needed
 
 
-class AlbumSerializer(serializers.ModelSerializer):
+class AlbumSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user = serializers.CharField(source='user.username', read_only=True)
 
+    columns = {
+        'id': ['id'],
+        'title': ['title'],
+        'release_date': ['release_date'],
+        'cover_image': ['cover_image'],
+        'user': ['user__username'],
+        'track_count': ['track_count'],
+        'total_duration': ['total_duration'],
+    }
+
     class Meta:
         model = Album
-        fields = ['id', 'title', 'release_date', 'cover_image', 'user']
+        fields = ['id', 'title', 'release_date', 'cover_image', 'user', 'track_count', 'total_duration']
+        read_only_fields = ['track_count', 'total_duration']
 
 
-class SongSerializer(serializers.ModelSerializer):
+class SongSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Serializer for handling Song model data"""
     user = serializers.CharField(source='user.username', read_only=True)
     genre = serializers.CharField(required=True)  # Accept genre as a string
     album_title = serializers.CharField(required=False, allow_blank=True)
 
+    columns = {
+        'id': ['id'],
+        'user': ['user__username'],
+        'title': ['title'],
+        'album': ['album'],
+        'genre': ['genre'],
+        'release_date': ['release_date'],
+        'duration': ['duration'],
+        'audio_file': ['audio_file'],
+        'visibility': ['visibility'],
+    }
+    expanded_columns = {
+        'album': ['album__title', 'album__release_date', 'album__cover_image', 'album__user__username',
+                  'album__track_count', 'album__total_duration'],
+        'genre': ['genre__title', 'genre__user__username'],
+    }
+    default_expand = ('album', 'genre')
+
     class Meta:
         model = Song
         fields = ['id','user', 'title', 'album', 'album_title', 'genre', 'release_date', 'duration', 'audio_file', 'visibility']
         read_only_fields = ['id', 'user', 'audio_file']
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if 'genre' in self.fields and 'genre' not in self.expand:
+            # Render the id without loading the genre row.
+            self.fields['genre'] = serializers.UUIDField(source='genre_id', read_only=True)
+        # Building a serializer is far slower than using one, so list
+        # responses share these across rows.
+        self.genre_serializer = GenreSerializer()
+        self.album_serializer = AlbumSerializer()
+
     def create(self, validated_data):
         """Set the song owner automatically and handle genre creation"""
         request = self.context.get('request')
@@ -44,7 +141,7 @@ class SongSerializer(serializers.ModelSerializer):
         # Optional: handle album creation by title
         album_title = validated_data.pop('album_title', None)
         if album_title:
-            album, _ = get_or_create_album(album_title, request.user)
+            album, _ = get_or_create_album(album_title, request.user, validated_data.get('release_date'))
             validated_data['album'] = album
 
         # Create the song instance
@@ -60,15 +157,51 @@ class SongSerializer(serializers.ModelSerializer):
             validated_data['genre'] = genre  # Set the genre object (Genre instance)
         album_title = validated_data.pop('album_title', None)
         if album_title:
-            album, _ = get_or_create_album(album_title, request.user)
+            release_date = validated_data.get('release_date', instance.release_date)
+            album, _ = get_or_create_album(album_title, request.user, release_date)
             validated_data['album'] = album
         return super().update(instance, validated_data)
 
     def to_representation(self, instance):
         """Customize the output representation"""
         representation = super().to_representation(instance)
-        representation['genre'] = GenreSerializer(instance.genre).data
-        if instance.album:
-            representation['album'] = AlbumSerializer(instance.album).data
-        representation['audio_file'] = instance.audio_file
-        return representation
\ No newline at end of file
+        if 'genre' in self.fields and 'genre' in self.expand:
+            if instance.genre:
+                representation['genre'] = self.genre_serializer.to_representation(instance.genre)
+            else:
+                representation['genre'] = GenreSerializer(instance.genre).data
+        if 'album' in self.fields and 'album' in self.expand and instance.album:
+            representation['album'] = self.album_serializer.to_representation(instance.album)
+        if 'audio_file' in self.fields:
+            representation['audio_file'] = instance.audio_file
+        return representation
+
+
+class PlaylistSerializer(serializers.ModelSerializer):
+    """Serializer for playlists; the totals are maintained by music.playlists"""
+    user = serializers.CharField(source='user.username', read_only=True)
+
+    class Meta:
+        model = Playlist
+        fields = ['id', 'user', 'title', 'description', 'visibility',
+                  'track_count', 'total_duration', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'user', 'track_count', 'total_duration', 'created_at', 'updated_at']
+
+
+class PlaylistItemSerializer(serializers.ModelSerializer):
+    song = SongSerializer(read_only=True)
+
+    class Meta:
+        model = PlaylistItem
+        fields = ['id', 'position', 'added_at', 'song']
+
+
+class LibraryOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=list(library.OPERATIONS))
+    id = serializers.UUIDField()
+
+
+class LibraryBatchSerializer(serializers.Serializer):
+    """A batch of like/favorite/follow operations; see music.library"""
+    operations = LibraryOperationSerializer(many=True, allow_empty=False,
+                                            max_length=library.MAX_OPERATIONS)
@@ -0,0 +1,248 @@
+"""
+Time-series counters for artist analytics.
+
+Plays, likes and favorites are counted per song per hour as they happen,
+and again in one artist-total row (song=None) per hour. rollup() compacts
+hourly rows into daily rows and daily rows into monthly rows, adding the
+same artist-total rows per bucket, so a chart over any range reads at most
+a few hundred rows. StatRollup records the first day not yet compacted;
+hourly rows are only pruned before it, so a rollup job that stops for a
+while catches up from there instead of losing the hours in between.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+from music.models import SongStatHourly, SongStatDaily, SongStatMonthly, StatRollup
+
+METRICS = ('plays', 'likes', 'favorites')
+# Hourly rows older than this are pruned once compacted (see prune_hourly).
+HOURLY_RETENTION_DAYS = 14
+MAX_POINTS = 400
+
+
+def _add(song_id, artist_id, hour, values):
+    changes = {name: F(name) + value for name, value in values.items() if value}
+    rows = SongStatHourly.objects.filter(song_id=song_id, artist_id=artist_id, hour=hour)
+    if rows.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            SongStatHourly.objects.create(song_id=song_id, artist_id=artist_id, hour=hour, **values)
+    except IntegrityError:
+        # Another request created the row first.
+        rows.update(**changes)
+
+
+async def _aadd(song_id, artist_id, hour, values):
+    changes = {name: F(name) + value for name, value in values.items() if value}
+    rows = SongStatHourly.objects.filter(song_id=song_id, artist_id=artist_id, hour=hour)
+    if await rows.aupdate(**changes):
+        return
+    try:
+        await SongStatHourly.objects.acreate(song_id=song_id, artist_id=artist_id, hour=hour, **values)
+    except IntegrityError:
+        await rows.aupdate(**changes)
+
+
+def record(song, plays=0, likes=0, favorites=0):
+    """Adds to the current hour's counters of a song and its artist; usually two UPDATEs."""
+    if not song.user_id:
+        return
+    values = {'plays': plays, 'likes': likes, 'favorites': favorites}
+    hour = timezone.now().replace(minute=0, second=0, microsecond=0)
+    _add(song.pk, song.user_id, hour, values)
+    _add(None, song.user_id, hour, values)
+
+
+async def arecord(song, plays=0, likes=0, favorites=0):
+    """record() for async views. Relies on autocommit instead of a savepoint."""
+    if not song.user_id:
+        return
+    values = {'plays': plays, 'likes': likes, 'favorites': favorites}
+    hour = timezone.now().replace(minute=0, second=0, microsecond=0)
+    await _aadd(song.pk, song.user_id, hour, values)
+    await _aadd(None, song.user_id, hour, values)
+
+
+def record_batch(changes):
+    """
+    Like record() for many songs at once. `changes` maps (song_id, artist_id)
+    to a dict of metric deltas. Missing hourly rows, artist totals included,
+    are created up front, then rows with identical deltas share one UPDATE.
+    """
+    changes = {key: deltas for key, deltas in changes.items() if key[1] and any(deltas.values())}
+    if not changes:
+        return
+    artist_changes = defaultdict(lambda: dict.fromkeys(METRICS, 0))
+    for (_, artist_id), deltas in changes.items():
+        for name, value in deltas.items():
+            artist_changes[artist_id][name] += value
+
+    hour = timezone.now().replace(minute=0, second=0, microsecond=0)
+    SongStatHourly.objects.bulk_create(
+        [SongStatHourly(song_id=song_id, artist_id=artist_id, hour=hour) for song_id, artist_id in changes]
+        + [SongStatHourly(song=None, artist_id=artist_id, hour=hour) for artist_id in artist_changes],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+    song_changes = {song_id: deltas for (song_id, _), deltas in changes.items()}
+    for deltas, song_ids in _group_by_deltas(song_changes).items():
+        SongStatHourly.objects.filter(song_id__in=song_ids, hour=hour).update(
+            **{name: F(name) + value for name, value in deltas}
+        )
+    for deltas, artist_ids in _group_by_deltas(artist_changes).items():
+        SongStatHourly.objects.filter(song=None, artist_id__in=artist_ids, hour=hour).update(
+            **{name: F(name) + value for name, value in deltas}
+        )
+
+
+def _group_by_deltas(changes):
+    """{id: deltas} -> {deltas: [ids]}, so ids with identical deltas share one UPDATE"""
+    groups = defaultdict(list)
+    for key, deltas in changes.items():
+        deltas = tuple(sorted((name, value) for name, value in deltas.items() if value))
+        if deltas:
+            groups[deltas].append(key)
+    return groups
+
+
+def _day_bounds(first_day, last_day):
+    start = timezone.make_aware(datetime.combine(first_day, time.min))
+    end = timezone.make_aware(datetime.combine(last_day + timedelta(days=1), time.min))
+    return start, end
+
+
+def _with_artist_totals(rows, model, bucket_field):
+    """Per-song model rows plus one artist-total row per (artist, bucket)."""
+    totals = defaultdict(lambda: dict.fromkeys(METRICS, 0))
+    objects = []
+    for row in rows:
+        counts = {name: row[f"{name}_total"] for name in METRICS}
+        objects.append(model(song_id=row['song_id'], artist_id=row['artist_id'],
+                             **{bucket_field: row['bucket']}, **counts))
+        total = totals[(row['artist_id'], row['bucket'])]
+        for name in METRICS:
+            total[name] += counts[name]
+    objects += [
+        model(song=None, artist_id=artist_id, **{bucket_field: bucket}, **counts)
+        for (artist_id, bucket), counts in totals.items()
+    ]
+    return objects
+
+
+def _sums():
+    # Annotations may not reuse the model's field names.
+    return {f"{name}_total": Sum(name) for name in METRICS}
+
+
+def rollup_watermark():
+    """First day whose hourly rows are not all compacted yet; None before the first rollup."""
+    state = StatRollup.objects.first()
+    return state.watermark if state else None
+
+
+def rollup(first_day, last_day=None):
+    """
+    Recomputes daily rows for [first_day, last_day] from hourly rows and the
+    monthly rows of the months those days fall in. Rows are rebuilt rather
+    than incremented, so the job can be rerun or restarted at any time.
+    When first_day is at or before the watermark, the watermark moves up to
+    the day after last_day, but never past today. Returns the number of
+    daily rows written.
+    """
+    today = timezone.localdate()
+    last_day = last_day or today
+    watermark = rollup_watermark()
+    # prune_hourly() never deletes hours at or after the watermark.
+    earliest = today - timedelta(days=HOURLY_RETENTION_DAYS)
+    if watermark is not None:
+        earliest = min(earliest, watermark)
+    if first_day < earliest:
+        raise ValueError(f"Hourly data before {earliest} may have been pruned")
+
+    start, end = _day_bounds(first_day, last_day)
+    first_month = first_day.replace(day=1)
+
+    with transaction.atomic():
+        daily = (
+            SongStatHourly.objects.filter(hour__gte=start, hour__lt=end, song__isnull=False)
+            .annotate(bucket=TruncDate('hour'))
+            .values('bucket', 'song_id', 'artist_id')
+            .annotate(**_sums())
+        )
+        SongStatDaily.objects.filter(day__gte=first_day, day__lte=last_day).delete()
+        written = SongStatDaily.objects.bulk_create(
+            _with_artist_totals(daily, SongStatDaily, 'day'), batch_size=1000
+        )
+
+        monthly = (
+            SongStatDaily.objects.filter(day__gte=first_month, day__lte=last_day, song__isnull=False)
+            .annotate(bucket=TruncMonth('day'))
+            .values('bucket', 'song_id', 'artist_id')
+            .annotate(**_sums())
+        )
+        SongStatMonthly.objects.filter(month__gte=first_month, month__lte=last_day).delete()
+        SongStatMonthly.objects.bulk_create(
+            _with_artist_totals(monthly, SongStatMonthly, 'month'), batch_size=1000
+        )
+
+        # Today is still being written to, so it stays after the watermark.
+        compacted = min(last_day + timedelta(days=1), today)
+        if watermark is None:
+            StatRollup.objects.create(watermark=compacted)
+        elif first_day <= watermark < compacted:
+            StatRollup.objects.update(watermark=compacted)
+    return len(written)
+
+
+def prune_hourly():
+    """
+    Deletes hourly rows past the retention window that are also before the
+    watermark, so nothing is deleted before rollup() has compacted it.
+    Returns the row count.
+    """
+    watermark = rollup_watermark()
+    if watermark is None:
+        return 0
+    cutoff_day = min(timezone.localdate() - timedelta(days=HOURLY_RETENTION_DAYS), watermark)
+    cutoff, _ = _day_bounds(cutoff_day, cutoff_day)
+    deleted, _ = SongStatHourly.objects.filter(hour__lt=cutoff).delete()
+    return deleted
+
+
+def choose_granularity(start, end):
+    """Finest granularity that keeps the chart under MAX_POINTS buckets."""
+    days = (end - start).days + 1
+    if days * 24 <= MAX_POINTS and start >= timezone.localdate() - timedelta(days=HOURLY_RETENTION_DAYS):
+        return 'hour'
+    if days <= MAX_POINTS:
+        return 'day'
+    return 'month'
+
+
+def chart(artist, start, end, song=None, granularity=None):
+    """Returns (granularity, points) for an artist, or one of their songs, over [start, end]."""
+    granularity = granularity or choose_granularity(start, end)
+    if granularity == 'hour':
+        low, high = _day_bounds(start, end)
+        rows = SongStatHourly.objects.filter(artist=artist, hour__gte=low, hour__lt=high)
+        bucket = 'hour'
+    elif granularity == 'day':
+        rows = SongStatDaily.objects.filter(artist=artist, day__gte=start, day__lte=end)
+        bucket = 'day'
+    else:
+        rows = SongStatMonthly.objects.filter(artist=artist, month__gte=start.replace(day=1), month__lte=end)
+        bucket = 'month'
+
+    rows = rows.filter(song=song).values(bucket).annotate(**_sums())
+
+    points = [
+        {'bucket': row[bucket].isoformat(), **{name: row[f"{name}_total"] for name in METRICS}}
+        for row in rows.order_by(bucket)
+    ]
+    return granularity, points
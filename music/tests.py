@@ -1,3 +1,893 @@
-from django.test import TestCase
+import json
+import os
+import re
+import tempfile
+import unittest
+import uuid
+from datetime import date, timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import QuerySet
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from music import export, library, live, playlists, radio, renderers, year_review
+from music.models import Album, Genre, Playlist, PlaylistItem, Song, SongLike, SongPlay, SongSuccessors, TitleLock
+from music.music_enum import Visibility
+from music.throttling import FIXED_WINDOW, SLIDING_WINDOW, RouteThrottle
+from music.utils import BATCH_MAX_IDS, album_resolver, genre_resolver
+from music.viewsets import SongViewSet
+from users.models import User
+from users.role_enum import RoleEnum
+
+# A table read row by row without an index, or an ORDER BY sorted after the fact.
+FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+SORT = 'USE TEMP B-TREE FOR ORDER BY'
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "Plans are checked against SQLite's EXPLAIN QUERY PLAN")
+class QueryPlanTests(TestCase):
+    """
+    Every list shape SongViewSet and AlbumViewSet serve must be answered from
+    an index: no full scan of the table and no sort of the result. A failure
+    here means a new filter or ordering needs an index in music.models.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.artist = User.objects.create(username='planner', email='planner@example.com',
+                                         role=RoleEnum.ARTIST.value)
+        cls.token = Token.objects.create(user=cls.artist)
+        cls.album = Album.objects.create(user=cls.artist, title='Plans', release_date=date(2024, 1, 1))
+        Song.objects.create(user=cls.artist, album=cls.album, title='Plan A', duration=180,
+                            release_date=date(2024, 1, 1), audio_file='https://example.com/a.mp3')
+        Song.objects.create(user=cls.artist, album=cls.album, title='Plan B', duration=200,
+                            release_date=date(2024, 2, 1), audio_file='https://example.com/b.mp3',
+                            visibility=Visibility.PRIVATE.value)
+
+    def plans(self, queries, table):
+        """EXPLAIN QUERY PLAN of every captured SELECT on table"""
+        plans = []
+        with connection.cursor() as cursor:
+            for query in queries.captured_queries:
+                sql = query['sql']
+                if sql.startswith('SELECT') and f'FROM "{table}"' in sql:
+                    cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                    plans.append((sql, [row[-1] for row in cursor.fetchall()]))
+        return plans
+
+    def assertPlansIndexed(self, plans, label, table):
+        self.assertTrue(plans, f"{label} ran no query on {table}")
+        for sql, plan in plans:
+            for step in plan:
+                self.assertIsNone(FULL_SCAN.match(step), f"{label} scans {table}:\n{sql}\n{plan}")
+                self.assertNotEqual(step, SORT, f"{label} sorts {table}:\n{sql}\n{plan}")
+
+    def assertIndexed(self, path, table, **headers):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path, headers=headers)
+        self.assertEqual(response.status_code, 200, path)
+        self.assertPlansIndexed(self.plans(queries, table), path, table)
+
+    def test_song_lists(self):
+        for path in [
+            '/api/songs/',
+            '/api/songs/?ordering=created_at',
+            '/api/songs/?ordering=-play_count',
+            '/api/songs/?ordering=likes',
+            '/api/songs/?ordering=-likes',
+            '/api/songs/?ordering=-release_date',
+            '/api/songs/?date_from=2024-01-01&date_to=2024-12-31&ordering=-release_date',
+            '/api/songs/trending/',
+            '/api/songs/trending/?time_range=week',
+            '/api/songs/trending/?time_range=month',
+        ]:
+            with self.subTest(path=path):
+                self.assertIndexed(path, 'music_song')
+
+    def test_artist_song_list(self):
+        """Artists also see their own private songs"""
+        self.assertIndexed('/api/songs/', 'music_song', authorization=f'Token {self.token.key}')
+
+    def test_album_lists(self):
+        for path in [
+            '/api/albums/',
+            '/api/albums/?ordering=created_at',
+            '/api/albums/?ordering=-created_at',
+            '/api/albums/?date_from=2024-01-01&date_to=2024-12-31',
+        ]:
+            with self.subTest(path=path):
+                self.assertIndexed(path, 'music_album')
+
+    def test_album_songs(self):
+        self.assertIndexed(f'/api/albums/{self.album.pk}/songs/', 'music_song')
+
+    def test_title_resolution(self):
+        """Uploads look genres and albums up by LOWER(title), oldest first"""
+        for resolver, table in [(genre_resolver, 'music_genre'), (album_resolver, 'music_album')]:
+            with self.subTest(table=table):
+                with CaptureQueriesContext(connection) as queries:
+                    resolver.lookup(' PLANS')
+                self.assertPlansIndexed(self.plans(queries, table), 'Title lookup', table)
+
+
+class PlaylistTotalsTests(TestCase):
+    """track_count and total_duration follow the items and the songs in them"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='curator', email='curator@example.com')
+        cls.songs = [
+            Song.objects.create(user=cls.user, title=f'Track {n}', duration=100 * n,
+                                release_date=date(2024, 1, 1), audio_file='https://example.com/t.mp3')
+            for n in range(1, 4)
+        ]
+
+    def setUp(self):
+        self.playlist = Playlist.objects.create(user=self.user, title='Mix')
+
+    def assertTotals(self, track_count, total_duration):
+        self.playlist.refresh_from_db()
+        self.assertEqual((self.playlist.track_count, self.playlist.total_duration), (track_count, total_duration))
+
+    def test_add_and_remove(self):
+        items = playlists.add_songs(self.playlist, self.songs + self.songs[:1])
+        self.assertTotals(4, 700)
+        playlists.remove_item(items[1])
+        self.assertTotals(3, 500)
+
+    def test_song_duration_edited(self):
+        items = playlists.add_songs(self.playlist, self.songs[:2] + self.songs[:1])
+        song = self.songs[0]
+        song.duration = 150
+        song.save()
+        self.assertTotals(3, 500)
+        playlists.remove_item(items[0])
+        self.assertTotals(2, 350)
+
+    def test_song_deleted(self):
+        playlists.add_songs(self.playlist, self.songs + self.songs[:1])
+        self.songs[0].delete()
+        self.assertTotals(2, 500)
+
+    def test_never_negative(self):
+        items = playlists.add_songs(self.playlist, self.songs[:1])
+        Playlist.objects.filter(pk=self.playlist.pk).update(total_duration=10)
+        playlists.remove_item(items[0])
+        self.assertTotals(0, 0)
+
+
+class PlaylistTracksTests(TestCase):
+    """Item order, keyset paging and parameter checks of PlaylistViewSet.tracks and move"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='sequencer', email='sequencer@example.com')
+        cls.token = Token.objects.create(user=cls.user)
+        cls.songs = [
+            Song.objects.create(user=cls.user, title=f'Cut {n}', duration=60,
+                                release_date=date(2024, 1, 1), audio_file='https://example.com/c.mp3')
+            for n in range(6)
+        ]
+
+    def setUp(self):
+        self.playlist = Playlist.objects.create(user=self.user, title='Order')
+        self.url = f'/api/playlists/{self.playlist.pk}/'
+        self.headers = {'authorization': f'Token {self.token.key}'}
+
+    def post(self, path, data):
+        return self.client.post(self.url + path, data, content_type='application/json', headers=self.headers)
+
+    def titles(self):
+        return list(PlaylistItem.objects.filter(playlist=self.playlist).values_list('song__title', flat=True))
+
+    def item(self, n):
+        return str(PlaylistItem.objects.get(playlist=self.playlist, song=self.songs[n]).pk)
+
+    def test_insert_and_move(self):
+        self.assertEqual(self.post('tracks/', {'song_ids': [str(self.songs[n].pk) for n in (0, 1)]}).status_code, 201)
+        self.post('tracks/', {'song_ids': [str(self.songs[2].pk)], 'after': self.item(0)})
+        self.post('tracks/', {'song_ids': [str(self.songs[3].pk)], 'before': self.item(0)})
+        self.assertEqual(self.titles(), ['Cut 3', 'Cut 0', 'Cut 2', 'Cut 1'])
+
+        self.assertEqual(self.post('move/', {'item_id': self.item(1), 'after': self.item(3)}).status_code, 200)
+        self.post('move/', {'item_id': self.item(3)})
+        self.assertEqual(self.titles(), ['Cut 1', 'Cut 0', 'Cut 2', 'Cut 3'])
+
+    def test_keyset_pages(self):
+        self.post('tracks/', {'song_ids': [str(song.pk) for song in self.songs]})
+        seen, after = [], ''
+        while True:
+            page = self.client.get(self.url + 'tracks/', {'limit': 4, 'after': after}, headers=self.headers).json()
+            seen += [item['song']['title'] for item in page['results']]
+            if page['next'] is None:
+                break
+            after = page['next']
+        self.assertEqual(seen, [f'Cut {n}' for n in range(6)])
+
+    def test_bad_parameters(self):
+        for limit in ['abc', '-1', '0', '501']:
+            with self.subTest(limit=limit):
+                response = self.client.get(self.url + 'tracks/', {'limit': limit}, headers=self.headers)
+                self.assertEqual(response.status_code, 400)
+        self.post('tracks/', {'song_ids': [str(self.songs[n].pk) for n in (0, 1, 2)]})
+        both = {'after': self.item(0), 'before': self.item(1)}
+        self.assertEqual(self.post('tracks/', {'song_ids': [str(self.songs[3].pk)], **both}).status_code, 400)
+        self.assertEqual(self.post('move/', {'item_id': self.item(2), **both}).status_code, 400)
+        for song_ids in [str(self.songs[3].pk), [], [1], [None], [{'id': str(self.songs[3].pk)}], ['nope']]:
+            with self.subTest(song_ids=song_ids):
+                self.assertEqual(self.post('tracks/', {'song_ids': song_ids}).status_code, 400)
+        self.assertEqual(self.titles(), ['Cut 0', 'Cut 1', 'Cut 2'])
+
+    def test_empty_playlist(self):
+        response = self.client.get(self.url + 'tracks/', headers=self.headers)
+        self.assertEqual(response.json(), {'results': [], 'next': None})
+
+
+class LibraryBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='collector', email='collector@example.com')
+        cls.songs = [
+            Song.objects.create(user=cls.user, title=f'Liked {n}', duration=60,
+                                release_date=date(2024, 1, 1), audio_file='https://example.com/l.mp3')
+            for n in range(2)
+        ]
+
+    def likes(self):
+        return [Song.objects.get(pk=song.pk).likes for song in self.songs]
+
+    def test_like_and_unlike(self):
+        result = library.apply(self.user, [{'op': 'like', 'id': song.pk} for song in self.songs])
+        self.assertEqual(result['applied']['like'], 2)
+        self.assertEqual(self.likes(), [1, 1])
+        result = library.apply(self.user, [{'op': 'unlike', 'id': self.songs[0].pk},
+                                           {'op': 'like', 'id': self.songs[1].pk}])
+        self.assertEqual((result['applied']['unlike'], result['applied']['like']), (1, 0))
+        self.assertEqual(self.likes(), [0, 1])
+
+    def test_concurrent_like_is_not_counted_twice(self):
+        """A like inserted between the batch's read and its insert belongs to the other request"""
+        bulk_create = QuerySet.bulk_create
+
+        def racing(queryset, objs, *args, **kwargs):
+            if queryset.model is SongLike:
+                SongLike.objects.create(user=self.user, song=self.songs[0])
+            return bulk_create(queryset, objs, *args, **kwargs)
+
+        with mock.patch.object(QuerySet, 'bulk_create', racing):
+            result = library.apply(self.user, [{'op': 'like', 'id': song.pk} for song in self.songs])
+        self.assertEqual(result['applied']['like'], 1)
+        self.assertEqual(self.likes(), [0, 1])
+        self.assertEqual(SongLike.objects.filter(user=self.user).count(), 2)
+
+
+class TitleResolverTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='tagger', email='tagger@example.com')
+        genre_resolver.entries.clear()
+
+    def test_one_normalization(self):
+        """Non-ASCII case is folded the same way for the cache and the database"""
+        genre, created = genre_resolver.resolve(' Électro ', user=self.user)
+        self.assertTrue(created)
+        self.assertEqual((genre.title, genre.title_key), ('Électro', 'électro'))
+        genre_resolver.entries.clear()
+        self.assertEqual(genre_resolver.resolve('ÉLECTRO', user=self.user), (genre, False))
+
+    def test_title_edit_moves_the_key(self):
+        genre, _ = genre_resolver.resolve('Dub', user=self.user)
+        genre.title = 'Dubstep'
+        genre.save(update_fields=['title'])
+        self.assertEqual(Genre.objects.get(pk=genre.pk).title_key, 'dubstep')
+        self.assertEqual(genre_resolver.resolve('dubstep', user=self.user), (genre, False))
+
+    def test_row_created_concurrently_is_reused(self):
+        """A row created by another process after the first lookup is found under the lock, never deleted"""
+        theirs = Genre.objects.create(title='Techno', user=self.user)
+        lookup = genre_resolver.lookup
+        with mock.patch.object(genre_resolver, 'lookup', side_effect=[None, lookup('Techno')]):
+            self.assertEqual(genre_resolver.resolve('techno', user=self.user), (theirs, False))
+        self.assertEqual(Genre.objects.filter(title_key='techno').count(), 1)
+        self.assertTrue(TitleLock.objects.filter(model='genre', key='techno').exists())
+
+
+class YearReviewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='replayer', email='replayer@example.com')
+        cls.token = Token.objects.create(user=cls.user)
+        cls.songs = [
+            Song.objects.create(user=cls.user, title=f'Loop {n}', duration=120,
+                                release_date=date(2024, 1, 1), audio_file='https://example.com/y.mp3')
+            for n in range(2)
+        ]
+
+    def setUp(self):
+        self.headers = {'authorization': f'Token {self.token.key}'}
+
+    def test_repeat_plays_are_ranked(self):
+        for song in [self.songs[0], self.songs[1], self.songs[0], self.songs[0]]:
+            self.client.post(f'/api/songs/{song.pk}/play/', headers=self.headers)
+        year = timezone.now().year
+        self.assertEqual(year_review.build_year(year), 1)
+
+        response = self.client.get('/api/songs/year_in_review/', {'year': year}, headers=self.headers)
+        summary = response.json()
+        self.assertEqual((summary['play_count'], summary['minutes_listened']), (4, 8))
+        self.assertEqual([(song['title'], song['plays']) for song in summary['top_songs']],
+                         [('Loop 0', 3), ('Loop 1', 1)])
+
+    def test_bad_year(self):
+        for year in ['abc', '0', '10000']:
+            with self.subTest(year=year):
+                response = self.client.get('/api/songs/year_in_review/', {'year': year}, headers=self.headers)
+                self.assertEqual(response.status_code, 400)
+
+
+class RadioTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.listener = User.objects.create(username='tuner', email='tuner@example.com')
+        cls.artist = User.objects.create(username='broadcaster', email='broadcaster@example.com')
+        cls.token = Token.objects.create(user=cls.listener)
+        cls.seed, cls.hidden, cls.shown = [
+            Song.objects.create(user=cls.artist, title=title, duration=60, visibility=visibility.value,
+                                release_date=date(2024, 1, 1), audio_file='https://example.com/r.mp3')
+            for title, visibility in [('Seed', Visibility.PUBLIC), ('Demo', Visibility.PRIVATE),
+                                      ('Single', Visibility.PUBLIC)]
+        ]
+        SongSuccessors.objects.create(song=cls.seed, data=radio.pack_successors(
+            [(cls.hidden.pk, 1000), (cls.shown.pk, 1)]
+        ))
+
+    def setUp(self):
+        cache.clear()
+        self.url = f'/api/songs/{self.seed.pk}/radio/'
+        self.headers = {'authorization': f'Token {self.token.key}'}
+
+    def test_private_successors_are_skipped(self):
+        session, song_ids = radio.next_batch(self.seed, self.listener, 5)
+        self.assertEqual(song_ids, [self.shown.pk])
+
+    def test_session_is_bound_to_listener_and_seed(self):
+        session, _ = radio.next_batch(self.seed, self.listener, 1)
+        self.assertEqual(radio.next_batch(self.seed, self.listener, 1, session)[0], session)
+        self.assertNotEqual(radio.next_batch(self.seed, self.artist, 1, session)[0], session)
+        self.assertNotEqual(radio.next_batch(self.shown, self.listener, 1, session)[0], session)
+
+    def test_bad_count(self):
+        for count in ['abc', '0', '51']:
+            with self.subTest(count=count):
+                self.assertEqual(self.client.get(self.url, {'count': count}, headers=self.headers).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'count': 2}, headers=self.headers).status_code, 200)
+
+
+class RouteThrottleTests(TestCase):
+    """Counters in the throttle cache change only through add() and incr()"""
+
+    def setUp(self):
+        caches['throttle'].clear()
+        request = Request(APIRequestFactory().get('/api/songs/random/', REMOTE_ADDR='10.0.0.1'))
+        self.view = SongViewSet(basename='song', action='random', request=request)
+        self.request = request
+        self.now = 600.0
+        patcher = mock.patch('music.throttling.time.time', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def allowed(self, strategy, rate, times, throttle=None):
+        throttles = {'song-random': {'strategy': strategy, 'rates': {'default': rate}}}
+        throttle = throttle or RouteThrottle()
+        with override_settings(API_THROTTLES=throttles):
+            return sum(throttle.allow_request(self.request, self.view) for _ in range(times))
+
+    def test_fixed_window(self):
+        self.assertEqual(self.allowed(FIXED_WINDOW, '3/min', 5), 3)
+        self.now += 59
+        self.assertEqual(self.allowed(FIXED_WINDOW, '3/min', 1), 0)
+        self.now += 1
+        self.assertEqual(self.allowed(FIXED_WINDOW, '3/min', 5), 3)
+
+    def test_stale_reads_cannot_overshoot(self):
+        """Requests that all read the counter before any of them wrote it"""
+        throttle = RouteThrottle()
+        with mock.patch.object(throttle.cache, 'get', return_value=0), \
+                mock.patch.object(throttle.cache, 'get_many', return_value={}):
+            self.assertEqual(self.allowed(FIXED_WINDOW, '3/min', 5, throttle), 3)
+            self.assertEqual(self.allowed(SLIDING_WINDOW, '3/hour', 5, throttle), 3)
+        # The sliding window hands back the slots its losers took.
+        self.assertEqual(caches['throttle'].get(f'throttle:song-random:10.0.0.1:{int(self.now // 3600)}'), 3)
+
+    def test_sliding_window_weighs_the_previous_window(self):
+        self.now += 30
+        self.assertEqual(self.allowed(SLIDING_WINDOW, '4/min', 6), 4)
+        # Halfway through the next window, half of those four still count.
+        self.now += 60
+        throttle = RouteThrottle()
+        self.assertEqual(self.allowed(SLIDING_WINDOW, '4/min', 6, throttle), 2)
+        self.assertGreater(throttle.wait(), 0)
+
+
+class ImportCatalogTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'catalog.jsonl')
+        row = {'release_date': '2024-01-01', 'duration': 60, 'audio_file': 'https://example.com/i.mp3'}
+        rows = [
+            {**row, 'title': 'Long', 'genre': 'G' * 150, 'album': 'A' * 150},
+            {**row, 'title': 'Rejected', 'genre': 'Orphan', 'visibility': 'loud'},
+        ]
+        with open(self.path, 'w') as f:
+            f.writelines(json.dumps(row) + '\n' for row in rows)
+        self.row = row
+
+    def run_import(self):
+        out = StringIO()
+        call_command('import_catalog', self.path, stdout=out)
+        return out.getvalue().splitlines()[-1]
+
+    def test_long_titles_are_cut_and_rejected_rows_create_nothing(self):
+        self.assertIn('Wrote 1 songs', self.run_import())
+        song = Song.objects.get(title='Long')
+        self.assertEqual((song.genre.title, song.album.title), ('G' * 100, 'A' * 100))
+        self.assertFalse(Genre.objects.filter(title='Orphan').exists())
+
+    def test_rerun_counts_only_new_rows(self):
+        self.run_import()
+        self.assertIn('Wrote 0 songs', self.run_import())
+        self.assertEqual(Song.objects.count(), 1)
+
+    def test_bad_rows_are_counted_as_invalid(self):
+        rows = [
+            {**self.row, 'title': 'Backwards', 'duration': -5},
+            {**self.row, 'title': 'Hidden', 'visibility': 3},
+            ['not', 'an', 'object'],
+        ]
+        with open(self.path, 'a') as f:
+            f.writelines(json.dumps(row) + '\n' for row in rows)
+            f.write('{"title": "Truncated", \n')
+        summary = self.run_import()
+        self.assertIn('Wrote 1 songs', summary)
+        self.assertIn('5 invalid rows', summary)
+
+
+class ExportSinceTests(TestCase):
+    """An incremental export carries counter updates and the songs that left the catalog"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='mirror', email='mirror@example.com')
+        cls.song = Song.objects.create(user=cls.user, title='Mirrored', duration=60,
+                                       release_date=date(2024, 1, 1), audio_file='https://example.com/e.mp3')
+
+    def setUp(self):
+        self.since = timezone.now()
+        Song.objects.filter(pk=self.song.pk).update(updated_at=self.since - timedelta(days=1))
+
+    def exported(self):
+        return [row['id'] for rows in export.iter_song_chunks(updated_since=self.since) for row in rows]
+
+    def test_play(self):
+        self.client.post(f'/api/songs/{self.song.pk}/play/')
+        self.assertEqual(self.exported(), [self.song.pk])
+
+    def test_library_like(self):
+        library.apply(self.user, [{'op': 'like', 'id': self.song.pk}])
+        self.assertEqual(self.exported(), [self.song.pk])
+
+    def removed(self, updated_since):
+        return [row['id'] for rows in export.iter_song_chunks(updated_since=updated_since)
+                for row in rows if row.get('removed')]
+
+    def test_made_private(self):
+        self.song.visibility = Visibility.PRIVATE.value
+        self.song.save()
+        self.assertEqual(self.removed(self.since), [self.song.pk])
+        self.assertEqual(self.removed(timezone.now() + timedelta(seconds=1)), [])
+
+    def test_deleted(self):
+        pk = self.song.pk
+        self.song.delete()
+        self.assertEqual(self.removed(self.since), [pk])
+        # A full export lists only what is there.
+        self.assertEqual([row for rows in export.iter_song_chunks() for row in rows], [])
+
+    def test_accept_encoding(self):
+        for header, expected in [('gzip', True), ('deflate, gzip;q=0.5', True), ('GZIP', True),
+                                 ('*', True), ('', False), ('identity', False), ('gzip;q=0', False),
+                                 ('gzip;q=0.0, *', False), ('*;q=0', False), ('x-gzip-ish', False)]:
+            self.assertEqual(export.accepts_gzip(header), expected, header)
+        token = Token.objects.create(user=self.user)
+        response = self.client.get('/api/songs/export/', headers={
+            'authorization': f'Token {token.key}', 'accept-encoding': 'gzip;q=0, identity'})
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(json.loads(b''.join(response.streaming_content))['id'], str(self.song.pk))
+
+
+class AlbumTotalsTests(TestCase):
+    """Album.track_count and total_duration follow every way a song is written (music.album_totals)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.artist = User.objects.create(username='compiler', email='compiler@example.com')
+
+    def setUp(self):
+        self.albums = [Album.objects.create(title=f'Side {n}', release_date=date(2024, 1, 1)) for n in 'AB']
+
+    def song(self, album, duration=100, user=None):
+        return Song.objects.create(user=user or self.artist, album=album, title='Track', duration=duration,
+                                   release_date=date(2024, 1, 1), audio_file='https://example.com/t.mp3')
+
+    def totals(self):
+        return [(album.track_count, album.total_duration)
+                for album in Album.objects.filter(pk__in=[album.pk for album in self.albums]).order_by('title')]
+
+    def test_add(self):
+        self.song(self.albums[0], 100)
+        self.song(self.albums[0], 50)
+        self.assertEqual(self.totals(), [(2, 150), (0, 0)])
+
+    def test_move(self):
+        song = self.song(self.albums[0], 100)
+        song.album = self.albums[1]
+        song.save()
+        self.assertEqual(self.totals(), [(0, 0), (1, 100)])
+
+    def test_duration_edit(self):
+        song = self.song(self.albums[0], 100)
+        song.duration = 130
+        song.save(update_fields=['duration'])
+        self.assertEqual(self.totals(), [(1, 130), (0, 0)])
+
+    def test_deferred_field_save(self):
+        song = self.song(self.albums[0], 100)
+        partial = Song.objects.only('id', 'title').get(pk=song.pk)
+        partial.title = 'Renamed'
+        partial.save()
+        self.assertEqual(self.totals(), [(1, 100), (0, 0)])
+
+    def test_save_without_counted_fields_skips_the_lookup(self):
+        song = self.song(self.albums[0], 100)
+        song.duration = 999  # unsaved edit, not part of the save below
+        with self.assertNumQueries(1):
+            song.save(update_fields=['likes'])
+        self.assertEqual(self.totals(), [(1, 100), (0, 0)])
+
+    def test_delete(self):
+        song = self.song(self.albums[0], 100)
+        self.song(self.albums[0], 40)
+        song.delete()
+        self.assertEqual(self.totals(), [(1, 40), (0, 0)])
+
+    def test_cascade_delete(self):
+        guest = User.objects.create(username='guest', email='guest@example.com')
+        self.song(self.albums[0], 100, user=guest)
+        self.song(self.albums[0], 40)
+        guest.delete()
+        self.assertEqual(self.totals(), [(1, 40), (0, 0)])
+
+    def test_expanded_album_reads_totals_in_the_list_query(self):
+        for duration in (100, 40, 60):
+            self.song(self.albums[0], duration)
+        # One query for the page, however many songs share the album.
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/songs/?fields=id,album&expand=album')
+        self.assertEqual(response.status_code, 200)
+        rows = response.json()
+        rows = rows['results'] if isinstance(rows, dict) else rows
+        self.assertEqual({(row['album']['track_count'], row['album']['total_duration']) for row in rows}, {(3, 200)})
+
+
+class SparseFieldsTests(TestCase):
+    """?fields= and ?expand= on the song and album lists (music.serializers.SparseFieldsMixin)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.artist = User.objects.create(username='sparse', email='sparse@example.com',
+                                         role=RoleEnum.ARTIST.value)
+        for n in range(3):
+            album = Album.objects.create(user=cls.artist, title=f'Sparse {n}', release_date=date(2024, 1, 1))
+            genre = Genre.objects.create(user=cls.artist, title=f'Sparse {n}')
+            Song.objects.create(user=cls.artist, album=album, genre=genre, title=f'Sparse {n}', duration=100,
+                                release_date=date(2024, 1, 1), audio_file='https://example.com/s.mp3')
+
+    def get(self, path):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_only_requested_fields(self):
+        rows = self.get('/api/songs/?fields=id,title')
+        self.assertEqual(len(rows), 3)
+        self.assertEqual({tuple(sorted(row)) for row in rows}, {('id', 'title')})
+        rows = self.get('/api/albums/?fields=title,track_count')
+        self.assertEqual({tuple(sorted(row)) for row in rows}, {('title', 'track_count')})
+
+    def test_unexpanded_relations_render_ids(self):
+        rows = self.get('/api/songs/?fields=album,genre')
+        self.assertCountEqual(rows, [{'album': str(song.album_id), 'genre': str(song.genre_id)}
+                                     for song in Song.objects.all()])
+
+    def test_expand(self):
+        row = self.get('/api/songs/?fields=id,album,genre&expand=genre')[0]
+        self.assertIsInstance(row['album'], str)
+        self.assertEqual(set(row['genre']), {'id', 'title', 'user'})
+        row = self.get('/api/songs/?fields=id,album&expand=album,genre')[0]
+        self.assertEqual(set(row), {'id', 'album'})
+        self.assertEqual(row['album']['user'], 'sparse')
+
+    def test_detail(self):
+        song = Song.objects.get(title='Sparse 0')
+        row = self.get(f'/api/songs/{song.pk}/?fields=title,genre&expand=genre')
+        self.assertEqual(row, {'title': 'Sparse 0', 'genre': {'id': str(song.genre_id), 'title': 'Sparse 0',
+                                                               'user': 'sparse'}})
+
+    def test_unknown_names_are_rejected(self):
+        for path, key in [('/api/songs/?fields=id,plays', 'fields'),
+                          ('/api/songs/?fields=id,user&expand=user', 'expand'),
+                          ('/api/albums/?expand=user', 'expand')]:
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, 400, path)
+            self.assertIn(key, response.json(), path)
+
+    def test_one_query_per_list(self):
+        for path in ['/api/songs/?fields=id,title',
+                     '/api/songs/?fields=id,album,genre',
+                     '/api/songs/?fields=id,album&expand=album',
+                     '/api/songs/?fields=id,genre&expand=genre',
+                     '/api/songs/?fields=id,album,genre&expand=album,genre',
+                     '/api/albums/?fields=id,user']:
+            with self.assertNumQueries(1, msg=path):
+                self.get(path)
+
+    def test_projection_skips_unrendered_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.get('/api/songs/?fields=id,title')
+        sql = queries.captured_queries[0]['sql']
+        self.assertNotIn('audio_file', sql)
+        self.assertNotIn('JOIN', sql)
+
+
+# music.async_urls are only mounted by Spotify_Clone.urls when ASYNC_VIEWS is
+# read at import time, so these tests route to them directly.
+@override_settings(ASYNC_VIEWS=True, ROOT_URLCONF='music.async_urls')
+class AsyncViewTests(TestCase):
+    """The async hot paths answer like the SongViewSet/ArtistViewSet actions they shadow"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.artist = User.objects.create(username='streamer', email='streamer@example.com',
+                                         role=RoleEnum.ARTIST.value)
+        cls.listener = User.objects.create(username='earbuds', email='earbuds@example.com')
+        cls.token = Token.objects.create(user=cls.listener)
+        cls.song = Song.objects.create(user=cls.artist, title='Async', duration=60,
+                                       release_date=date(2024, 1, 1), audio_file='https://example.com/a.mp3')
+        cls.hidden = Song.objects.create(user=cls.artist, title='Hidden', duration=60,
+                                         release_date=date(2024, 1, 1), audio_file='https://example.com/h.mp3',
+                                         visibility=Visibility.PRIVATE.value)
+
+    def setUp(self):
+        caches['throttle'].clear()
+        self.headers = {'authorization': f'Token {self.token.key}'}
+
+    async def test_play(self):
+        response = await self.async_client.post(f'/songs/{self.song.pk}/play/', headers=self.headers)
+        self.assertEqual((response.status_code, response.json()), (200, {'play_count': 1}))
+        self.assertEqual(await SongPlay.objects.filter(user=self.listener).acount(), 1)
+        response = await self.async_client.post(f'/songs/{self.song.pk}/play/')
+        self.assertEqual(response.json(), {'play_count': 2})
+        response = await self.async_client.post(f'/songs/{self.hidden.pk}/play/', headers=self.headers)
+        self.assertEqual(response.status_code, 404)
+        response = await self.async_client.get(f'/songs/{self.song.pk}/play/')
+        self.assertEqual(response.status_code, 405)
+
+    async def test_play_throttled(self):
+        throttles = {'song-play': {'rates': {'default': '1/min'}}}
+        with override_settings(API_THROTTLES=throttles):
+            first = await self.async_client.post(f'/songs/{self.song.pk}/play/', headers=self.headers)
+            second = await self.async_client.post(f'/songs/{self.song.pk}/play/', headers=self.headers)
+        self.assertEqual((first.status_code, second.status_code), (200, 429))
+        self.assertIn('Retry-After', second.headers)
+
+    async def test_like_and_unlike(self):
+        like, unlike = f'/songs/{self.song.pk}/like/', f'/songs/{self.song.pk}/unlike/'
+        response = await self.async_client.post(like)
+        self.assertEqual((response.status_code, response.headers['WWW-Authenticate']), (401, 'Token'))
+        for path, likes in [(like, 1), (like, 1), (unlike, 0), (unlike, 0)]:
+            response = await self.async_client.post(path, headers=self.headers)
+            self.assertEqual(response.json(), {'likes': likes}, path)
+
+    async def test_favorite(self):
+        path = f'/songs/{self.song.pk}/favorite/'
+        statuses = [(await self.async_client.post(path, headers=self.headers)).status_code,
+                    (await self.async_client.post(path, headers=self.headers)).status_code,
+                    (await self.async_client.delete(path, headers=self.headers)).status_code,
+                    (await self.async_client.delete(path, headers=self.headers)).status_code]
+        self.assertEqual(statuses, [201, 200, 200, 404])
+
+    async def test_follow(self):
+        path = f'/artists/{self.artist.pk}/follow/'
+        statuses = [(await self.async_client.post(path, headers=self.headers)).status_code,
+                    (await self.async_client.post(path, headers=self.headers)).status_code,
+                    (await self.async_client.delete(path, headers=self.headers)).status_code,
+                    (await self.async_client.delete(path, headers=self.headers)).status_code]
+        self.assertEqual(statuses, [201, 200, 200, 404])
+        response = await self.async_client.post(f'/artists/{self.listener.pk}/follow/', headers=self.headers)
+        self.assertEqual(response.status_code, 404)
+
+    async def test_recently_played(self):
+        await self.async_client.post(f'/songs/{self.song.pk}/play/', headers=self.headers)
+        response = await self.async_client.get('/songs/recently_played/?limit=1', headers=self.headers)
+        self.assertEqual([row['id'] for row in response.json()], [str(self.song.pk)])
+        for limit in ('-1', '0', 'all'):
+            response = await self.async_client.get(f'/songs/recently_played/?limit={limit}',
+                                                   headers=self.headers)
+            self.assertEqual(response.status_code, 400, limit)
+
+
+@unittest.skipUnless(renderers.orjson and renderers.msgpack, "orjson and msgpack are optional")
+class RendererTests(TestCase):
+    """Buffered and streamed responses carry the same bytes in every negotiated format"""
+
+    @classmethod
+    def setUpTestData(cls):
+        artist = User.objects.create(username='encoder', email='encoder@example.com')
+        for n in range(5):
+            Song.objects.create(user=artist, title=f'Encoded {n}', duration=60 + n,
+                                release_date=date(2024, 1, 1), audio_file='https://example.com/e.mp3')
+
+    def get(self, accept, path='/api/songs/'):
+        response = self.client.get(path, headers={'accept': accept})
+        self.assertEqual(response.status_code, 200)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response['Content-Type'], body
+
+    def test_negotiation(self):
+        self.assertEqual(self.get('application/json')[0], 'application/json')
+        self.assertEqual(self.get('application/msgpack')[0], 'application/msgpack')
+        self.assertEqual(self.get('*/*')[0], 'application/json')
+        self.assertTrue(self.get('text/html')[0].startswith('text/html'))
+
+    def test_round_trip(self):
+        rows = json.loads(self.get('application/json')[1])
+        self.assertEqual(len(rows), 5)
+        unpacker = renderers.msgpack.Unpacker()
+        unpacker.feed(self.get('application/msgpack')[1])
+        self.assertEqual(list(unpacker), rows)
+
+    def test_stream_matches_buffered(self):
+        for accept in ('application/json', 'application/msgpack'):
+            self.assertEqual(self.get(accept, '/api/songs/?stream=1'), self.get(accept), accept)
+
+    def test_chunked_stream_matches_buffered(self):
+        rows = [{'id': n, 'title': f'Row {n}'} for n in range(7)]
+        for renderer in (renderers.ORJSONRenderer(), renderers.MessagePackRenderer()):
+            chunks = [rows[:3], [], rows[3:6], rows[6:]]
+            self.assertEqual(b''.join(renderer.render_stream(chunks)), renderer.render(rows), renderer.format)
+            self.assertEqual(b''.join(renderer.render_stream([])), renderer.render([]), renderer.format)
+
+
+class BatchLookupTests(TestCase):
+    """GET songs/batch/ and albums/batch/ (music.utils.parse_batch_ids)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.artist = User.objects.create(username='batched', email='batched@example.com',
+                                         role=RoleEnum.ARTIST.value)
+        cls.token = Token.objects.create(user=cls.artist)
+        cls.albums = [Album.objects.create(user=cls.artist, title=f'Batch {n}', release_date=date(2024, 1, 1))
+                      for n in range(3)]
+        cls.songs = [
+            Song.objects.create(user=cls.artist, title=f'Batch {n}', duration=60, release_date=date(2024, 1, 1),
+                                audio_file='https://example.com/b.mp3')
+            for n in range(3)
+        ]
+        cls.private = Song.objects.create(user=cls.artist, title='Unreleased', duration=60,
+                                          release_date=date(2024, 1, 1), audio_file='https://example.com/u.mp3',
+                                          visibility=Visibility.PRIVATE.value)
+
+    def batch(self, path, ids, **headers):
+        return self.client.get(path, {'ids': ','.join(str(i) for i in ids)}, headers=headers)
+
+    def test_requested_order_and_missing_ids(self):
+        unknown = uuid.uuid4()
+        for path, objects in [('/api/songs/batch/', self.songs), ('/api/albums/batch/', self.albums)]:
+            ids = [objects[2].pk, unknown, objects[0].pk, objects[2].pk]
+            response = self.batch(path, ids)
+            self.assertEqual(response.status_code, 200, path)
+            self.assertEqual([row['id'] for row in response.json()['results']],
+                             [str(objects[2].pk), str(objects[0].pk)], path)
+            self.assertEqual(response.json()['missing'], [str(unknown)], path)
+
+    def test_private_songs_are_missing_except_to_their_artist(self):
+        ids = [self.private.pk, self.songs[0].pk]
+        self.assertEqual(self.batch('/api/songs/batch/', ids).json()['missing'], [str(self.private.pk)])
+        response = self.batch('/api/songs/batch/', ids, authorization=f'Token {self.token.key}')
+        self.assertEqual([row['id'] for row in response.json()['results']], [str(pk) for pk in ids])
+
+    def test_bad_ids_are_rejected(self):
+        for path in ('/api/songs/batch/', '/api/albums/batch/'):
+            for query in ({}, {'ids': ''}, {'ids': f'{self.songs[0].pk},nope'},
+                          {'ids': ','.join(str(uuid.uuid4()) for _ in range(BATCH_MAX_IDS + 1))}):
+                self.assertEqual(self.client.get(path, query).status_code, 400, (path, query))
+        ids = [uuid.uuid4() for _ in range(BATCH_MAX_IDS)]
+        self.assertEqual(self.batch('/api/songs/batch/', ids).status_code, 200)
+
+
+class LiveHubTests(TestCase):
+    """Listener sets, tick coalescing and the SSE body of music.live"""
+
+    def setUp(self):
+        self.now = 1000.0
+        # Replaces the module, not time.monotonic, which the event loop reads too.
+        clock = mock.Mock(monotonic=lambda: self.now)
+        for patcher in [mock.patch.object(live, 'time', clock),
+                        # Ticks are driven by the tests.
+                        mock.patch.object(live.ListenerHub, 'ensure_ticker')]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.hub = live.ListenerHub()
+
+    def test_plays_are_ignored_without_subscribers(self):
+        self.hub.record_play('ann', 'song-a', 'artist', 60)
+        self.assertEqual(self.hub.current, {})
+        subscriber = self.hub.subscribe(['song-a'], [])
+        self.hub.record_play('ann', 'song-a', 'artist', 60)
+        self.assertEqual(self.hub.counts('songs', ['song-a']), {'song-a': 1})
+        # The last one to leave takes the listener state with it.
+        self.hub.unsubscribe(subscriber)
+        self.assertEqual((self.hub.current, self.hub.expiry), ({}, []))
+
+    def test_listeners_expire_or_move_on(self):
+        self.hub.subscribe(['song-a', 'song-b'], ['artist'])
+        self.hub.record_play('ann', 'song-a', 'artist', 60)
+        self.hub.record_play('bob', 'song-a', 'artist', 30)
+        self.assertEqual(self.hub.counts('songs', ['song-a']), {'song-a': 2})
+        self.now += 30
+        self.assertEqual(self.hub.counts('songs', ['song-a']), {'song-a': 1})
+        self.hub.record_play('ann', 'song-b', 'artist', 60)
+        self.assertEqual(self.hub.counts('songs', ['song-a', 'song-b']), {'song-a': 0, 'song-b': 1})
+        # Ann's first play expiring now must not end her second.
+        self.now += 30
+        self.assertEqual(self.hub.counts('artists', ['artist']), {'artist': 1})
+        self.now += 30
+        self.assertEqual(self.hub.counts('artists', ['artist']), {'artist': 0})
+
+    def test_tick_sends_only_the_latest_changed_counts(self):
+        subscriber = self.hub.subscribe(['song-a', 'song-b'], ['artist'])
+        self.hub.record_play('ann', 'song-a', 'artist', 60)
+        self.hub.record_play('bob', 'song-a', 'artist', 60)
+        self.hub.record_play('ann', 'song-c', 'artist', 60)
+        self.assertFalse(subscriber.ready.is_set())
+        self.hub.tick()
+        self.assertTrue(subscriber.ready.is_set())
+        # song-c is not watched; song-b did not change.
+        self.assertEqual(subscriber.take(), {'songs': {'song-a': 1}, 'artists': {'artist': 2}})
+        self.hub.tick()
+        self.assertFalse(subscriber.ready.is_set())
+
+    async def test_stream_snapshot_keepalive_and_updates(self):
+        self.hub.subscribe(['song-a'], [])
+        self.hub.record_play('ann', 'song-a', 'artist', 60)
+        with mock.patch.object(live, 'hub', self.hub), mock.patch.object(live, 'KEEPALIVE_SECONDS', 0.01):
+            body = live.stream(['song-a'], ['artist'])
+            self.assertEqual(await anext(body), live.event('counts', {'songs': {'song-a': 1},
+                                                                      'artists': {'artist': 1}}))
+            self.assertEqual(await anext(body), ': keepalive\n\n')
+            self.hub.record_play('bob', 'song-a', 'artist', 60)
+            self.hub.tick()
+            self.assertEqual(await anext(body), live.event('counts', {'songs': {'song-a': 2},
+                                                                      'artists': {'artist': 2}}))
+            await body.aclose()
+        self.assertEqual(len(self.hub.subscribers['songs']['song-a']), 1)
+        self.assertNotIn('artist', self.hub.subscribers['artists'])
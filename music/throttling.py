@@ -0,0 +1,145 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+FIXED_WINDOW = 'fixed_window'
+SLIDING_WINDOW = 'sliding_window'
+
+ANON_TIER = 'anon'
+DEFAULT_TIER = 'default'
+TIER_CACHE_SECONDS = 60
+
+DURATIONS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """Turns '30/min' into (30, 60). Returns (None, None) for an empty rate."""
+    if not rate:
+        return None, None
+    num, period = rate.split('/')
+    return int(num), DURATIONS[period[0]]
+
+
+def get_route_name(view):
+    """Route key used in API_THROTTLES, e.g. 'song-search' or 'artist-profile'."""
+    basename = getattr(view, 'basename', None) or view.__class__.__name__.lower()
+    action = getattr(view, 'action', None) or view.request.method.lower()
+    return f"{basename}-{action}"
+
+
+class RouteThrottle(BaseThrottle):
+    """
+    Throttles requests per route and per subscription tier.
+    Routes and limits come from settings.API_THROTTLES; routes that are not
+    configured are never throttled. Counters live in the cache alias named by
+    settings.API_THROTTLE_CACHE so they never touch the database.
+
+    Counters only change through cache.add() and cache.incr(), which are
+    atomic on Redis and Memcached. The limit is per process unless that
+    cache is shared between workers; the locmem default is for development.
+    """
+
+    def __init__(self):
+        self.cache = caches[getattr(settings, 'API_THROTTLE_CACHE', 'default')]
+        self.wait_seconds = None
+
+    def get_config(self, route):
+        return getattr(settings, 'API_THROTTLES', {}).get(route)
+
+    def get_tier(self, request):
+        """Subscription plan type of the user, cached so rejects stay cheap."""
+        user = request.user
+        if not user or not user.is_authenticated:
+            return ANON_TIER
+
+        key = f"throttle:tier:{user.pk}"
+        tier = self.cache.get(key)
+        if tier is None:
+            profile = getattr(user, 'profile', None)
+            plan = getattr(profile, 'subscription_plan', None) if profile else None
+            tier = plan.plan_type if plan else 'free'
+            self.cache.set(key, tier, TIER_CACHE_SECONDS)
+        return tier
+
+    def get_rate(self, config, tier):
+        rates = config.get('rates', {})
+        return rates.get(tier, rates.get(DEFAULT_TIER))
+
+    def get_cache_key(self, request, route):
+        user = request.user
+        if user and user.is_authenticated:
+            ident = user.pk
+        else:
+            ident = self.get_ident(request)
+        return f"throttle:{route}:{ident}"
+
+    def allow_request(self, request, view):
+        route = get_route_name(view)
+        config = self.get_config(route)
+        if not config:
+            return True
+
+        num_requests, duration = parse_rate(self.get_rate(config, self.get_tier(request)))
+        if num_requests is None:
+            return True
+
+        key = self.get_cache_key(request, route)
+        if config.get('strategy', FIXED_WINDOW) == SLIDING_WINDOW:
+            return self.sliding_window(key, num_requests, duration)
+        return self.fixed_window(key, num_requests, duration)
+
+    def count(self, key, duration):
+        """Atomically adds one to a window counter and returns the new value."""
+        # The counter outlives its window so the next window can still weigh it.
+        self.cache.add(key, 0, 2 * duration)
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            # Evicted between add() and incr().
+            self.cache.add(key, 1, 2 * duration)
+            return 1
+
+    def fixed_window(self, key, num_requests, duration):
+        """Counts requests in the current aligned window of `duration` seconds."""
+        now = time.time()
+        window = int(now // duration)
+        key = f"{key}:{window}"
+
+        # Clients over the limit are turned away without a write.
+        if self.cache.get(key, 0) >= num_requests or self.count(key, duration) > num_requests:
+            self.wait_seconds = (window + 1) * duration - now
+            return False
+        return True
+
+    def sliding_window(self, key, num_requests, duration):
+        """
+        Approximates a sliding window from two fixed windows: the previous
+        window's count is weighted by how much of it still overlaps the last
+        `duration` seconds.
+        """
+        now = time.time()
+        window = int(now // duration)
+        current, previous = f"{key}:{window}", f"{key}:{window - 1}"
+        counts = self.cache.get_many([current, previous])
+        carried = counts.get(previous, 0) * (1 - (now - window * duration) / duration)
+
+        used = carried + counts.get(current, 0)
+        if used < num_requests:
+            used = carried + self.count(current, duration) - 1
+            if used < num_requests:
+                return True
+            # Lost the race for the last slot; give it back so it does not
+            # weigh on the next window too.
+            self.cache.decr(current)
+
+        # Wait until enough of the previous window has slid out, or for the next window.
+        wait = (window + 1) * duration - now
+        if counts.get(previous):
+            wait = min(wait, (used + 1 - num_requests) / counts[previous] * duration)
+        self.wait_seconds = wait
+        return False
+
+    def wait(self):
+        return self.wait_seconds
@@ -1,12 +1,14 @@
 from django.urls import path, include  # Import include
 from rest_framework.routers import DefaultRouter
-from music.viewsets import SongViewSet, GenreViewSet, AlbumViewSet
+from music.viewsets import SongViewSet, GenreViewSet, AlbumViewSet, PlaylistViewSet, LibraryViewSet
 
 # Create a router and register our viewset with it.
 router = DefaultRouter()
 router.register('songs', SongViewSet)
 router.register('genres', GenreViewSet)
 router.register('albums', AlbumViewSet)
+router.register('playlists', PlaylistViewSet)
+router.register('library', LibraryViewSet, basename='library')
 
 # The API URLs are now determined automatically by the router.
 urlpatterns = [
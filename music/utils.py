@@ -1,10 +1,19 @@
-import boto3
 import os
 import logging
-from botocore.exceptions import ClientError
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import date
+
 from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.fields.files import FieldFile
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 
-from music.models import Genre, Album
+from music.models import Genre, Album, TitleLock, clean_title, title_key
 
 
 def upload_to_s3(file_obj, folder="songs/"):
@@ -13,6 +22,10 @@ def upload_to_s3(file_obj, folder="songs/"):
     bucket_name = os.getenv("AWS_STORAGE_BUCKET_NAME", "spotify-audios")
     object_name = f"{folder}{file_obj.name}"  # Store in 'songs/' folder
 
+    # boto3 takes longer to import than the rest of the app; only uploads need it.
+    import boto3
+    from botocore.exceptions import ClientError
+
     s3_client = boto3.client("s3")
 
     try:
@@ -26,24 +39,135 @@ def upload_to_s3(file_obj, folder="songs/"):
         return None
 
 
+RESOLVER_TTL_SECONDS = 300
+RESOLVER_MAX_ENTRIES = 10000
+
+
+class TitleResolver:
+    """
+    Per-process cache from title_key() to a Genre or Album row, so that
+    uploads naming a known genre or album need no query.
+
+    Saves and deletes in this process drop the row from the cache (see
+    forget_resolved_titles below); changes made by other processes or by
+    queryset updates are picked up within RESOLVER_TTL_SECONDS. Rows are
+    matched on the stored title_key, so the cache and the database use the
+    same normalization, and the oldest matching row is the canonical one.
+    Creating a row first takes the key's TitleLock, so two processes never
+    create the same title; nothing is ever deleted to settle a race.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.attnames = [field.attname for field in model._meta.concrete_fields]
+        self.pk_index = self.attnames.index(model._meta.pk.attname)
+        self.lock = threading.Lock()
+        # key -> (expires at, database, field values), least recently used first
+        self.entries = OrderedDict()
+        self.keys = {}
+        # One creator per key within the process; keys share a few locks.
+        self.create_locks = [threading.Lock() for _ in range(32)]
+
+    def cached(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, db, values = entry
+            if expires < time.monotonic():
+                self.discard(key)
+                return None
+            self.entries.move_to_end(key)
+        # A fresh instance per caller, so that requests never share one.
+        return self.model.from_db(db, self.attnames, values)
+
+    def remember(self, key, obj):
+        values = []
+        for attname in self.attnames:
+            value = getattr(obj, attname)
+            values.append(value.name if isinstance(value, FieldFile) else value)
+        with self.lock:
+            self.entries[key] = (time.monotonic() + RESOLVER_TTL_SECONDS, obj._state.db, values)
+            self.entries.move_to_end(key)
+            self.keys[obj.pk] = key
+            while len(self.entries) > RESOLVER_MAX_ENTRIES:
+                self.discard(next(iter(self.entries)))
+
+    def discard(self, key):
+        """Caller holds self.lock"""
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.keys.pop(entry[2][self.pk_index], None)
+
+    def forget(self, pk):
+        with self.lock:
+            key = self.keys.pop(pk, None)
+            if key is not None:
+                self.discard(key)
+
+    def lookup(self, title):
+        return self.model.objects.filter(title_key=title_key(title)).order_by('created_at', 'id').first()
+
+    def lock_key(self, key):
+        """Holds the key's TitleLock row until the transaction ends"""
+        locks = TitleLock.objects.filter(model=self.model._meta.model_name, key=key)
+        # An UPDATE, even one that changes nothing, locks the row on every backend.
+        if locks.update(key=F('key')):
+            return
+        try:
+            with transaction.atomic():
+                TitleLock.objects.create(model=self.model._meta.model_name, key=key)
+        except IntegrityError:
+            # Created by another process, which has committed by now.
+            locks.update(key=F('key'))
+
+    def resolve(self, title, **defaults):
+        """(row, created) for the title, creating the row if no title has the same key"""
+        title = clean_title(title)
+        key = title_key(title)
+        obj = self.cached(key)
+        if obj is not None:
+            return obj, False
+
+        with self.create_locks[hash(key) % len(self.create_locks)]:
+            obj = self.cached(key)
+            if obj is not None:
+                return obj, False
+            created = False
+            obj = self.lookup(title)
+            if obj is None:
+                with transaction.atomic():
+                    self.lock_key(key)
+                    # Another process may have created it while this one waited.
+                    obj = self.lookup(title)
+                    if obj is None:
+                        obj = self.model.objects.create(title=title, **defaults)
+                        created = True
+            self.remember(key, obj)
+        return obj, created
+
+
+genre_resolver = TitleResolver(Genre)
+album_resolver = TitleResolver(Album)
+
+
+@receiver([post_save, post_delete], sender=Genre, dispatch_uid='forget_resolved_genre')
+@receiver([post_save, post_delete], sender=Album, dispatch_uid='forget_resolved_album')
+def forget_resolved_titles(sender, instance, **kwargs):
+    resolver = genre_resolver if sender is Genre else album_resolver
+    resolver.forget(instance.pk)
+
+
 def get_or_create_genre(genre_title, user):
     """Gets an existing genre or creates a new one."""
-    if genre_title:
-        genre, created = Genre.objects.get_or_create(
-            title=genre_title,
-            defaults={'user': user}  # Set the user when creating a new genre
-        )
-        return genre, created  # Return both the genre and the created status
+    if genre_title and clean_title(genre_title):
+        return genre_resolver.resolve(genre_title, user=user)
     return None, False
 
-def get_or_create_album(album_title, user):
-    """Gets an existing album or creates a new one."""
-    if album_title:
-        album, created = Album.objects.get_or_create(
-            title=album_title,
-            defaults={'user': user}
-        )
-        return album, created
+def get_or_create_album(album_title, user, release_date=None):
+    """Gets an existing album or creates a new one, released on release_date (default today)."""
+    if album_title and clean_title(album_title):
+        return album_resolver.resolve(album_title, user=user, release_date=release_date or date.today())
     return None, False
 
 
@@ -90,3 +214,55 @@ def validate_image_file(file_obj):
         return "Image file is empty"
     
     return None
+
+
+BATCH_MAX_IDS = 250
+
+
+def parse_batch_ids(query_params):
+    """
+    Read ids from `?ids=a,b,c` (or repeated `ids` params) for batch endpoints.
+    Returns (ids, error message); ids keep the requested order without duplicates.
+    """
+    raw = [value for param in query_params.getlist('ids') for value in param.split(',') if value.strip()]
+    if not raw:
+        return None, "ids is required"
+    try:
+        ids = list(dict.fromkeys(uuid.UUID(value.strip()) for value in raw))
+    except ValueError:
+        return None, "ids must be comma-separated UUIDs"
+    if len(ids) > BATCH_MAX_IDS:
+        return None, f"At most {BATCH_MAX_IDS} ids per request"
+    return ids, None
+
+
+def parse_uuid_param(query_params, name):
+    """
+    Read an optional UUID query parameter.
+    Returns (value or None, error message), like parse_batch_ids.
+    """
+    raw = query_params.get(name)
+    if not raw:
+        return None, None
+    try:
+        return uuid.UUID(raw), None
+    except ValueError:
+        return None, f"{name} must be a UUID"
+
+
+def parse_int_param(query_params, name, default, minimum=1, maximum=None):
+    """
+    Read an integer query parameter within [minimum, maximum].
+    Returns (value, error message), like parse_batch_ids.
+    """
+    raw = query_params.get(name)
+    if raw is None or raw == '':
+        return default, None
+    try:
+        value = int(raw)
+    except ValueError:
+        return None, f"{name} must be an integer"
+    if value < minimum or (maximum is not None and value > maximum):
+        bounds = f"between {minimum} and {maximum}" if maximum is not None else f"at least {minimum}"
+        return None, f"{name} must be {bounds}"
+    return value, None
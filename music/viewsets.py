@@ -1,22 +1,60 @@
 from rest_framework import viewsets, status, filters
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.db.models import Q, F, Count
+from django.http import StreamingHttpResponse
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+import uuid
 from datetime import timedelta
 from music.models import (
-    Song, Genre, Album, SongLike, RecentlyPlayed, 
-    FavoriteSong, FavoriteAlbum, ArtistFollow
+    Song, Genre, Album, SongLike, RecentlyPlayed, SongPlay,
+    FavoriteSong, FavoriteAlbum, ArtistFollow, Playlist, PlaylistItem,
+    ListeningSummary
 )
-from music.serializers import SongSerializer, GenreSerializer, AlbumSerializer
-from music.utils import upload_to_s3, get_or_create_genre, validate_audio_file
+from music.serializers import (
+    SongSerializer, GenreSerializer, AlbumSerializer,
+    PlaylistSerializer, PlaylistItemSerializer, LibraryBatchSerializer
+)
+from music import playlists, radio, stats, export, library, live
+from music.utils import upload_to_s3, get_or_create_genre, validate_audio_file, parse_batch_ids, parse_int_param
 from rest_framework.authentication import TokenAuthentication
-from music.permissions import IsArtistOrReadOnly
+from music.permissions import IsArtistOrReadOnly, IsOwnerOrReadOnly
+from music.throttling import RouteThrottle
+from music.renderers import RENDERERS, wants_stream, stream_response
 from music.music_enum import Visibility
 
-class SongViewSet(viewsets.ModelViewSet):
+class SparseFieldsViewMixin:
+    """
+    Honours ?fields= and ?expand= on GET requests: the serializer renders only
+    those fields and the queryset selects only the columns and joins they read.
+    """
+
+    def get_sparse_fields(self):
+        if not hasattr(self, '_sparse_fields'):
+            self._sparse_fields = None
+            params = self.request.query_params
+            if self.request.method == 'GET' and ('fields' in params or 'expand' in params):
+                self._sparse_fields = self.get_serializer_class().parse_sparse_fields(params)
+        return self._sparse_fields
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context.update(self.get_sparse_fields() or {})
+        return context
+
+    def project(self, queryset):
+        sparse = self.get_sparse_fields()
+        if sparse:
+            queryset = self.get_serializer_class().project(queryset, **sparse)
+        return queryset
+
+
+class SongViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
     """Viewset for managing song uploads"""
 
     queryset = Song.objects.all()
@@ -24,6 +62,8 @@ class SongViewSet(viewsets.ModelViewSet):
     parser_classes = [MultiPartParser, FormParser]
     permission_classes = [IsArtistOrReadOnly]
     authentication_classes = [TokenAuthentication]
+    throttle_classes = [RouteThrottle]
+    renderer_classes = RENDERERS
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['title', 'genre__title', 'album__title', 'user__username']
     ordering_fields = ['play_count', 'likes', 'release_date', 'created_at']
@@ -63,7 +103,20 @@ class SongViewSet(viewsets.ModelViewSet):
         if date_to:
             queryset = queryset.filter(release_date__lte=date_to)
         
-        return queryset.select_related('user', 'album', 'genre')
+        return self.project(queryset.select_related('user', 'album', 'genre'))
+
+    def list_response(self, items):
+        """Serialized list; streamed chunk by chunk when the client passes ?stream=1"""
+        if wants_stream(self.request):
+            return stream_response(self.request, items, 
+                                   lambda chunk: self.get_serializer(chunk, many=True).data)
+        serializer = self.get_serializer(items, many=True)
+        return Response(serializer.data)
+
+    def list(self, request, *args, **kwargs):
+        if wants_stream(request):
+            return self.list_response(self.filter_queryset(self.get_queryset()))
+        return super().list(request, *args, **kwargs)
 
     def create(self, request, *args, **kwargs):
         file_obj = request.FILES.get("audio_file")
@@ -104,8 +157,9 @@ class SongViewSet(viewsets.ModelViewSet):
         like, created = SongLike.objects.get_or_create(user=request.user, song=song)
         if created:
             song.likes = F('likes') + 1
-            song.save(update_fields=['likes'])
+            song.save(update_fields=['likes', 'updated_at'])
             song.refresh_from_db(fields=['likes'])
+            stats.record(song, likes=1)
         return Response({"likes": song.likes})
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
@@ -114,16 +168,19 @@ class SongViewSet(viewsets.ModelViewSet):
         deleted, _ = SongLike.objects.filter(user=request.user, song=song).delete()
         if deleted:
             song.likes = F('likes') - 1
-            song.save(update_fields=['likes'])
+            song.save(update_fields=['likes', 'updated_at'])
             song.refresh_from_db(fields=['likes'])
+            stats.record(song, likes=-1)
         return Response({"likes": song.likes})
 
-    @action(detail=True, methods=['post'])
+    @action(detail=True, methods=['post'], permission_classes=[AllowAny])
     def play(self, request, pk=None):
         song = self.get_object()
         song.play_count = F('play_count') + 1
-        song.save(update_fields=['play_count'])
+        song.save(update_fields=['play_count', 'updated_at'])
         song.refresh_from_db(fields=['play_count'])
+        stats.record(song, plays=1)
+        live.hub.record_play(live.listener_key(request), song.pk, song.user_id, song.duration)
         
         # Track recently played for authenticated users
         if request.user.is_authenticated:
@@ -132,6 +189,7 @@ class SongViewSet(viewsets.ModelViewSet):
                 song=song,
                 defaults={'played_at': timezone.now()}
             )
+            SongPlay.objects.create(user=request.user, song=song)
         
         return Response({"play_count": song.play_count})
 
@@ -155,8 +213,49 @@ class SongViewSet(viewsets.ModelViewSet):
         if page is not None:
             serializer = self.get_serializer(page, many=True)
             return self.get_paginated_response(serializer.data)
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        return self.list_response(queryset)
+
+    @action(detail=False, methods=['get'])
+    def batch(self, request):
+        """Get many songs by id in one call, in the requested order"""
+        ids, error = parse_batch_ids(request.query_params)
+        if error:
+            return Response({"error": error}, 
+                          status=status.HTTP_400_BAD_REQUEST)
+        
+        # Visibility rules are part of the same query; hidden songs count as missing.
+        songs = self.get_queryset().in_bulk(ids)
+        serializer = self.get_serializer([songs[i] for i in ids if i in songs], many=True)
+        return Response({
+            "results": serializer.data,
+            "missing": [str(i) for i in ids if i not in songs],
+        })
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def export(self, request):
+        """
+        Stream every public song as NDJSON; gzip-compressed if the client accepts it.
+        With ?updated_since, songs made private or deleted since then follow
+        as {"id", "updated_at", "removed": true} lines (see music.export).
+        """
+        updated_since = request.query_params.get('updated_since')
+        if updated_since:
+            updated_since = parse_datetime(updated_since)
+            if updated_since is None:
+                return Response({"error": "updated_since must be an ISO 8601 datetime"}, 
+                              status=status.HTTP_400_BAD_REQUEST)
+            if timezone.is_naive(updated_since):
+                updated_since = timezone.make_aware(updated_since)
+
+        body = export.iter_ndjson(export.iter_song_chunks(updated_since))
+        use_gzip = export.accepts_gzip(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if use_gzip:
+            body = export.iter_gzip(body)
+        response = StreamingHttpResponse(body, content_type='application/x-ndjson')
+        if use_gzip:
+            response['Content-Encoding'] = 'gzip'
+        response['Vary'] = 'Accept-Encoding'
+        return response
 
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
     def search(self, request):
@@ -216,6 +315,7 @@ class SongViewSet(viewsets.ModelViewSet):
                 song=song
             )
             if created:
+                stats.record(song, favorites=1)
                 return Response({"message": "Song added to favorites"}, 
                               status=status.HTTP_201_CREATED)
             return Response({"message": "Song already in favorites"})
@@ -226,6 +326,7 @@ class SongViewSet(viewsets.ModelViewSet):
                 song=song
             ).delete()
             if deleted[0]:
+                stats.record(song, favorites=-1)
                 return Response({"message": "Song removed from favorites"})
             return Response({"error": "Song not in favorites"}, 
                           status=status.HTTP_404_NOT_FOUND)
@@ -233,15 +334,17 @@ class SongViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
     def favorites(self, request):
         """Get user's favorite songs"""
-        favorites = FavoriteSong.objects.filter(user=request.user).select_related('song')
-        songs = [fav.song for fav in favorites]
-        serializer = self.get_serializer(songs, many=True)
-        return Response(serializer.data)
+        favorites = FavoriteSong.objects.filter(user=request.user).select_related(
+            'song__user', 'song__album', 'song__genre'
+        )
+        return self.list_response(fav.song for fav in favorites.iterator(chunk_size=1000))
 
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
     def recently_played(self, request):
         """Get user's recently played songs"""
-        limit = int(request.query_params.get('limit', 50))
+        limit, error = parse_int_param(request.query_params, 'limit', 50)
+        if error:
+            return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
         recent = RecentlyPlayed.objects.filter(
             user=request.user
         ).select_related('song').order_by('-played_at')[:limit]
@@ -249,6 +352,19 @@ class SongViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(songs, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def year_in_review(self, request):
+        """Get the user's precomputed listening summary for a year"""
+        year, error = parse_int_param(request.query_params, 'year', timezone.now().year - 1, maximum=9998)
+        if error:
+            return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+        summary = ListeningSummary.objects.filter(user=request.user, year=year).values(
+            'year', 'play_count', 'minutes_listened', 'top_songs', 'top_artists', 'top_genres'
+        ).first()
+        if summary is None:
+            return Response({"error": f"No summary for {year}"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(summary)
+
     @action(detail=False, methods=['get'])
     def random(self, request):
         """Get random songs"""
@@ -257,6 +373,20 @@ class SongViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
+    @action(detail=True, methods=['get'])
+    def radio(self, request, pk=None):
+        """Autoplay queue seeded by this song; pass back `session` for the next batch"""
+        seed = self.get_object()
+        count, error = parse_int_param(request.query_params, 'count', 10, maximum=50)
+        if error:
+            return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+        session, song_ids = radio.next_batch(
+            seed, request.user, count, request.query_params.get('session')
+        )
+        songs = self.get_queryset().in_bulk(song_ids)
+        serializer = self.get_serializer([songs[i] for i in song_ids if i in songs], many=True)
+        return Response({"session": session, "results": serializer.data})
+
     @action(detail=False, methods=['get'])
     def recommendations(self, request):
         """Get song recommendations based on user's listening history"""
@@ -291,16 +421,19 @@ class GenreViewSet(viewsets.ModelViewSet):
     serializer_class = GenreSerializer
     permission_classes = [IsArtistOrReadOnly]
     authentication_classes = [TokenAuthentication]
+    throttle_classes = [RouteThrottle]
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
 
-class AlbumViewSet(viewsets.ModelViewSet):
+class AlbumViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
     queryset = Album.objects.all()
     serializer_class = AlbumSerializer
     permission_classes = [IsArtistOrReadOnly]
     authentication_classes = [TokenAuthentication]
+    throttle_classes = [RouteThrottle]
+    renderer_classes = RENDERERS
     parser_classes = [MultiPartParser, FormParser]
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['title', 'user__username']
@@ -323,7 +456,7 @@ class AlbumViewSet(viewsets.ModelViewSet):
         if date_to:
             queryset = queryset.filter(release_date__lte=date_to)
         
-        return queryset.select_related('user').prefetch_related('songs')
+        return self.project(queryset.select_related('user'))
 
     def create(self, request, *args, **kwargs):
         # Validate cover image if provided
@@ -365,6 +498,21 @@ class AlbumViewSet(viewsets.ModelViewSet):
             return Response({"error": "Album not in favorites"}, 
                           status=status.HTTP_404_NOT_FOUND)
 
+    @action(detail=False, methods=['get'])
+    def batch(self, request):
+        """Get many albums by id in one call, in the requested order"""
+        ids, error = parse_batch_ids(request.query_params)
+        if error:
+            return Response({"error": error}, 
+                          status=status.HTTP_400_BAD_REQUEST)
+        
+        albums = Album.objects.select_related('user').in_bulk(ids)
+        serializer = self.get_serializer([albums[i] for i in ids if i in albums], many=True)
+        return Response({
+            "results": serializer.data,
+            "missing": [str(i) for i in ids if i not in albums],
+        })
+
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
     def favorites(self, request):
         """Get user's favorite albums"""
@@ -379,4 +527,122 @@ class AlbumViewSet(viewsets.ModelViewSet):
         album = self.get_object()
         songs = album.songs.all()
         serializer = SongSerializer(songs, many=True)
-        return Response(serializer.data)
\ No newline at end of file
+        return Response(serializer.data)
+
+
+class LibraryViewSet(viewsets.ViewSet):
+    """Bulk changes to the user's likes, favorites and follows"""
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [TokenAuthentication]
+    throttle_classes = [RouteThrottle]
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """Apply up to MAX_OPERATIONS like/favorite/follow operations in one transaction"""
+        serializer = LibraryBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        result = library.apply(request.user, serializer.validated_data['operations'])
+        return Response(result)
+
+
+class PlaylistViewSet(viewsets.ModelViewSet):
+    """Playlists with fractionally indexed items; see music.playlists"""
+    queryset = Playlist.objects.all()
+    serializer_class = PlaylistSerializer
+    permission_classes = [IsOwnerOrReadOnly]
+    authentication_classes = [TokenAuthentication]
+    throttle_classes = [RouteThrottle]
+
+    def get_queryset(self):
+        user = self.request.user
+        public_filter = Q(visibility=Visibility.PUBLIC.value)
+        if user.is_authenticated:
+            public_filter |= Q(user=user)
+        queryset = Playlist.objects.filter(public_filter)
+        if self.request.query_params.get('mine') and user.is_authenticated:
+            queryset = queryset.filter(user=user)
+        return queryset.select_related('user')
+
+    def perform_create(self, serializer):
+        if Playlist.objects.filter(user=self.request.user).count() >= playlists.max_playlists(self.request.user):
+            raise ValidationError({"error": "Playlist limit reached for your plan"})
+        serializer.save(user=self.request.user)
+
+    def get_item(self, playlist, item_id):
+        if not item_id:
+            return None
+        try:
+            return PlaylistItem.objects.select_related('song').get(playlist=playlist, id=item_id)
+        except (PlaylistItem.DoesNotExist, DjangoValidationError):
+            raise NotFound(f"Item {item_id} not found in this playlist")
+
+    def get_anchor(self, playlist, request):
+        """The `after` and `before` items of an insert or move; at most one may be given."""
+        if request.data.get('after') and request.data.get('before'):
+            raise ValidationError({"error": "Pass either after or before, not both"})
+        return (self.get_item(playlist, request.data.get('after')),
+                self.get_item(playlist, request.data.get('before')))
+
+    @action(detail=True, methods=['get', 'post'])
+    def tracks(self, request, pk=None):
+        """
+        GET: keyset page of items, `?after=<position>&limit=`.
+        POST: add `song_ids` in order, optionally `after`/`before` an item id.
+        """
+        playlist = self.get_object()
+
+        if request.method == 'GET':
+            limit, error = parse_int_param(request.query_params, 'limit', 100, maximum=500)
+            if error:
+                return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+            items = playlists.page_items(playlist, request.query_params.get('after'), limit)
+            return Response({
+                'results': PlaylistItemSerializer(items, many=True).data,
+                'next': items[-1].position if items and len(items) == limit else None,
+            })
+
+        song_ids = request.data.get('song_ids') or []
+        if not isinstance(song_ids, list) or not song_ids \
+                or not all(isinstance(song_id, (str, uuid.UUID)) for song_id in song_ids):
+            return Response({"error": "song_ids must be a non-empty list of song ids"},
+                          status=status.HTTP_400_BAD_REQUEST)
+        try:
+            found = Song.objects.filter(
+                Q(visibility=Visibility.PUBLIC.value) | Q(user=request.user)
+            ).in_bulk(song_ids)
+        except DjangoValidationError:
+            return Response({"error": "Invalid song id"}, status=status.HTTP_400_BAD_REQUEST)
+        by_id = {str(pk): song for pk, song in found.items()}
+        missing = [song_id for song_id in song_ids if str(song_id) not in by_id]
+        if missing:
+            return Response({"error": "Songs not found", "ids": missing},
+                          status=status.HTTP_400_BAD_REQUEST)
+
+        songs = [by_id[str(song_id)] for song_id in song_ids]
+        after, before = self.get_anchor(playlist, request)
+        items = playlists.add_songs(playlist, songs, after=after, before=before)
+        playlist.refresh_from_db(fields=['track_count', 'total_duration'])
+        return Response({
+            'added': len(items),
+            'track_count': playlist.track_count,
+            'total_duration': playlist.total_duration,
+        }, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'])
+    def move(self, request, pk=None):
+        """Move `item_id` directly `after` or `before` another item (or to the end)"""
+        playlist = self.get_object()
+        item = self.get_item(playlist, request.data.get('item_id'))
+        if item is None:
+            return Response({"error": "item_id is required"}, status=status.HTTP_400_BAD_REQUEST)
+        after, before = self.get_anchor(playlist, request)
+        item = playlists.move_item(item, after=after, before=before)
+        return Response({"id": str(item.id), "position": item.position})
+
+    @action(detail=True, methods=['delete'], url_path=r'tracks/(?P<item_id>[^/.]+)')
+    def remove_track(self, request, pk=None, item_id=None):
+        """Remove one item from the playlist"""
+        playlist = self.get_object()
+        item = self.get_item(playlist, item_id)
+        playlists.remove_item(item)
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,130 @@
+"""
+Year-in-review summaries built in one streaming pass over listening history.
+
+History is SongPlay, one row per play. RecentlyPlayed keeps only the latest
+play of each song, so it cannot rank what a listener played most.
+
+Plays are read in user order and in chunks, grouped per user by a generator
+pipeline, and reduced to a small summary, so memory holds one user's plays
+at a time. The user id space is split into ranges that run in a process pool.
+"""
+import uuid
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import groupby
+from multiprocessing import get_context
+from operator import itemgetter
+
+from django.db import connections
+from django.utils import timezone
+
+from music.models import ListeningSummary, SongPlay
+
+TOP_N = 10
+SUMMARY_FIELDS = ['play_count', 'minutes_listened', 'top_songs', 'top_artists', 'top_genres']
+
+PLAY_COLUMNS = (
+    'user_id', 'song_id', 'song__title', 'song__duration',
+    'song__user_id', 'song__user__username', 'song__genre_id', 'song__genre__title',
+)
+
+
+def user_ranges(parts):
+    """Splits the UUID space into `parts` contiguous (low, high) ranges."""
+    step = 2 ** 128 // parts
+    bounds = [uuid.UUID(int=i * step) for i in range(parts)] + [None]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def stream_plays(year, low=None, high=None, chunk_size=5000):
+    """Yields play rows of one year, ordered by user, read in server-side chunks."""
+    start = timezone.make_aware(datetime(year, 1, 1))
+    end = timezone.make_aware(datetime(year + 1, 1, 1))
+    plays = SongPlay.objects.filter(played_at__gte=start, played_at__lt=end)
+    if low is not None:
+        plays = plays.filter(user_id__gte=low)
+    if high is not None:
+        plays = plays.filter(user_id__lt=high)
+    yield from plays.order_by('user_id').values_list(*PLAY_COLUMNS).iterator(chunk_size=chunk_size)
+
+
+def _top(counter, names):
+    return [
+        {'id': str(key), 'title': names[key], 'plays': plays}
+        for key, plays in counter.most_common(TOP_N)
+    ]
+
+
+def summarize(user_id, plays):
+    """Reduces one user's plays to a summary dict."""
+    songs, artists, genres = Counter(), Counter(), Counter()
+    names = {}
+    seconds = count = 0
+    for _, song_id, title, duration, artist_id, artist, genre_id, genre in plays:
+        count += 1
+        seconds += duration
+        songs[song_id] += 1
+        names[song_id] = title
+        if artist_id:
+            artists[artist_id] += 1
+            names[artist_id] = artist
+        if genre_id:
+            genres[genre_id] += 1
+            names[genre_id] = genre
+    return {
+        'user_id': user_id,
+        'play_count': count,
+        'minutes_listened': seconds // 60,
+        'top_songs': _top(songs, names),
+        'top_artists': _top(artists, names),
+        'top_genres': _top(genres, names),
+    }
+
+
+def summarize_range(year, low=None, high=None, chunk_size=5000):
+    """Summaries for every user in [low, high) with plays in `year`."""
+    return [
+        summarize(user_id, plays)
+        for user_id, plays in groupby(stream_plays(year, low, high, chunk_size), key=itemgetter(0))
+    ]
+
+
+def _summarize_range_task(args):
+    return summarize_range(*args)
+
+
+def save_summaries(year, summaries):
+    ListeningSummary.objects.bulk_create(
+        [ListeningSummary(year=year, **summary) for summary in summaries],
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=['user', 'year'],
+        update_fields=SUMMARY_FIELDS + ['updated_at'],
+    )
+
+
+def build_year(year, workers=1, chunk_size=5000, progress=None):
+    """Computes and stores every user's summary for `year`. Returns the user count."""
+    ranges = user_ranges(max(workers, 1) * 4)
+    tasks = [(year, low, high, chunk_size) for low, high in ranges]
+    total = 0
+
+    if workers <= 1:
+        results = map(_summarize_range_task, tasks)
+    else:
+        # Forked children must not share the parent's database connection.
+        connections.close_all()
+        pool = ProcessPoolExecutor(workers, mp_context=get_context('fork'))
+        results = pool.map(_summarize_range_task, tasks)
+
+    try:
+        for summaries in results:
+            save_summaries(year, summaries)
+            total += len(summaries)
+            if progress:
+                progress(total)
+    finally:
+        if workers > 1:
+            pool.shutdown()
+    return total
@@ -1,5 +1,7 @@
-from payments.models import SubscriptionPlan
+from payments.models import SubscriptionPlan, WebhookEvent, PlanRecomputeJob
 from django.contrib import admin
 
 
-admin.site.register(SubscriptionPlan)
\ No newline at end of file
+admin.site.register(SubscriptionPlan)
+admin.site.register(WebhookEvent)
+admin.site.register(PlanRecomputeJob)
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from payments.webhooks import MAX_ATTEMPTS, process_pending_events, requeue_failed_events
+
+
+class Command(BaseCommand):
+    help = "Background worker that applies stored Stripe webhook events in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--interval', type=float, default=2.0,
+                            help="Seconds to sleep when no events are pending")
+        parser.add_argument('--once', action='store_true',
+                            help="Drain pending events and exit")
+        parser.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS,
+                            help="Tries before a failing event is marked failed")
+        parser.add_argument('--retry-failed', action='store_true',
+                            help="Put failed events back in the queue first")
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            self.stdout.write(f"Requeued {requeue_failed_events()} failed events")
+        while True:
+            result = process_pending_events(options['batch_size'], options['max_attempts'])
+            if any(result.values()):
+                self.stdout.write(", ".join(f"{k}={v}" for k, v in result.items()))
+                continue
+            if options['once']:
+                return
+            time.sleep(options['interval'])
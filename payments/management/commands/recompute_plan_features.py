@@ -0,0 +1,29 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from payments.models import PlanRecomputeJob, SubscriptionPlan
+from payments.recompute import run_pending_jobs
+
+
+class Command(BaseCommand):
+    help = "Bulk-recomputes subscriber features for changed plans, resuming interrupted jobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--plan', help="Queue a job for this plan id or plan type first")
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options['plan']:
+            plan = SubscriptionPlan.objects.filter(plan_type=options['plan']).first()
+            if plan is None:
+                try:
+                    plan = SubscriptionPlan.objects.get(pk=options['plan'])
+                except (SubscriptionPlan.DoesNotExist, ValidationError):
+                    raise CommandError(f"Plan {options['plan']} not found")
+            PlanRecomputeJob.enqueue(plan)
+
+        jobs = run_pending_jobs(options['chunk_size'], progress=self.report)
+        self.stdout.write(f"Finished {len(jobs)} job(s)")
+
+    def report(self, job):
+        self.stdout.write(f"{job.plan.plan_type}: {job.processed}/{job.total}")
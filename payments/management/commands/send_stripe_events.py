@@ -0,0 +1,48 @@
+import urllib.request
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from payments.stripe_standin import subscription_event, encode_event
+from users.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = "Posts signed stand-in Stripe subscription events to the webhook endpoint"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--plan-id', required=True)
+        parser.add_argument('--type', default='customer.subscription.updated')
+        parser.add_argument('--limit', type=int, default=100,
+                            help="Number of existing profiles to send events for")
+        parser.add_argument('--url', help="Webhook URL of a running server; defaults to an in-process client")
+
+    def handle(self, *args, **options):
+        secret = settings.DJSTRIPE_WEBHOOK_SECRET
+        if not secret:
+            raise CommandError("Set STRIPE_WEBHOOK_SECRET; the webhook endpoint rejects unsigned events")
+        client = None if options['url'] else Client(HTTP_HOST='localhost')
+
+        profiles = UserProfile.objects.values_list('user_id', 'stripe_customer_id')[:options['limit']]
+        sent = 0
+        for user_id, customer_id in profiles:
+            event = subscription_event(
+                options['type'],
+                customer_id=customer_id or f"cus_local_{user_id.hex[:16]}",
+                user_id=user_id,
+                plan_id=options['plan_id'],
+            )
+            body, headers = encode_event(event, secret)
+            if client:
+                response = client.post(
+                    '/api/payments/webhook', body, content_type='application/json',
+                    HTTP_STRIPE_SIGNATURE=headers['Stripe-Signature']
+                )
+                ok = response.status_code == 200
+            else:
+                request = urllib.request.Request(options['url'], data=body, headers=headers)
+                with urllib.request.urlopen(request) as response:
+                    ok = response.status == 200
+            sent += ok
+        self.stdout.write(f"Sent {sent} events")
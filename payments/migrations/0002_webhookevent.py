@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:13
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookEvent',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('stripe_id', models.CharField(max_length=255, unique=True, verbose_name='stripe event id')),
+                ('type', models.CharField(max_length=100, verbose_name='event type')),
+                ('payload', models.JSONField(verbose_name='payload')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processed', 'Processed'), ('ignored', 'Ignored'), ('failed', 'Failed')], default='pending', max_length=20, verbose_name='status')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='attempts')),
+                ('error', models.TextField(blank=True, verbose_name='error')),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='processed at')),
+            ],
+            options={
+                'verbose_name': 'webhook event',
+                'verbose_name_plural': 'webhook events',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='payments_we_status_f91a85_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:17
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0002_webhookevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlanRecomputeJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done')], default='pending', max_length=20, verbose_name='status')),
+                ('last_profile_id', models.UUIDField(blank=True, null=True, verbose_name='last processed profile')),
+                ('processed', models.PositiveIntegerField(default=0, verbose_name='processed')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='total')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='finished at')),
+                ('plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recompute_jobs', to='payments.subscriptionplan')),
+            ],
+            options={
+                'verbose_name': 'plan recompute job',
+                'verbose_name_plural': 'plan recompute jobs',
+                'ordering': ['created_at'],
+            },
+        ),
+    ]
@@ -3,12 +3,6 @@ import uuid
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
-try:
-    from djstripe.models import Price as StripePrice
-except (ImportError, AttributeError):
-    # Fallback if dj-stripe is not properly configured
-    StripePrice = None
-
 from users.base_model import UUIDModel
 
 
@@ -81,13 +75,34 @@ class SubscriptionPlan(UUIDModel):
     def __str__(self):
         return f"{self.get_plan_type_display()} - {self.price} {self.currency}/{self.billing_cycle}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_feature_state = instance._feature_state()
+        return instance
+
+    def _feature_state(self):
+        return (self.__dict__.get('plan_type'), self.__dict__.get('features'))
+
+    def save(self, *args, **kwargs):
+        """Queue a subscriber recompute when plan_type or features change."""
+        loaded = getattr(self, '_loaded_feature_state', None)
+        changed = loaded is not None and loaded != self._feature_state()
+        super().save(*args, **kwargs)
+        self._loaded_feature_state = self._feature_state()
+        if changed:
+            PlanRecomputeJob.enqueue(self)
+
     @property
     def is_free_plan(self):
         """Check if this is the free plan."""
         return self.plan_type == self.PlanType.FREE
 
     def get_features(self):
-        """Get the features for this plan."""
+        """Get the features for this plan, with overrides from `features` applied."""
+        return {**self._plan_type_features(), **(self.features or {})}
+
+    def _plan_type_features(self):
         default_features = {
             'ad_free': False,
             'offline_mode': False,
@@ -141,4 +156,80 @@ class SubscriptionPlan(UUIDModel):
                 'skip_limit': float('inf'),
                 'student_discount': True,
             }
-        return default_features
\ No newline at end of file
+        return default_features
+
+class PlanRecomputeJob(UUIDModel):
+    """
+    Recomputes the feature fields of every subscriber of a plan.
+    Subscribers are walked in primary key order and the last key is saved
+    with each chunk, so a crashed job resumes where it stopped.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', _('Pending')
+        RUNNING = 'running', _('Running')
+        DONE = 'done', _('Done')
+
+    plan = models.ForeignKey(
+        SubscriptionPlan,
+        on_delete=models.CASCADE,
+        related_name='recompute_jobs'
+    )
+    status = models.CharField(
+        _('status'),
+        max_length=20,
+        choices=Status.choices,
+        default=Status.PENDING
+    )
+    last_profile_id = models.UUIDField(_('last processed profile'), null=True, blank=True)
+    processed = models.PositiveIntegerField(_('processed'), default=0)
+    total = models.PositiveIntegerField(_('total'), default=0)
+    finished_at = models.DateTimeField(_('finished at'), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _('plan recompute job')
+        verbose_name_plural = _('plan recompute jobs')
+        ordering = ['created_at']
+
+    def __str__(self):
+        return f"{self.plan.plan_type} recompute ({self.status}, {self.processed}/{self.total})"
+
+    @classmethod
+    def enqueue(cls, plan):
+        """A pending job reads the plan when it starts, so one is enough."""
+        job = cls.objects.filter(plan=plan, status=cls.Status.PENDING).first()
+        return job or cls.objects.create(plan=plan)
+
+
+class WebhookEvent(UUIDModel):
+    """Raw Stripe webhook event, stored on receipt and processed later in batches."""
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', _('Pending')
+        PROCESSED = 'processed', _('Processed')
+        IGNORED = 'ignored', _('Ignored')
+        FAILED = 'failed', _('Failed')
+
+    stripe_id = models.CharField(_('stripe event id'), max_length=255, unique=True)
+    type = models.CharField(_('event type'), max_length=100)
+    payload = models.JSONField(_('payload'))
+    status = models.CharField(
+        _('status'),
+        max_length=20,
+        choices=Status.choices,
+        default=Status.PENDING
+    )
+    attempts = models.PositiveIntegerField(_('attempts'), default=0)
+    error = models.TextField(_('error'), blank=True)
+    processed_at = models.DateTimeField(_('processed at'), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _('webhook event')
+        verbose_name_plural = _('webhook events')
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.type} ({self.stripe_id})"
@@ -0,0 +1,55 @@
+from django.db import transaction
+from django.utils import timezone
+
+from payments.models import PlanRecomputeJob
+from users.models import UserProfile
+
+
+def run_job(job, chunk_size=1000, progress=None):
+    """
+    Applies the plan's current features to all of its subscribers.
+    Each chunk is read by keyset, updated with one bulk_update and committed
+    together with the job's checkpoint. Its rows stay locked until then, so a
+    subscriber who switches plans meanwhile keeps the new plan's features.
+    """
+    plan = job.plan
+    subscribers = UserProfile.objects.filter(subscription_plan=plan).order_by('pk').only(
+        'pk', *UserProfile.SUBSCRIPTION_FEATURE_FIELDS
+    )
+
+    if job.status == PlanRecomputeJob.Status.PENDING:
+        job.status = PlanRecomputeJob.Status.RUNNING
+        job.total = subscribers.count()
+        job.save(update_fields=['status', 'total'])
+
+    while True:
+        chunk_qs = subscribers
+        if job.last_profile_id:
+            chunk_qs = chunk_qs.filter(pk__gt=job.last_profile_id)
+
+        with transaction.atomic():
+            chunk = list(chunk_qs.select_for_update()[:chunk_size])
+            if not chunk:
+                break
+            for profile in chunk:
+                profile.apply_plan_features(plan)
+            UserProfile.objects.bulk_update(chunk, UserProfile.SUBSCRIPTION_FEATURE_FIELDS)
+            job.last_profile_id = chunk[-1].pk
+            job.processed += len(chunk)
+            job.save(update_fields=['last_profile_id', 'processed'])
+
+        if progress:
+            progress(job)
+
+    job.status = PlanRecomputeJob.Status.DONE
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'finished_at'])
+    return job
+
+
+def run_pending_jobs(chunk_size=1000, progress=None):
+    """Runs queued jobs and resumes any left running by a crashed worker."""
+    jobs = PlanRecomputeJob.objects.filter(
+        status__in=[PlanRecomputeJob.Status.PENDING, PlanRecomputeJob.Status.RUNNING]
+    ).select_related('plan')
+    return [run_job(job, chunk_size, progress) for job in jobs]
@@ -1,3 +1,196 @@
-from django.test import TestCase
+import json
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+
+from payments.models import PlanRecomputeJob, SubscriptionPlan, WebhookEvent
+from payments.recompute import run_job, run_pending_jobs
+from payments.stripe_standin import encode_event, subscription_event
+from payments.webhooks import process_pending_events, requeue_failed_events
+from users.models import User, UserProfile
+
+SECRET = 'whsec_test'
+WEBHOOK_URL = '/api/payments/webhook'
+
+
+@override_settings(DJSTRIPE_WEBHOOK_SECRET=SECRET)
+class WebhookReceiptTests(TestCase):
+    """Only events signed with the webhook secret are stored."""
+
+    def post(self, body, signature=None):
+        headers = {'Stripe-Signature': signature} if signature else {}
+        return self.client.post(WEBHOOK_URL, body, content_type='application/json', headers=headers)
+
+    def test_signed_event_is_stored(self):
+        event = subscription_event('customer.subscription.updated', 'cus_signed')
+        body, headers = encode_event(event, SECRET)
+        response = self.post(body, headers['Stripe-Signature'])
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(WebhookEvent.objects.filter(stripe_id=event['id']).exists())
+
+    def test_unsigned_or_forged_event_is_rejected(self):
+        event = subscription_event('customer.subscription.updated', 'cus_forged')
+        body, _ = encode_event(event)
+        _, forged = encode_event(event, 'whsec_other')
+        for signature in [None, forged['Stripe-Signature']]:
+            with self.subTest(signature=signature):
+                self.assertEqual(self.post(body, signature).status_code, 400)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    @override_settings(DJSTRIPE_WEBHOOK_SECRET='')
+    def test_rejects_everything_without_a_secret(self):
+        body, _ = encode_event(subscription_event('customer.subscription.updated', 'cus_open'))
+        self.assertEqual(self.post(body).status_code, 400)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    def test_redelivery_is_stored_once(self):
+        event = subscription_event('customer.subscription.updated', 'cus_twice')
+        for _ in range(2):
+            body, headers = encode_event(event, SECRET)
+            self.assertEqual(self.post(body, headers['Stripe-Signature']).status_code, 200)
+        self.assertEqual(WebhookEvent.objects.filter(stripe_id=event['id']).count(), 1)
+        self.assertEqual(WebhookEvent.objects.get().payload, json.loads(body))
+
+
+class WebhookProcessingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.free = SubscriptionPlan.objects.create(name='Free', plan_type=SubscriptionPlan.PlanType.FREE)
+        cls.premium = SubscriptionPlan.objects.create(name='Premium', plan_type=SubscriptionPlan.PlanType.INDIVIDUAL,
+                                                      price=9.99)
+        cls.profiles = []
+        for n in range(3):
+            user = User.objects.create(username=f'subscriber{n}', email=f'subscriber{n}@example.com')
+            cls.profiles.append(UserProfile.objects.create(user=user, subscription_plan=cls.free))
+
+    def receive(self, profile, event_type='customer.subscription.updated', **kwargs):
+        event = subscription_event(event_type, f'cus_{profile.user.username}', user_id=profile.user_id,
+                                   plan_id=self.premium.pk, **kwargs)
+        WebhookEvent.objects.create(stripe_id=event['id'], type=event['type'], payload=event)
+        return event
+
+    def poison(self, event):
+        """Stored with a payload that cannot be applied"""
+        stored = WebhookEvent.objects.get(stripe_id=event['id'])
+        stored.payload['data']['object']['current_period_start'] = 'not a timestamp'
+        stored.save()
+        return stored
+
+    def test_applies_subscription(self):
+        self.receive(self.profiles[0])
+        self.assertEqual(process_pending_events(), {'processed': 1, 'ignored': 0})
+        profile = UserProfile.objects.get(pk=self.profiles[0].pk)
+        self.assertEqual(profile.subscription_plan, self.premium)
+        self.assertTrue(profile.ad_free)
+
+    def test_older_event_delivered_late_is_ignored(self):
+        profile = self.profiles[0]
+        older = subscription_event('customer.subscription.updated', 'cus_late', user_id=profile.user_id,
+                                   plan_id=self.premium.pk, status='past_due', created=1_700_000_000)
+        self.receive(profile, 'customer.subscription.deleted', created=1_700_000_100)
+        self.assertEqual(process_pending_events(), {'processed': 1, 'ignored': 0})
+
+        WebhookEvent.objects.create(stripe_id=older['id'], type=older['type'], payload=older)
+        self.assertEqual(process_pending_events(), {'processed': 0, 'ignored': 1})
+        profile = UserProfile.objects.get(pk=profile.pk)
+        self.assertEqual((profile.subscription_status, profile.subscription_plan), ('canceled', self.free))
+
+    @override_settings(DJSTRIPE_WEBHOOK_SECRET=SECRET)
+    def test_redelivered_event_is_applied_once(self):
+        profile = self.profiles[0]
+        event = subscription_event('customer.subscription.updated', 'cus_again', user_id=profile.user_id,
+                                   plan_id=self.premium.pk)
+        body, headers = encode_event(event, SECRET)
+        self.client.post(WEBHOOK_URL, body, content_type='application/json', headers=headers)
+        self.assertEqual(process_pending_events(), {'processed': 1, 'ignored': 0})
+
+        self.client.post(WEBHOOK_URL, body, content_type='application/json', headers=headers)
+        self.assertEqual(process_pending_events(), {'processed': 0, 'ignored': 0})
+        self.assertEqual(WebhookEvent.objects.get().attempts, 1)
+
+    def test_poisoned_event_does_not_fail_the_batch(self):
+        good = [self.receive(self.profiles[0]), self.receive(self.profiles[2])]
+        bad = self.poison(self.receive(self.profiles[1]))
+
+        result = process_pending_events()
+        self.assertEqual(result, {'processed': 2, 'ignored': 0, 'retrying': 1})
+        for event in good:
+            self.assertEqual(WebhookEvent.objects.get(stripe_id=event['id']).status, WebhookEvent.Status.PROCESSED)
+        bad.refresh_from_db()
+        self.assertEqual((bad.status, bad.attempts), (WebhookEvent.Status.PENDING, 1))
+        self.assertTrue(bad.error)
+        self.assertEqual(UserProfile.objects.get(pk=self.profiles[0].pk).subscription_plan, self.premium)
+        self.assertEqual(UserProfile.objects.get(pk=self.profiles[1].pk).subscription_plan, self.free)
+
+    def test_failing_event_is_retried_then_requeued(self):
+        bad = self.poison(self.receive(self.profiles[0]))
+        for _ in range(2):
+            process_pending_events(max_attempts=3)
+        bad.refresh_from_db()
+        self.assertEqual((bad.status, bad.attempts), (WebhookEvent.Status.PENDING, 2))
+        self.assertEqual(process_pending_events(max_attempts=3), {'processed': 0, 'ignored': 0, 'failed': 1})
+        bad.refresh_from_db()
+        self.assertEqual(bad.status, WebhookEvent.Status.FAILED)
+        self.assertEqual(process_pending_events(), {'processed': 0, 'ignored': 0})
+
+        self.assertEqual(requeue_failed_events(), 1)
+        bad.refresh_from_db()
+        self.assertEqual((bad.status, bad.attempts), (WebhookEvent.Status.PENDING, 0))
+
+
+class PlanRecomputeTests(TestCase):
+    """Feature changes on a plan are pushed to its subscribers in resumable chunks."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.free = SubscriptionPlan.objects.create(name='Free', plan_type=SubscriptionPlan.PlanType.FREE)
+        cls.premium = SubscriptionPlan.objects.create(name='Premium', plan_type=SubscriptionPlan.PlanType.INDIVIDUAL,
+                                                      price=9.99)
+        for n in range(6):
+            user = User.objects.create(username=f'recomputed{n}', email=f'recomputed{n}@example.com')
+            UserProfile.objects.create(user=user, subscription_plan=cls.free if n == 5 else cls.premium)
+
+    def change_features(self, **features):
+        plan = SubscriptionPlan.objects.get(pk=self.premium.pk)
+        plan.features = features
+        plan.save()
+        return PlanRecomputeJob.objects.get(plan=plan, status=PlanRecomputeJob.Status.PENDING)
+
+    def audio_quality(self):
+        return list(UserProfile.objects.filter(subscription_plan=self.premium).order_by('pk')
+                    .values_list('audio_quality', flat=True))
+
+    def test_enqueued_on_feature_or_plan_type_change_only(self):
+        plan = SubscriptionPlan.objects.get(pk=self.premium.pk)
+        plan.name = 'Premium Plus'
+        plan.save()
+        self.assertFalse(PlanRecomputeJob.objects.exists())
+
+        plan.features = {'audio_quality': 'lossless'}
+        plan.save()
+        plan.plan_type = SubscriptionPlan.PlanType.STUDENT
+        plan.save()
+        # A pending job reads the plan when it starts, so one covers both changes.
+        self.assertEqual(PlanRecomputeJob.objects.filter(plan=plan).count(), 1)
+
+    def test_chunked_run(self):
+        job = self.change_features(audio_quality='lossless')
+        seen = []
+        run_job(job, chunk_size=2, progress=lambda job: seen.append(job.processed))
+        self.assertEqual(seen, [2, 4, 5])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.total, job.processed), (PlanRecomputeJob.Status.DONE, 5, 5))
+        self.assertEqual(self.audio_quality(), ['lossless'] * 5)
+        self.assertNotEqual(UserProfile.objects.get(subscription_plan=self.free).audio_quality, 'lossless')
+
+    def test_resumes_after_last_profile(self):
+        job = self.change_features(audio_quality='lossless')
+        before = self.audio_quality()
+        pks = list(UserProfile.objects.filter(subscription_plan=self.premium).order_by('pk')
+                   .values_list('pk', flat=True))
+        # As left by a worker that crashed after its first chunk.
+        PlanRecomputeJob.objects.filter(pk=job.pk).update(
+            status=PlanRecomputeJob.Status.RUNNING, total=5, processed=2, last_profile_id=pks[1])
+
+        [job] = run_pending_jobs(chunk_size=2)
+        self.assertEqual((job.status, job.processed), (PlanRecomputeJob.Status.DONE, 5))
+        self.assertEqual(self.audio_quality(), before[:2] + ['lossless'] * 3)
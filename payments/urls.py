@@ -0,0 +1,6 @@
+from django.urls import path
+from payments.views import StripeWebhookView
+
+urlpatterns = [
+    path('payments/webhook', StripeWebhookView.as_view(), name='stripe-webhook'),
+]
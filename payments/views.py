@@ -1,15 +1,27 @@
 # payments/views.py
 from datetime import timezone
 
+import json
+import logging
+
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.views import APIView
 from django.conf import settings
-import stripe
-from .models import SubscriptionPlan
+from .models import SubscriptionPlan, WebhookEvent
 from .serializers import SubscriptionPlanSerializer, SubscribeSerializer
 
+logger = logging.getLogger(__name__)
+
+
+def stripe_sdk():
+    """The stripe SDK, imported when a payment view first needs it and configured with the secret key."""
+    import stripe
+    stripe.api_key = settings.STRIPE_SECRET_KEY
+    return stripe
+
 
 class SubscriptionViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
@@ -30,7 +42,7 @@ class SubscriptionViewSet(viewsets.ViewSet):
         user = request.user
         profile = user.profile
 
-        stripe.api_key = settings.STRIPE_SECRET_KEY
+        stripe = stripe_sdk()
 
         try:
             # Create or get Stripe customer
@@ -64,8 +76,8 @@ class SubscriptionViewSet(viewsets.ViewSet):
             profile.subscription_plan = plan
             profile.subscription_status = 'active'
             profile.subscription_start_date = timezone.now()
+            profile.apply_plan_features(plan)
             profile.save()
-            profile.update_subscription_features()
 
             return Response({
                 'subscription_id': subscription.id,
@@ -91,6 +103,7 @@ class SubscriptionViewSet(viewsets.ViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        stripe = stripe_sdk()
         try:
             # Cancel the subscription at period end
             stripe.Subscription.modify(
@@ -108,4 +121,42 @@ class SubscriptionViewSet(viewsets.ViewSet):
             return Response(
                 {'error': str(e)},
                 status=status.HTTP_400_BAD_REQUEST
-            )
\ No newline at end of file
+            )
+
+
+class StripeWebhookView(APIView):
+    """
+    Receives Stripe webhooks. Events are only verified and stored here;
+    the process_webhooks worker applies them in batches.
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        payload = request.body
+        secret = settings.DJSTRIPE_WEBHOOK_SECRET
+        if not secret:
+            # Without a secret nothing can be verified, so nothing is stored;
+            # Stripe keeps retrying until the endpoint is configured.
+            logger.error("Stripe webhook rejected: DJSTRIPE_WEBHOOK_SECRET is not set")
+            return Response({'error': 'Webhook secret not configured'}, status=status.HTTP_400_BAD_REQUEST)
+        stripe = stripe_sdk()
+        try:
+            stripe.WebhookSignature.verify_header(
+                payload, request.META.get('HTTP_STRIPE_SIGNATURE'), secret, tolerance=300
+            )
+        except stripe.error.SignatureVerificationError:
+            return Response({'error': 'Invalid signature'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            event = json.loads(payload)
+            event_id, event_type = event['id'], event['type']
+        except (ValueError, KeyError, TypeError):
+            return Response({'error': 'Invalid payload'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # A redelivered event id is dropped by the unique constraint.
+        WebhookEvent.objects.bulk_create(
+            [WebhookEvent(stripe_id=event_id, type=event_type, payload=event)],
+            ignore_conflicts=True
+        )
+        return Response({'received': True})
@@ -0,0 +1,196 @@
+import logging
+import uuid
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from payments.models import SubscriptionPlan, WebhookEvent
+from users.models import UserProfile
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIPTION_EVENTS = {
+    'customer.subscription.created',
+    'customer.subscription.updated',
+    'customer.subscription.deleted',
+}
+
+# Times an event is tried before it is marked failed.
+MAX_ATTEMPTS = 5
+
+PROFILE_FIELDS = [
+    'subscription_plan', 'subscription_status', 'subscription_start_date',
+    'subscription_end_date', 'cancel_at_period_end', 'trial_start', 'trial_end',
+    'subscription_event_at',
+] + UserProfile.SUBSCRIPTION_FEATURE_FIELDS
+
+
+def _timestamp(value):
+    """Stripe sends unix timestamps; the profile stores aware datetimes."""
+    if value is None:
+        return None
+    return datetime.fromtimestamp(value, tz=dt_timezone.utc)
+
+
+def _metadata_uuid(obj, key):
+    """UUID string from the object's metadata, or None if missing or malformed."""
+    try:
+        return str(uuid.UUID(obj.get('metadata', {}).get(key)))
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+def _latest_subscription_states(events):
+    """
+    Reduces a batch to the newest subscription object per customer:
+    {customer: (event created time, object)}. Subscription events carry the
+    full object, so only the last one matters.
+    """
+    latest = {}
+    for event in sorted(events, key=lambda e: e.payload.get('created', 0)):
+        obj = event.payload.get('data', {}).get('object', {})
+        customer = obj.get('customer')
+        if customer:
+            if event.type == 'customer.subscription.deleted':
+                obj = {**obj, 'status': 'canceled'}
+            latest[customer] = (_timestamp(event.payload.get('created')), obj)
+    return latest
+
+
+def _find_profiles(states):
+    """Loads every profile touched by the batch in one query."""
+    customer_ids = set(states)
+    user_ids = {_metadata_uuid(obj, 'user_id') for _, obj in states.values()} - {None}
+    profiles = UserProfile.objects.filter(
+        Q(stripe_customer__id__in=customer_ids) | Q(user_id__in=user_ids)
+    ).select_related('subscription_plan').annotate(customer_stripe_id=F('stripe_customer__id'))
+
+    by_customer = {}
+    by_user = {}
+    for profile in profiles:
+        if profile.customer_stripe_id:
+            by_customer[profile.customer_stripe_id] = profile
+        by_user[str(profile.user_id)] = profile
+
+    matched = {}
+    for customer, (_, obj) in states.items():
+        profile = by_customer.get(customer) or by_user.get(_metadata_uuid(obj, 'user_id'))
+        if profile:
+            matched[customer] = profile
+    return matched
+
+
+def _apply_state(profile, created, obj, plans, free_plan):
+    status = obj.get('status', profile.subscription_status)
+    plan = plans.get(_metadata_uuid(obj, 'plan_id'), profile.subscription_plan)
+    if status == 'canceled' and free_plan:
+        plan = free_plan
+
+    profile.subscription_status = status
+    profile.subscription_plan = plan
+    profile.subscription_start_date = _timestamp(obj.get('current_period_start'))
+    profile.subscription_end_date = _timestamp(obj.get('current_period_end'))
+    profile.cancel_at_period_end = obj.get('cancel_at_period_end', False)
+    profile.trial_start = _timestamp(obj.get('trial_start'))
+    profile.trial_end = _timestamp(obj.get('trial_end'))
+    profile.subscription_event_at = created
+    if plan:
+        profile.apply_plan_features(plan)
+
+
+def process_events(events):
+    """
+    Applies a batch of pending events and marks them done.
+    Stripe does not deliver events in order, so a profile's state is only
+    replaced by an event created no earlier than the one it was last set
+    from; older events are ignored. Returns a dict of event counts per
+    resulting status.
+    """
+    subscription_events = [e for e in events if e.type in SUBSCRIPTION_EVENTS]
+    states = _latest_subscription_states(subscription_events)
+    profiles = {
+        customer: profile for customer, profile in _find_profiles(states).items()
+        if not (profile.subscription_event_at and states[customer][0]
+                and states[customer][0] < profile.subscription_event_at)
+    }
+
+    plan_ids = {_metadata_uuid(obj, 'plan_id') for _, obj in states.values()} - {None}
+    plans = {str(pk): plan for pk, plan in SubscriptionPlan.objects.in_bulk(plan_ids).items()}
+    free_plan = SubscriptionPlan.objects.filter(plan_type=SubscriptionPlan.PlanType.FREE).first()
+
+    for customer, profile in profiles.items():
+        _apply_state(profile, *states[customer], plans, free_plan)
+    UserProfile.objects.bulk_update(profiles.values(), PROFILE_FIELDS)
+
+    processed, ignored = [], []
+    for event in events:
+        customer = event.payload.get('data', {}).get('object', {}).get('customer')
+        if event.type in SUBSCRIPTION_EVENTS and customer in profiles:
+            processed.append(event.pk)
+        else:
+            ignored.append(event.pk)
+
+    now = timezone.now()
+    WebhookEvent.objects.filter(pk__in=processed).update(
+        status=WebhookEvent.Status.PROCESSED, processed_at=now, attempts=F('attempts') + 1
+    )
+    WebhookEvent.objects.filter(pk__in=ignored).update(
+        status=WebhookEvent.Status.IGNORED, processed_at=now, attempts=F('attempts') + 1
+    )
+    return {'processed': len(processed), 'ignored': len(ignored)}
+
+
+def _process_isolated(events):
+    """
+    Applies events in a savepoint. When that fails the batch is halved until
+    each failing event is on its own, so one bad event does not hold back
+    the rest. Returns (counts, [(event, exception), ...]).
+    """
+    try:
+        with transaction.atomic():
+            return Counter(process_events(events)), []
+    except Exception as e:
+        if len(events) == 1:
+            logger.exception("Webhook event %s failed", events[0].stripe_id)
+            return Counter(), [(events[0], e)]
+    middle = len(events) // 2
+    counts, failures = _process_isolated(events[:middle])
+    more_counts, more_failures = _process_isolated(events[middle:])
+    return counts + more_counts, failures + more_failures
+
+
+def process_pending_events(batch_size=500, max_attempts=MAX_ATTEMPTS):
+    """
+    Processes the oldest pending events in one transaction.
+    Only pending rows are picked up, so an event id is applied at most once.
+    An event that fails stays pending until it has failed max_attempts
+    times, and is then marked failed (see requeue_failed_events).
+    """
+    with transaction.atomic():
+        events = list(
+            WebhookEvent.objects.select_for_update(skip_locked=True)
+            .filter(status=WebhookEvent.Status.PENDING)
+            .order_by('created_at')[:batch_size]
+        )
+        if not events:
+            return {'processed': 0, 'ignored': 0}
+        counts, failures = _process_isolated(events)
+        for event, error in failures:
+            attempts = event.attempts + 1
+            given_up = attempts >= max_attempts
+            WebhookEvent.objects.filter(pk=event.pk).update(
+                status=WebhookEvent.Status.FAILED if given_up else WebhookEvent.Status.PENDING,
+                error=str(error), attempts=attempts,
+            )
+            counts['failed' if given_up else 'retrying'] += 1
+        return {'processed': 0, 'ignored': 0, **counts}
+
+
+def requeue_failed_events():
+    """Puts failed events back in the queue with a fresh set of attempts. Returns how many."""
+    return WebhookEvent.objects.filter(status=WebhookEvent.Status.FAILED).update(
+        status=WebhookEvent.Status.PENDING, attempts=0
+    )
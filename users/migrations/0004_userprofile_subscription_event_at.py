@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_userprofile_cancel_at_period_end_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='subscription_event_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
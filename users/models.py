@@ -13,13 +13,6 @@ except (ImportError, AttributeError, RuntimeError):
 from users.base_model import UUIDModel
 from users.role_enum import RoleEnum
 
-try:
-    from djstripe.models import Customer as StripeCustomer
-    from djstripe.models import Subscription as StripeSubscription
-except (ImportError, AttributeError, RuntimeError):
-    StripeCustomer = None
-    StripeSubscription = None
-
 
 
 class User(AbstractUser):
@@ -72,6 +65,9 @@ class UserProfile(UUIDModel):
     cancel_at_period_end = models.BooleanField(default=False)
     trial_start = models.DateTimeField(null=True, blank=True)
     trial_end = models.DateTimeField(null=True, blank=True)
+    # Stripe 'created' time of the last subscription event applied; older
+    # events delivered late are skipped.
+    subscription_event_at = models.DateTimeField(null=True, blank=True)
     
     # Subscription related fields
     audio_quality = models.CharField(
@@ -129,9 +125,35 @@ class UserProfile(UUIDModel):
         related_name='duo_partner_of'
     )
 
+    # Fields written by apply_plan_features, for bulk_update callers.
+    SUBSCRIPTION_FEATURE_FIELDS = [
+        'audio_quality', 'is_offline_mode', 'ad_free', 'skip_limit', 'family_members_limit',
+    ]
+    # skip_limit is an integer column, so "unlimited" is stored as its max value.
+    UNLIMITED_SKIPS = 2147483647
+
     def __str__(self):
         return f"{self.user.username}'s profile"
-        
+
+    def apply_plan_features(self, plan):
+        """Set feature fields from a SubscriptionPlan in memory, without saving."""
+        features = plan.get_features()
+        self.audio_quality = features.get('audio_quality', 'medium')
+        self.is_offline_mode = features.get('offline_mode', False)
+        self.ad_free = features.get('ad_free', False)
+
+        skip_limit = features.get('skip_limit', 6)
+        if skip_limit is None or skip_limit == float('inf'):
+            skip_limit = self.UNLIMITED_SKIPS
+        self.skip_limit = skip_limit
+
+        if plan.plan_type == plan.PlanType.FAMILY:
+            self.family_members_limit = 5  # 1 owner + 5 members
+        elif plan.plan_type == plan.PlanType.DUO:
+            self.family_members_limit = 1  # 1 owner + 1 member
+        else:
+            self.family_members_limit = 0
+
     def update_subscription_features(self, plan_name):
         """Update user features based on their subscription plan."""
         if plan_name == 'free':
@@ -203,22 +225,5 @@ def update_subscription_features(self):
     if not self.subscription_plan or SubscriptionPlan is None:
         return
 
-    features = self.subscription_plan.get_features()
-
-    # Update user features based on subscription
-    self.audio_quality = features.get('audio_quality', 'medium')
-    self.is_offline_mode = features.get('offline_mode', False)
-    self.ad_free = features.get('ad_free', False)
-
-    # Update skip limit (None means unlimited)
-    self.skip_limit = features.get('skip_limit', 6) or float('inf')
-
-    # Update family/duo plan settings
-    if self.subscription_plan.plan_type == SubscriptionPlan.PlanType.FAMILY:
-        self.family_members_limit = 5  # 1 owner + 5 members
-    elif self.subscription_plan.plan_type == SubscriptionPlan.PlanType.DUO:
-        self.family_members_limit = 1  # 1 owner + 1 member
-    else:
-        self.family_members_limit = 0
-
-    self.save()
\ No newline at end of file
+    self.apply_plan_features(self.subscription_plan)
+    self.save()
@@ -1,3 +1,122 @@
+import uuid
+from datetime import date, timedelta
+from io import StringIO
+
+from django.core.management import call_command
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from music import stats
+from music.models import ArtistFollow, Song, SongStatDaily, SongStatHourly, StatRollup
+from music.utils import BATCH_MAX_IDS
+from users.models import User
+from users.role_enum import RoleEnum
+
+
+class ArtistAnalyticsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.artist = User.objects.create(username='charted', email='charted@example.com',
+                                         role=RoleEnum.ARTIST.value)
+        cls.token = Token.objects.create(user=cls.artist)
+        cls.songs = [
+            Song.objects.create(user=cls.artist, title=f'Hit {n}', duration=60,
+                                release_date=date(2024, 1, 1), audio_file='https://example.com/a.mp3')
+            for n in range(2)
+        ]
+
+    def setUp(self):
+        self.url = f'/api/artists/{self.artist.pk}/analytics/'
+        self.headers = {'authorization': f'Token {self.token.key}'}
+
+    def get(self, **params):
+        return self.client.get(self.url, params, headers=self.headers)
+
+    def test_hourly_artist_totals(self):
+        stats.record(self.songs[0], plays=2)
+        stats.record(self.songs[1], plays=1, likes=1)
+        stats.record_batch({(self.songs[1].pk, self.artist.pk): {'favorites': 1}})
+        total = SongStatHourly.objects.get(artist=self.artist, song=None)
+        self.assertEqual((total.plays, total.likes, total.favorites), (3, 1, 1))
+
+        today = timezone.localdate().isoformat()
+        response = self.get(start=today, end=today, granularity='hour')
+        self.assertEqual([(point['plays'], point['likes']) for point in response.json()['points']], [(3, 1)])
+
+    def test_rollup_counts_songs_once(self):
+        for song in self.songs:
+            stats.record(song, plays=1)
+        self.assertEqual(stats.rollup(timezone.localdate()), 3)
+        total = SongStatDaily.objects.get(artist=self.artist, song=None)
+        self.assertEqual(total.plays, 2)
+
+    def test_prune_waits_for_the_first_rollup(self):
+        SongStatHourly.objects.create(song=self.songs[0], artist=self.artist, plays=1,
+                                      hour=timezone.now() - timedelta(days=30))
+        self.assertEqual(stats.prune_hourly(), 0)
+        self.assertTrue(SongStatHourly.objects.exists())
+
+    def test_rollup_catches_up_from_the_watermark(self):
+        today = timezone.localdate()
+        StatRollup.objects.create(watermark=today - timedelta(days=20))
+        hour = timezone.now() - timedelta(days=18)
+        SongStatHourly.objects.create(song=self.songs[0], artist=self.artist, plays=4, hour=hour)
+        SongStatHourly.objects.create(artist=self.artist, plays=4, hour=hour)
+
+        call_command('rollup_stats', stdout=StringIO())
+        total = SongStatDaily.objects.get(artist=self.artist, song=None)
+        self.assertEqual((total.day, total.plays), (timezone.localdate(hour), 4))
+        self.assertEqual(stats.rollup_watermark(), today)
+        # Compacted, so past the retention window it could be pruned.
+        self.assertFalse(SongStatHourly.objects.exists())
+
+    def test_prune_keeps_hours_after_the_watermark(self):
+        today = timezone.localdate()
+        StatRollup.objects.create(watermark=today - timedelta(days=20))
+        for days in (25, 18):
+            SongStatHourly.objects.create(song=self.songs[0], artist=self.artist, plays=1,
+                                          hour=timezone.now() - timedelta(days=days))
+        self.assertEqual(stats.prune_hourly(), 1)
+        self.assertGreater(SongStatHourly.objects.get().hour, timezone.now() - timedelta(days=20))
+        with self.assertRaises(ValueError):
+            stats.rollup(today - timedelta(days=21))
+
+    def test_rollup_after_a_gap_keeps_the_watermark(self):
+        today = timezone.localdate()
+        StatRollup.objects.create(watermark=today - timedelta(days=10))
+        stats.rollup(today - timedelta(days=1))
+        self.assertEqual(stats.rollup_watermark(), today - timedelta(days=10))
+
+    def test_bad_song_id(self):
+        self.assertEqual(self.get(song='not-a-uuid').status_code, 400)
+        self.assertEqual(self.get(song=str(self.artist.pk)).status_code, 404)
+        self.assertEqual(self.get(song=str(self.songs[0].pk)).status_code, 200)
+
+
+class ArtistBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.artists = [User.objects.create(username=f'headliner{n}', email=f'headliner{n}@example.com',
+                                           role=RoleEnum.ARTIST.value) for n in range(2)]
+        cls.listener = User.objects.create(username='crowd', email='crowd@example.com')
+        cls.token = Token.objects.create(user=cls.listener)
+        ArtistFollow.objects.create(user=cls.listener, artist=cls.artists[1])
+
+    def batch(self, ids):
+        return self.client.get('/api/artists/batch/', {'ids': ','.join(str(i) for i in ids)},
+                               headers={'authorization': f'Token {self.token.key}'})
+
+    def test_requested_order_and_missing_ids(self):
+        response = self.batch([self.artists[1].pk, self.listener.pk, self.artists[0].pk])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(row['username'], row['follower_count'], row['is_following'])
+                          for row in response.json()['results']],
+                         [('headliner1', 1, True), ('headliner0', 0, False)])
+        # Listeners are not artists.
+        self.assertEqual(response.json()['missing'], [str(self.listener.pk)])
 
-# Create your tests here.
+    def test_bad_ids_are_rejected(self):
+        self.assertEqual(self.batch(['not-a-uuid']).status_code, 400)
+        self.assertEqual(self.batch([uuid.uuid4() for _ in range(BATCH_MAX_IDS + 1)]).status_code, 400)
+        self.assertEqual(self.client.get('/api/artists/batch/').status_code, 401)
@@ -11,6 +11,12 @@ from users.serializers import *
 from users.role_enum import RoleEnum
 from rest_framework.permissions import IsAuthenticated
 from music.models import ArtistFollow, Song, Album
+from music.throttling import RouteThrottle
+from music import stats
+from music.utils import parse_batch_ids, parse_uuid_param
+from music.renderers import RENDERERS, wants_stream, stream_response
+from datetime import date, timedelta
+from django.utils import timezone
 
 
 class UserViewSet(generics.ListCreateAPIView, generics.RetrieveUpdateDestroyAPIView):
@@ -92,6 +98,8 @@ class ArtistViewSet(viewsets.ViewSet):
     """ViewSet for artist-related operations"""
     permission_classes = [IsAuthenticated]
     authentication_classes = [TokenAuthentication]
+    throttle_classes = [RouteThrottle]
+    renderer_classes = RENDERERS
 
     @action(detail=False, methods=['get'])
     def list_artists(self, request):
@@ -153,6 +161,36 @@ class ArtistViewSet(viewsets.ViewSet):
             return Response({"error": "Not following this artist"}, 
                           status=status.HTTP_404_NOT_FOUND)
 
+    @action(detail=False, methods=['get'])
+    def batch(self, request):
+        """Get many artists by id in one call, in the requested order"""
+        ids, error = parse_batch_ids(request.query_params)
+        if error:
+            return Response({"error": error}, 
+                          status=status.HTTP_400_BAD_REQUEST)
+        
+        artists = User.objects.filter(role=RoleEnum.ARTIST.value).annotate(
+            song_count=Count('songs', distinct=True),
+            follower_count=Count('followers', distinct=True)
+        ).in_bulk(ids)
+        following = set(ArtistFollow.objects.filter(
+            user=request.user,
+            artist_id__in=artists
+        ).values_list('artist_id', flat=True))
+        
+        results = [{
+            'id': str(artist.id),
+            'username': artist.username,
+            'email': artist.email,
+            'song_count': artist.song_count,
+            'follower_count': artist.follower_count,
+            'is_following': artist.id in following
+        } for artist in (artists[i] for i in ids if i in artists)]
+        return Response({
+            "results": results,
+            "missing": [str(i) for i in ids if i not in artists],
+        })
+
     @action(detail=False, methods=['get'])
     def following(self, request):
         """Get artists the user is following"""
@@ -209,6 +247,61 @@ class ArtistViewSet(viewsets.ViewSet):
         
         return Response(profile_data)
 
+    @action(detail=True, methods=['get'])
+    def analytics(self, request, pk=None):
+        """Get plays/likes/favorites over time from pre-aggregated rollups"""
+        try:
+            artist = User.objects.get(id=pk, role=RoleEnum.ARTIST.value)
+        except User.DoesNotExist:
+            return Response({"error": "Artist not found"}, 
+                          status=status.HTTP_404_NOT_FOUND)
+        
+        if artist != request.user:
+            return Response({"error": "Only the artist can view their analytics"}, 
+                          status=status.HTTP_403_FORBIDDEN)
+        
+        today = timezone.localdate()
+        try:
+            end = date.fromisoformat(request.query_params.get('end', today.isoformat()))
+            start = date.fromisoformat(
+                request.query_params.get('start', (end - timedelta(days=29)).isoformat())
+            )
+        except ValueError:
+            return Response({"error": "start and end must be YYYY-MM-DD dates"}, 
+                          status=status.HTTP_400_BAD_REQUEST)
+        if start > end:
+            return Response({"error": "start must not be after end"}, 
+                          status=status.HTTP_400_BAD_REQUEST)
+        
+        granularity = request.query_params.get('granularity')
+        if granularity not in (None, 'hour', 'day', 'month'):
+            return Response({"error": "granularity must be hour, day or month"}, 
+                          status=status.HTTP_400_BAD_REQUEST)
+        days = (end - start).days + 1
+        if granularity == 'hour' and days * 24 > stats.MAX_POINTS \
+                or granularity == 'day' and days > stats.MAX_POINTS:
+            return Response({"error": "Range too large for this granularity"}, 
+                          status=status.HTTP_400_BAD_REQUEST)
+        
+        song = None
+        song_id, error = parse_uuid_param(request.query_params, 'song')
+        if error:
+            return Response({"error": error}, 
+                          status=status.HTTP_400_BAD_REQUEST)
+        if song_id:
+            song = Song.objects.filter(id=song_id, user=artist).first()
+            if song is None:
+                return Response({"error": "Song not found"}, 
+                              status=status.HTTP_404_NOT_FOUND)
+        
+        granularity, points = stats.chart(artist, start, end, song=song, granularity=granularity)
+        return Response({
+            'granularity': granularity,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'points': points,
+        })
+
     @action(detail=True, methods=['get'])
     def songs(self, request, pk=None):
         """Get all songs by an artist"""
@@ -219,6 +312,8 @@ class ArtistViewSet(viewsets.ViewSet):
                           status=status.HTTP_404_NOT_FOUND)
         
         from music.serializers import SongSerializer
-        songs = artist.songs.filter(visibility=1)  # Public songs only
+        songs = artist.songs.filter(visibility=1).select_related('user', 'album', 'genre')  # Public songs only
+        if wants_stream(request):
+            return stream_response(request, songs, lambda chunk: SongSerializer(chunk, many=True).data)
         serializer = SongSerializer(songs, many=True)
         return Response(serializer.data)
\ No newline at end of file